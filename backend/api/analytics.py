@@ -1,10 +1,10 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 from typing import List, Optional
-import pandas as pd
+import hashlib
+import json
 import numpy as np
-from sklearn.linear_model import LinearRegression
-from core import db, notifications
+from core import db, forecast, notifications, palm_trends, retention, task_rules
 
 router = APIRouter()
 
@@ -29,6 +29,7 @@ class SurveySummary(BaseModel):
     date: str
     count: int
     health: float
+    issues: Optional[int] = None # palms below 50% health (None when the survey's rows are gone)
 
 class PalmDetail(BaseModel):
     id: int
@@ -37,6 +38,35 @@ class PalmDetail(BaseModel):
     lon: float
     status: str
     health_history: List[dict] # [{date, score}, ...]
+    archived_history: Optional[dict] = None # summary of surveys compacted by retention
+
+class PalmLocation(BaseModel):
+    id: int
+    custom_name: Optional[str]
+    lat: float
+    lon: float
+    health: Optional[float]
+    status: Optional[str]
+    distance: Optional[float] = None # only set by radius queries
+
+class AtRiskPalm(PalmLocation):
+    samples: int # surveys in the trend window that detected the palm
+    slope_per_day: float
+    fitted_health: float # trend line at the latest survey
+    days_to_threshold: float # 0 once the fitted health is below the threshold
+
+class Sector(BaseModel):
+    name: str
+    min_lat: float
+    min_lon: float
+    max_lat: float
+    max_lon: float
+
+class SectorStats(Sector):
+    id: int
+    palms: int = 0
+    avg_health: float = 0.0
+    infected: int = 0
 
 class FinanceConfig(BaseModel):
     oil_price: float
@@ -60,18 +90,19 @@ class TaskCreate(BaseModel):
 @router.get("/reports/history", response_model=List[SurveySummary])
 def get_reports_history():
     surveys = db.get_survey_history()
+    counts = db.get_survey_issue_counts(issue_below=50.0)
     return [SurveySummary(
         id=s['id'], 
         date=s['date'], 
         count=s['count'], 
-        health=s['health']
+        health=s['health'],
+        issues=counts[s['id']][1] if s['id'] in counts else None
     ) for s in surveys]
 
 @router.get("/palm/{palm_id}", response_model=PalmDetail)
 def get_palm_detail(palm_id: int):
-    conn = db.get_connection()
-    c = conn.cursor()
-    try:
+    with db.connection() as conn:
+        c = conn.cursor()
         # Get Palm Info
         c.execute("SELECT id, custom_name, lat, lon, status FROM tracked_palms WHERE id = ?", (palm_id,))
         row = c.fetchone()
@@ -88,16 +119,158 @@ def get_palm_detail(palm_id: int):
         """, (palm_id,))
         history = [{"date": r[0], "score": r[1]} for r in c.fetchall()]
         
+        # Surveys older than the retention window only survive as a summary row
+        c.execute("""
+            SELECT samples, health_sum, health_sq_sum, yield_sum, first_scan_date, last_scan_date
+            FROM palm_history_summary WHERE tracked_palm_id = ?
+        """, (palm_id,))
+        summary = c.fetchone()
+        archived = None
+        if summary and summary[0]:
+            mean = summary[1] / summary[0]
+            archived = {
+                "samples": summary[0],
+                "avg_health": round(mean, 2),
+                "std_health": round(max(0.0, summary[2] / summary[0] - mean * mean) ** 0.5, 2),
+                "total_yield": summary[3],
+                "from": summary[4],
+                "to": summary[5]
+            }
+        
         return PalmDetail(
             id=row[0],
             custom_name=row[1],
             lat=row[2],
             lon=row[3],
             status=row[6] if len(row) > 6 else 'Unknown', # Handle case if logic changes
-            health_history=history
+            health_history=history,
+            archived_history=archived
         )
-    finally:
-        conn.close()
+
+@router.get("/palms/bbox", response_model=List[PalmLocation])
+def get_palms_in_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                      limit: int = Query(db.SPATIAL_QUERY_LIMIT, ge=1, le=db.SPATIAL_QUERY_LIMIT)):
+    """Tracked palms inside a viewport / sector box, answered from the R*Tree."""
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="min_lat/min_lon must not exceed max_lat/max_lon")
+    return db.get_palms_in_bbox(min_lat, min_lon, max_lat, max_lon, limit=limit)
+
+@router.get("/palms/near", response_model=List[PalmLocation])
+def get_palms_near(lat: float, lon: float, radius: float = Query(..., gt=0),
+                   limit: int = Query(db.SPATIAL_QUERY_LIMIT, ge=1, le=db.SPATIAL_QUERY_LIMIT)):
+    """Tracked palms within `radius` of a point, nearest first."""
+    return db.get_palms_near(lat, lon, radius, limit=limit)
+
+@router.get("/palm/{palm_id}/neighbors", response_model=List[PalmLocation])
+def get_palm_neighbors(palm_id: int, radius: float = Query(..., gt=0),
+                       limit: int = Query(db.SPATIAL_QUERY_LIMIT, ge=1, le=db.SPATIAL_QUERY_LIMIT)):
+    """Palms around a given tracked palm (e.g. spread risk around an infected tree)."""
+    location = db.get_palm_location(palm_id)
+    if location is None:
+        raise HTTPException(status_code=404, detail="Palm not found")
+    return db.get_palms_near(location[0], location[1], radius, limit=limit, exclude_id=palm_id)
+
+@router.get("/retention/status")
+def get_retention_status():
+    """Retention window, archived / due surveys and database size."""
+    return {**retention.status(), "worker": retention.worker.stats()}
+
+@router.post("/retention/run")
+def run_retention():
+    """Wakes the background compaction worker (runs asynchronously)."""
+    if retention.HISTORY_RETENTION_DAYS <= 0:
+        raise HTTPException(status_code=400, detail="History retention is disabled (HISTORY_RETENTION_DAYS=0)")
+    retention.worker.trigger()
+    return {"status": "triggered"}
+
+@router.post("/retention/restore/{survey_id}")
+def restore_archived_survey(survey_id: int):
+    """Puts a compacted survey's palm history back from its archive file."""
+    restored = retention.restore_survey(survey_id)
+    if restored is None:
+        raise HTTPException(status_code=404, detail="Survey is not archived")
+    return {"status": "restored", "survey_id": survey_id, "rows": restored}
+
+@router.get("/palms/at-risk", response_model=List[AtRiskPalm])
+def get_at_risk_palms(k: int = Query(100, ge=1, le=db.SPATIAL_QUERY_LIMIT),
+                      by: str = Query("decline", description="decline | time_to_threshold"),
+                      threshold: float = Query(palm_trends.INFECTION_THRESHOLD, description="Health level to project the crossing of"),
+                      min_samples: int = Query(palm_trends.TREND_MIN_SAMPLES, ge=2)):
+    """
+    Palms whose health trend over the last TREND_WINDOW_SURVEYS surveys falls fastest,
+    or that will cross `threshold` soonest. Every palm is fitted in one vectorized
+    pass over a palm x survey matrix that is cached until the next survey.
+    """
+    if by not in palm_trends.RANKINGS:
+        raise HTTPException(status_code=400, detail=f"by must be one of {', '.join(palm_trends.RANKINGS)}")
+    ranked = palm_trends.at_risk(k=k, by=by, threshold=threshold, min_samples=min_samples)
+    palms = db.get_palms_by_ids([r[0] for r in ranked])
+    return [
+        AtRiskPalm(**palms[palm_id], samples=samples, slope_per_day=round(slope, 4),
+                   fitted_health=round(fitted, 2), days_to_threshold=round(days, 1))
+        for palm_id, samples, slope, fitted, days in ranked
+        if palm_id in palms and palms[palm_id]["lat"] is not None
+    ]
+
+@router.get("/palms/history")
+def get_palms_history(request: Request,
+                      ids: Optional[List[int]] = Query(None, description="Palm ids (repeat the parameter)"),
+                      status: Optional[str] = None,
+                      min_health: Optional[float] = None, max_health: Optional[float] = None,
+                      min_survey: Optional[int] = None, max_survey: Optional[int] = None,
+                      after: int = Query(0, ge=0, description="Keyset cursor: next_after of the previous page"),
+                      limit: int = Query(500, ge=1, le=db.SPATIAL_QUERY_LIMIT),
+                      fields: Optional[str] = Query(None, description="Comma-separated palm and history fields (default: all)")):
+    """
+    Many palms and their histories in one call, as columns. history rows of the i-th
+    palm are history[field][offsets[i]:offsets[i + 1]]. Pages are keyset-paginated on
+    palm id; responses carry an ETag of the farm's data version, so re-polling an
+    unchanged page with If-None-Match returns 304 without touching palm_history.
+    """
+    palm_fields, history_fields = db.PALM_FIELDS, db.HISTORY_FIELDS
+    if fields:
+        wanted = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = set(wanted) - set(db.PALM_FIELDS) - set(db.HISTORY_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))} "
+                                                        f"(expected {', '.join(db.PALM_FIELDS + db.HISTORY_FIELDS)})")
+        palm_fields = tuple(f for f in db.PALM_FIELDS if f in wanted)
+        history_fields = tuple(f for f in db.HISTORY_FIELDS if f in wanted)
+
+    version = db.data_version_key()
+    digest = hashlib.sha1(repr((version, sorted(request.query_params.multi_items()))).encode()).hexdigest()
+    etag = f'W/"{digest[:20]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    palms, history, offsets, next_after = db.get_palm_histories(
+        ids, status, min_health, max_health, min_survey, max_survey, after, limit, palm_fields, history_fields)
+    body = {
+        "palms": palms,
+        "history": history,
+        "offsets": offsets,
+        "next_after": next_after,
+        "data_version": list(version),
+    }
+    return Response(content=json.dumps(body, separators=(",", ":")), media_type="application/json", headers=headers)
+
+@router.get("/sectors", response_model=List[SectorStats])
+def get_sectors():
+    """Sectors of the farm with live palm counts and health (spatial index lookups)."""
+    return db.get_sector_stats()
+
+@router.put("/sectors")
+def save_sector(sector: Sector):
+    if sector.min_lat > sector.max_lat or sector.min_lon > sector.max_lon:
+        raise HTTPException(status_code=400, detail="min_lat/min_lon must not exceed max_lat/max_lon")
+    return db.save_sector(sector.name, sector.min_lat, sector.min_lon, sector.max_lat, sector.max_lon)
+
+@router.delete("/sectors/{name}")
+def delete_sector(name: str):
+    if not db.delete_sector(name):
+        raise HTTPException(status_code=404, detail="Sector not found")
+    return {"status": "deleted", "name": name}
 
 @router.get("/finance/roi", response_model=FinanceResponse)
 def get_finance_roi():
@@ -126,196 +299,72 @@ def get_finance_roi():
 
 @router.post("/finance/config")
 def update_finance_config(config: FinanceConfig):
-    conn = db.get_connection()
-    c = conn.cursor()
-    try:
+    with db.connection() as conn:
+        c = conn.cursor()
         c.execute("INSERT OR REPLACE INTO financial_config (key, value, updated_at) VALUES (?, ?, ?)",
                   ('oil_price_per_ton', config.oil_price, "now"))
         c.execute("INSERT OR REPLACE INTO financial_config (key, value, updated_at) VALUES (?, ?, ?)",
                   ('fertilizer_cost_per_kg', config.fertilizer_cost, "now"))
         c.execute("INSERT OR REPLACE INTO financial_config (key, value, updated_at) VALUES (?, ?, ?)",
                   ('labor_cost_per_hour', config.labor_cost, "now"))
-        conn.commit()
         return {"status": "updated"}
-    finally:
-        conn.close()
 
 @router.post("/tasks/dispatch")
 def create_task(task: TaskCreate):
-    conn = db.get_connection()
-    c = conn.cursor()
-    try:
+    with db.connection() as conn:
+        c = conn.cursor()
         c.execute("INSERT INTO tasks (task_type, target_palm_id, priority, status, created_at) VALUES (?, ?, ?, ?, ?)",
                   (task.task_type, task.target_palm_id, task.priority, 'Pending', "now"))
-        conn.commit()
+        task_id = c.lastrowid
         
-        # Notify
-        notifications.send_telegram_alert(f"👷 New Task Dispatched: {task.task_type} for Palm #{task.target_palm_id}")
-        
-        return {"status": "created", "id": c.lastrowid}
-    finally:
-        conn.close()
+    # Notify (after the task is committed)
+    notifications.enqueue_alert(f"👷 New Task Dispatched: {task.task_type} for Palm #{task.target_palm_id}")
+    
+    return {"status": "created", "id": task_id}
+
+@router.get("/tasks/rules")
+def get_task_rules():
+    """Auto-task rules applied to the palms each survey touches (TASK_RULES / TASK_RULES_PATH)."""
+    return {"rules": [rule.to_dict() for rule in task_rules.RULES]}
 
 # --- Existing Endpoints (Preserved) ---
 
 @router.get("/forecast", response_model=ForecastResponse)
-def get_forecast(months: int = 6):
+def get_forecast(months: int = Query(6, ge=1, le=120),
+                 method: str = Query("linear", description="linear | seasonal | holt")):
     # Wrap in try-except to prevent 500 crash
     try:
-        df = db.get_all_surveys_df()
-        
+        if method not in forecast.METHODS:
+            raise HTTPException(status_code=400, detail=f"method must be one of {', '.join(forecast.METHODS)}")
+
+        # Running sums kept up to date by every saved survey: one row read, no refit
+        state = db.get_forecast_state()
+        result = forecast.predict(state, months, method)
+
         # Check data sufficiency
-        if len(df) < 2:
+        if result is None:
             # Fallback: If only 1 scan exists, project a "Stable" trend (Flat Line)
             # This ensures charts are never empty for new users.
-            latest = df.iloc[-1] if not df.empty else None
-            base_health = float(latest['avg_health']) if latest is not None else 50.0
-            
-            future_dates = []
-            last_date = pd.to_datetime(latest['scan_date']) if latest is not None else pd.Timestamp.now()
-            
-            for i in range(1, months + 1):
-                next_d = last_date + pd.Timedelta(days=30 * i)
-                future_dates.append(next_d.strftime("%Y-%m-%d"))
-            
-            # Yield calc for fallback
-            current_count = df['total_palms'].iloc[-1] if not df.empty else 0
-            yield_val = (current_count * (base_health / 100.0) * 80) / 1000.0
-            
-            return ForecastResponse(
-                dates=future_dates,
-                health_values=[base_health] * months,
-                yield_values=[round(yield_val, 2)] * months,
-                trend="Stable (Insufficient Data)",
-                message="Projecting current status"
-            )
-
-        # Robust Date Parsing
-        try:
-            # Ensure string format and truncate time component (YYYY-MM-DD)
-            df['scan_date'] = df['scan_date'].astype(str).str[:10]
-            df['scan_date'] = pd.to_datetime(df['scan_date'], errors='coerce')
-        except Exception as e:
-            print(f"Date Parsing Warning: {e}")
-            pass
-            
-# --- NEW ENTERPRISE ENDPOINTS (v3.0) ---
-
-@router.get("/reports/history")
-def get_reports_history():
-    """Fetch all historical scans for the Reports Table."""
-    try:
-        df = db.get_all_surveys_df()
-        if df.empty:
-            return []
-        
-        # Format for frontend table
-        # We aggregate by Scan Date
-        history = []
-        for date, group in df.groupby('scan_date'):
-            history.append({
-                "id": str(date)[:10], # Use date as ID for simplicity or generate UUID
-                "date": str(date)[:10],
-                "sector": "Sector A (Main)", # Placeholder until multi-sector
-                "palms_scanned": int(len(group)),
-                "issues_found": int(group[group['health_score'] < 50].shape[0]),
-                "status": "Verified"
-            })
-        return history
-    except Exception as e:
-        print(f"History Error: {e}")
-        return []
-
-@router.get("/finance/roi")
-def get_roi_metrics():
-    """Calculate Real-Time Financial ROI."""
-    try:
-        df = db.get_all_surveys_df()
-        # Mocking config for now, in future fetch from DB
-        oil_price_per_ton = 950.0  # $
-        cost_per_palm = 12.0       # $
-        
-        total_palms = len(df)
-        if total_palms == 0:
-            return {"revenue": 0, "expenses": 0, "profit": 0, "roi": 0}
-            
-        avg_health = df['avg_health'].mean() if not df.empty else 0
-        est_tonnage = (total_palms * (avg_health/100) * 0.150) # 150kg per healthy tree
-        
-        revenue = est_tonnage * oil_price_per_ton
-        expenses = total_palms * cost_per_palm
-        profit = revenue - expenses
-        roi = (profit / expenses) * 100 if expenses > 0 else 0
-        
-        return {
-            "revenue": round(revenue, 2),
-            "expenses": round(expenses, 2),
-            "profit": round(profit, 2),
-            "roi": round(roi, 1),
-            "est_yield": round(est_tonnage, 2)
-        }
-    except Exception as e:
-        print(f"ROI Error: {e}")
-        return {"revenue": 0, "expenses": 0, "profit": 0, "roi": 0}
+            result = forecast.flat(state, months)
+            trend, message = "Stable (Insufficient Data)", "Projecting current status"
+        else:
+            trend, message = forecast.trend_label(result["slope"]), "Success"
 
-@router.post("/tasks/dispatch")
-def dispatch_task(task: TaskCreate):
-    """Auto-Dispatch Logic"""
-    conn = db.get_db_connection()
-    try:
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO tasks (palm_id, task_type, priority, status, assigned_to, due_date)
-            VALUES (?, ?, ?, 'Pending', 'Auto-Bot', DATE('now', '+3 days'))
-        """, (task.target_palm_id, task.task_type, task.priority))
-        conn.commit()
-        return {"status": "dispatched", "task_id": c.lastrowid}
-    finally:
-        conn.close()        
-        if df.empty:
-             return ForecastResponse(dates=[], health_values=[], yield_values=[], trend="Date Error", message="Invalid Dates")
-
-        df['ordinal'] = df['scan_date'].map(pd.Timestamp.toordinal)
-        
-        X = df[['ordinal']].values
-        y = df['avg_health'].values
-        
-        model = LinearRegression()
-        model.fit(X, y)
-        
-        last_date = pd.to_datetime(df['scan_date'].max())
-        future_dates = []
-        future_ordinals = []
-        
-        for i in range(1, months + 1):
-            next_d = last_date + pd.Timedelta(days=30 * i)
-            future_dates.append(next_d.strftime("%Y-%m-%d"))
-            future_ordinals.append([next_d.toordinal()])
-            
-        pred_health = model.predict(future_ordinals)
-        
         # Yield Logic (simplified)
         # Using last known total palms count
-        current_count = df['total_palms'].iloc[-1] if not df.empty else 0
-        yield_vals = []
-        
-        for h in pred_health:
-            h_clamped = max(0, min(100, float(h)))
-            y_tons = (current_count * (h_clamped / 100.0) * 80) / 1000.0
-            yield_vals.append(round(y_tons, 2))
-
-        slope = model.coef_[0]
-        trend = "Stable"
-        if slope > 0.05: trend = "Improving"
-        elif slope < -0.05: trend = "Declining"
-        
+        current_count = state["last_total_palms"] or 0
+        health = result["health"]
+        yield_vals = np.round(current_count * (np.clip(health, 0, 100) / 100.0) * 80 / 1000.0, 2)
+
         return ForecastResponse(
-            dates=future_dates,
-            health_values=[round(float(h), 1) for h in pred_health],
-            yield_values=yield_vals,
+            dates=result["dates"],
+            health_values=np.round(health, 1).tolist(),
+            yield_values=yield_vals.tolist(),
             trend=trend,
-            message="Success"
+            message=message
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Forecast Error: {e}")
         return ForecastResponse(
@@ -326,31 +375,16 @@ def dispatch_task(task: TaskCreate):
 
 @router.get("/stats", response_model=StatsResponse)
 def get_real_stats():
-    # Get latest aggregate for scan date
-    df_surveys = db.get_all_surveys_df()
-    if df_surveys.empty:
+    # Latest survey + its write-time aggregate row (no palm_history scan)
+    latest_scan = db.get_latest_survey_stats()
+    if latest_scan is None:
         return StatsResponse(
             total_palms=0, infected_palms=0, avg_health=0.0, yield_est=0.0, last_scan="No Data"
         )
-    latest_scan = df_surveys.iloc[-1]
     
-    # Get detailed palm data for latest scan to count infected
-    df_palms = db.get_latest_palms_df()
-    infected_count = 0
-    total_palms = 0
-    
-    if not df_palms.empty:
-        total_palms = len(df_palms)
-        scores = df_palms['health_score'].values
-        if len(scores) > 0:
-            mean_h = np.mean(scores)
-            std_h = np.std(scores)
-            thresh = mean_h - (0.5 * std_h)
-            infected_count = np.sum(scores < thresh)
-            
-            # TRIGGER ALERT
-            if infected_count > 0:
-                pass 
+    # Infected = health below mean - 0.5 * std of the scan, counted when the scan was saved
+    total_palms = latest_scan['palm_count'] or 0
+    infected_count = latest_scan['infected_count'] or 0
             
     # Yield Logic
     h_factor = max(0, min(100, float(latest_scan['avg_health']))) / 100.0
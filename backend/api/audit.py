@@ -4,7 +4,7 @@ from fastapi.responses import FileResponse
 from pydantic import BaseModel
 import os
 from datetime import datetime
-from core.db import get_latest_palms_df
+from core.db import get_latest_palms_df, sector_label
 import pandas as pd
 
 try:
@@ -58,7 +58,7 @@ def generate_compliance_report(request: ReportRequest):
         # Meta Info
         elements.append(Paragraph(f"<b>Date:</b> {timestamp}", styles['Normal']))
         elements.append(Paragraph(f"<b>Inspector:</b> {request.inspector_name}", styles['Normal']))
-        elements.append(Paragraph(f"<b>Location:</b> Sector A (GPS Referenced)", styles['Normal']))
+        elements.append(Paragraph(f"<b>Location:</b> {sector_label()} (GPS Referenced)", styles['Normal']))
         elements.append(Spacer(1, 12))
 
         # Summary Table
@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Header, HTTPException, Query
+from pydantic import BaseModel
+from typing import List, Optional
+from core import db
+
+router = APIRouter()
+
+async def farm_scope(
+    farm_id: Optional[str] = Query(None, description="Farm to operate on (default: the main farm)"),
+    x_farm_id: Optional[str] = Header(None),
+):
+    """
+    Routes the request to one farm's shard: every core.db call made while serving it
+    (including worker threads and the farm's DB writer) uses that farm's database.
+    Async on purpose, so the context variable is set in the request's own task.
+    """
+    farm_id = farm_id or x_farm_id or db.DEFAULT_FARM
+    if not db.farm_exists(farm_id):
+        raise HTTPException(status_code=404, detail=f"Unknown farm '{farm_id}'")
+    db.current_farm.set(farm_id)
+    return farm_id
+
+# --- Data Models ---
+
+class FarmCreate(BaseModel):
+    farm_id: str
+
+class FarmSummary(BaseModel):
+    farm_id: str
+    survey_id: Optional[int] = None
+    scan_date: Optional[str] = None
+    palms: int
+    health_mean: float
+    infected: int
+    yield_sum: float
+
+class FarmRollup(BaseModel):
+    farms: List[FarmSummary]
+    palms: int
+    health_mean: float
+    health_std: float
+    infected: int
+    yield_sum: float
+
+# --- Endpoints ---
+
+@router.get("")
+def list_farms():
+    return {"default": db.DEFAULT_FARM, "farms": db.list_farms()}
+
+@router.post("")
+def create_farm(farm: FarmCreate):
+    existed = db.farm_exists(farm.farm_id)
+    try:
+        db.create_farm(farm.farm_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "exists" if existed else "created", "farm_id": farm.farm_id}
+
+@router.get("/rollup", response_model=FarmRollup)
+def get_farm_rollup():
+    """Cross-farm totals from every shard's latest survey aggregate."""
+    return db.get_farm_rollup()
@@ -1,15 +1,22 @@
 import torch
 import cv2
 import numpy as np
-import segmentation_models_pytorch as smp
-import albumentations as A
-from albumentations.pytorch import ToTensorV2
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Response
 from pydantic import BaseModel
+from typing import List, Optional, Union
+import asyncio
 import os
+import threading
+from contextlib import contextmanager
+import shutil
+import tempfile
 import pandas as pd
 import base64
-from core import db, notifications
+from core import async_db, db, notifications
+from core import tiling, model_backends, scoring, formats, preprocess
+from core.batching import MicroBatcher
+from core.worker_pool import InferencePool, PoolSaturated
+from core.result_cache import ResultCache, content_key, RESULT_CACHE_SKIP_DUPLICATES
 
 router = APIRouter()
 
@@ -21,31 +28,47 @@ DEFAULT_MODEL_PATH = os.path.join(BASE_DIR, "data", "best_model.pth")
 MODEL_PATH = os.getenv("MODEL_PATH", DEFAULT_MODEL_PATH)
 DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
 IMG_SIZE = 512
+# Torch intra-op threads (0 = split the CPU cores evenly across inference workers)
+TORCH_THREADS = int(os.getenv("INFER_TORCH_THREADS", "0"))
+
+# Runtime: eager | torchscript | onnx (artifacts built by export_model.py)
+INFER_BACKEND = os.getenv("INFER_BACKEND", "eager").lower()
+# INT8 variant of the artifact: none | dynamic | static (ONNX backend only)
+INFER_QUANT = os.getenv("INFER_QUANT", "none").lower()
+# Largest /predict/batch upload; batches are scanned in chunks of at most INFER_QUEUE_LIMIT frames
+INFER_BATCH_MAX_FILES = int(os.getenv("INFER_BATCH_MAX_FILES", "1000"))
 
 # Global model cache
 model_instance = None
+model_version = None
+_model_lock = threading.Lock()
+
+def current_model_version():
+    return model_backends.model_version(MODEL_PATH, INFER_BACKEND, INFER_QUANT)
 
 def get_model():
-    global model_instance
-    if model_instance is None:
-        if not os.path.exists(MODEL_PATH):
-            raise FileNotFoundError(f"Model file not found at {MODEL_PATH}")
+    global model_instance, model_version
+    version = current_model_version()
+    # (Re)load on first use and whenever the model file is replaced
+    if model_instance is None or version != model_version:
+        with _model_lock:
+            if model_instance is not None and version == model_version:
+                return model_instance
+            if not os.path.exists(MODEL_PATH):
+                raise FileNotFoundError(f"Model file not found at {MODEL_PATH}")
             
-        model = smp.Unet(encoder_name="efficientnet-b3", in_channels=4, classes=1, encoder_weights=None)
-        
-        # Load logic
-        try:
-            state_dict = torch.load(MODEL_PATH, map_location=DEVICE)
-            model.load_state_dict(state_dict)
-        except Exception as e:
-            # Try to handle the split parts if main file is missing or corrupted?
-            # Assuming main file is good as per previous steps.
-            print(f"Error loading model: {e}")
-            raise e
+            # Load logic
+            try:
+                model = model_backends.load_backend(
+                    MODEL_PATH, INFER_BACKEND, INFER_QUANT, device=DEVICE, threads=_worker_threads()
+                )
+            except Exception as e:
+                print(f"Error loading model ({INFER_BACKEND}/{INFER_QUANT}): {e}")
+                raise e
             
-        model.to(DEVICE)
-        model.eval()
-        model_instance = model
+            print(f"Model loaded: {version} device={DEVICE}")
+            model_instance = model
+            model_version = version
     return model_instance
 
 class SegmentationResponse(BaseModel):
@@ -55,45 +78,59 @@ class SegmentationResponse(BaseModel):
     processed_image_base64: str
     mask_base64: str
 
-@router.post("/predict", response_model=SegmentationResponse)
-async def predict_segmentation(file: UploadFile = File(...)):
+class CompactSegmentationResponse(BaseModel):
+    """Returned when `fields=` is given; only the requested parts are present."""
+    palm_count: int
+    infected_count: int
+    avg_health: float
+    detections: Optional[List[list]] = None # [x, y, radius, exg, infected]
+    mask_format: Optional[str] = None
+    mask: Optional[Union[str, dict, List[List[int]]]] = None # png base64 | rle | polygons
+    image_base64: Optional[str] = None
+
+class BatchSegmentationResponse(BaseModel):
+    count: int
+    results: List[Union[SegmentationResponse, CompactSegmentationResponse]]
+
+class TiledSegmentationResponse(BaseModel):
+    palm_count: int
+    infected_count: int
+    avg_health: float
+    width: int
+    height: int
+    tiles: int
+    survey_id: Optional[int]
+    mask_preview_base64: str
+
+# Selectable response parts (`fields=`) and mask encodings (`mask_format=`)
+FIELDS = ("counts", "detections", "mask", "image")
+MASK_FORMATS = ("png", "rle", "polygons")
+# Raw formats picked through the Accept header
+BINARY_TYPES = ("multipart/mixed", "image/jpeg", "image/png")
+
+# --- Pipeline Stages ---
+
+def decode_image(contents):
+    # Large JPEGs are decoded at reduced scale; we only ever need IMG_SIZE
+    return preprocess.decode_image(contents, IMG_SIZE)
+
+def preprocess_image(image):
+    """BGR image -> IMG_SIZE RGB uint8 image (used for scoring/annotation and as model input)."""
+    return preprocess.resize_rgb(image, IMG_SIZE)
+
+def run_model_batch(images):
+    """Runs the U-Net once over a list of RGB uint8 images; returns one probability mask per input."""
     model = get_model()
+    # Normalized into a reusable NCHW buffer (zero alpha channel included), no per-image tensors
+    input_tensor = torch.from_numpy(preprocess.normalize_batch(images)).to(DEVICE)
     
-    # Read Image
-    contents = await file.read()
-    nparr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    
-    if image is None:
-        raise HTTPException(status_code=400, detail="Invalid image file")
-        
-    # Preprocess
-    original_h, original_w = image.shape[:2]
-    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    image_resized = cv2.resize(image_rgb, (IMG_SIZE, IMG_SIZE))
-    
-    # Alpha channel matching training
-    alpha = np.zeros((IMG_SIZE, IMG_SIZE), dtype=np.uint8)
-    input_img = cv2.merge((image_resized, alpha))
-    
-    transform = A.Compose([
-        A.Normalize(mean=(0.485, 0.456, 0.406, 0.5), std=(0.229, 0.224, 0.225, 0.5), max_pixel_value=255.0),
-        ToTensorV2()
-    ])
-    
-    input_tensor = transform(image=input_img)['image'].unsqueeze(0).to(DEVICE)
-    
-    # Inference
     with torch.no_grad():
         logits = model(input_tensor)
-        pr_mask = logits.sigmoid().squeeze().cpu().numpy()
-        
-    # Post-process
-    mask_resized = (pr_mask > 0.5).astype(np.uint8) * 255
-    # Resize back to original? Or keep 512 for display speed? 
-    # Let's resize back for precision if needed, but for web 512 is good.
-    # We will return 512 for now.
-    
+        pr_masks = logits.sigmoid()[:, 0].cpu().numpy()
+    return list(pr_masks)
+
+def refine_mask(pr_mask):
+    """Threshold + morphology. Returns (refined crown mask, separated crown cores)."""
     # Counting Logic (Watershed / Distance Transform)
     # 1. Refine mask
     mask_refined = (pr_mask > 0.40).astype(np.uint8) * 255
@@ -107,93 +144,513 @@ async def predict_segmentation(file: UploadFile = File(...)):
     #    ULTRA SENSITIVITY: 0.1 ratio to catch even faint centers
     _, sure_fg = cv2.threshold(dist_transform, 0.1 * dist_transform.max(), 255, 0)
     sure_fg = np.uint8(sure_fg)
+    return mask_refined, sure_fg
+
+def find_candidates(pr_mask, image_rgb):
+    """Locates palm crowns in a probability mask and measures ExG under each crown."""
+    mask_refined, sure_fg = refine_mask(pr_mask)
     
     # 4. Find contours on the SEPARATED cores
     contours, _ = cv2.findContours(sure_fg, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
-    # Health Analysis
-    palm_data = []
-    annotated = image_resized.copy()
-    
-    all_exg = []
-    candidates = []
-    
-    # Pass 1
+    # Pass 1: crown geometry (cost is per contour point, not per pixel)
+    kept, centers, radii, areas = [], [], [], []
     for cnt in contours:
         area = cv2.contourArea(cnt)
         if area < 5: continue # Almost no filtering, accept everything
         
         ((x,y), radius) = cv2.minEnclosingCircle(cnt)
-        center = (int(x), int(y))
-        radius = int(radius)
+        kept.append(cnt)
+        centers.append((int(x), int(y)))
+        radii.append(int(radius))
+        areas.append(area)
+    
+    # Pass 2: Health Analysis - mean RGB under every crown disc in one vectorized pass
+    exg = scoring.excess_green(scoring.disc_means(image_rgb, centers, radii)) # image_rgb is RGB
+    
+    candidates = [
+        {'cnt': cnt, 'c': c, 'r': r, 'exg': float(e), 'area': a}
+        for cnt, c, r, e, a in zip(kept, centers, radii, exg, areas)
+    ]
+    return candidates, mask_refined
+
+def classify_candidates(candidates):
+    """Applies the dynamic infection threshold. Returns (infected flags, infected count, avg health)."""
+    all_exg = np.array([c['exg'] for c in candidates], dtype=np.float64)
+    
+    # Dynamic Threshold
+    thresh = scoring.infection_threshold(all_exg)
+    
+    infected = all_exg < thresh
+    avg_h = (sum(all_exg.tolist()) / len(candidates)) if candidates else 0
+    return infected.tolist(), int(infected.sum()), float(avg_h)
+
+def analyze_prediction(pr_mask, image_resized, annotate=True):
+    """Counts palms in a probability mask and scores their health from the RGB image."""
+    candidates, mask_refined = find_candidates(pr_mask, image_resized)
+    infected, infected_count, avg_h = classify_candidates(candidates)
+    
+    annotated = None
+    if annotate:
+        annotated = image_resized.copy()
+        for c, is_infected in zip(candidates, infected):
+            color = (255, 0, 0) if is_infected else (0, 255, 0) # RGB
+            cv2.circle(annotated, c['c'], c['r'], color, 2)
+    
+    return {
+        'candidates': candidates,
+        'infected': infected,
+        'infected_count': infected_count,
+        'avg_health': avg_h,
+        'annotated': annotated,
+        'mask_refined': mask_refined
+    }
+
+def segment_orthomosaic(path):
+    """
+    Full-resolution scan of a large raster.
+    Overlapping tiles are streamed through the model in batches and blended into a
+    disk-backed probability mask; palms are then found window by window (with a halo
+    so crowns on window borders are not cut) in full-resolution coordinates.
+    """
+    reader = tiling.open_raster(path, work_dir=tiling.TILE_WORK_DIR)
+    blender = None
+    try:
+        blender = tiling.ProbabilityBlender(reader.height, reader.width)
+        n_tiles = 0
+        for batch in tiling.iter_tile_batches(reader):
+            probs = run_model_batch([rgb for _, _, rgb in batch])
+            for (y0, x0, _), prob in zip(batch, probs):
+                blender.add(y0, x0, prob)
+            n_tiles += len(batch)
         
-        single_mask = np.zeros_like(mask_refined)
-        cv2.circle(single_mask, center, radius, 255, -1)
-        mean_val = cv2.mean(image_resized, mask=single_mask)
-        R, G, B = mean_val[0], mean_val[1], mean_val[2] # image_resized is RGB
-        exg = (2 * G) - R - B
+        halo = tiling.TILE_OVERLAP
+        candidates = []
+        for y0, y1, x0, x1 in tiling.iter_windows(reader.height, reader.width):
+            hy0, hx0 = max(0, y0 - halo), max(0, x0 - halo)
+            hy1, hx1 = min(reader.height, y1 + halo), min(reader.width, x1 + halo)
+            window_cands, _ = find_candidates(blender.read(hy0, hy1, hx0, hx1), reader.read(hy0, hy1, hx0, hx1))
+            for c in window_cands:
+                cx, cy = c['c'][0] + hx0, c['c'][1] + hy0
+                # Keep only crowns centred in this window's core; neighbours own the halo
+                if y0 <= cy < y1 and x0 <= cx < x1:
+                    c['c'] = (cx, cy)
+                    c['cnt'] = c['cnt'] + np.array([hx0, hy0], dtype=c['cnt'].dtype)
+                    candidates.append(c)
         
-        all_exg.append(exg)
-        candidates.append({'cnt': cnt, 'c': center, 'r': radius, 'exg': exg})
+        infected, infected_count, avg_h = classify_candidates(candidates)
+        preview = ((blender.preview() > 0.40).astype(np.uint8) * 255)
+        return {
+            'candidates': candidates,
+            'infected_count': infected_count,
+            'avg_health': avg_h,
+            'width': reader.width,
+            'height': reader.height,
+            'tiles': n_tiles,
+            'mask_preview': preview
+        }
+    finally:
+        if blender is not None:
+            blender.close()
+        reader.close()
+
+def _palm_records(analysis):
+    palm_records = []
+    for c in analysis['candidates']:
+        # Re-calculate area safe or usage
+        area_px = c['area']
+        palm_records.append({
+            'x': c['c'][0],
+            'y': c['c'][1],
+            'area': area_px,
+            'health_score': c['exg']
+        })
+    return palm_records
+
+def _notify_scan(survey_id, analysis):
+    candidates = analysis['candidates']
+    infected_count = analysis['infected_count']
+    if survey_id:
+        print(f"Scan {survey_id} saved successfully.")
         
-    # Dynamic Threshold
-    thresh = 0
-    if all_exg:
-        thresh = np.mean(all_exg) - (0.5 * np.std(all_exg))
+        # TRIGGER NOTIFICATION ALWAYS (For Verification)
+        status_emoji = "✅" if infected_count == 0 else "⚠️"
+        status_text = "All Clear" if infected_count == 0 else f"{infected_count} Infected Palms Detected"
         
-    infected_count = 0
-    total_health = 0
+        msg = (
+            f"{status_emoji} Drone Patrol Report (Scan #{survey_id})\n"
+            f"Trees: {len(candidates)}\n"
+            f"Status: {status_text}"
+        )
+        notifications.enqueue_alert(msg)
+
+def save_and_notify(analysis):
+    """
+    Persists a scan (through the farm's DB writer thread) and sends the patrol report.
+    Blocking, for worker threads. Failures are logged, never raised.
+    """
+    try:
+        survey_id = async_db.writer_for().call(
+            db.save_scan_results, len(analysis['candidates']), analysis['avg_health'], _palm_records(analysis)
+        )
+        _notify_scan(survey_id, analysis)
+        return survey_id
+    except Exception as e:
+        print(f"❌ Failed to save scan results: {e}")
+        return None
+
+async def save_and_notify_async(analysis):
+    """save_and_notify() for async routes: awaits the DB writer instead of blocking a thread."""
+    try:
+        survey_id = await async_db.save_scan_results(
+            len(analysis['candidates']), analysis['avg_health'], _palm_records(analysis)
+        )
+        _notify_scan(survey_id, analysis)
+        return survey_id
+    except Exception as e:
+        print(f"❌ Failed to save scan results: {e}")
+        return None
+
+def build_entry(analysis, with_image=True):
+    """
+    Serializable scan result that every response format is rendered from (and that
+    the result cache stores). The mask is kept as RLE; the annotated JPEG is only
+    encoded when some caller asked for it.
+    """
+    entry = {
+        'palm_count': len(analysis['candidates']),
+        'infected_count': analysis['infected_count'],
+        'avg_health': analysis['avg_health'],
+        'candidates': [{'c': c['c'], 'r': c['r'], 'area': c['area'], 'exg': c['exg']} for c in analysis['candidates']],
+        'infected': analysis['infected'],
+        'mask_rle': formats.mask_to_rle(analysis['mask_refined'])
+    }
+    if with_image:
+        entry['image_jpg'] = formats.b64(formats.encode_jpeg(analysis['annotated']))
+    return entry
+
+def _mask_png(entry):
+    return formats.encode_png(formats.rle_to_mask(entry['mask_rle']))
+
+def render_result(entry, fields=None, mask_format="png"):
+    """Full legacy response when `fields` is None, otherwise only the requested parts."""
+    if fields is None:
+        return SegmentationResponse(
+            palm_count=entry['palm_count'],
+            infected_count=entry['infected_count'],
+            avg_health=entry['avg_health'],
+            processed_image_base64=entry['image_jpg'],
+            mask_base64=formats.b64(_mask_png(entry))
+        )
     
-    for c in candidates:
-        is_infected = c['exg'] < thresh
-        color = (255, 0, 0) if is_infected else (0, 255, 0) # RGB
-        if is_infected: infected_count += 1
+    out = CompactSegmentationResponse(
+        palm_count=entry['palm_count'],
+        infected_count=entry['infected_count'],
+        avg_health=entry['avg_health']
+    )
+    if 'detections' in fields:
+        out.detections = [
+            [c['c'][0], c['c'][1], c['r'], round(c['exg'], 3), int(inf)]
+            for c, inf in zip(entry['candidates'], entry['infected'])
+        ]
+    if 'mask' in fields:
+        out.mask_format = mask_format
+        if mask_format == "rle":
+            out.mask = entry['mask_rle']
+        elif mask_format == "polygons":
+            out.mask = formats.mask_to_polygons(formats.rle_to_mask(entry['mask_rle']))
+        else:
+            out.mask = formats.b64(_mask_png(entry))
+    if 'image' in fields:
+        out.image_base64 = entry['image_jpg']
+    return out
+
+def render_binary(entry, fields, mask_format, media_type):
+    """Raw (non-base64) bodies: a single image, or multipart JSON + image parts."""
+    headers = {
+        "X-Palm-Count": str(entry['palm_count']),
+        "X-Infected-Count": str(entry['infected_count']),
+        "X-Avg-Health": f"{entry['avg_health']:.4f}"
+    }
+    if media_type == "image/jpeg":
+        return Response(base64.b64decode(entry['image_jpg']), media_type="image/jpeg", headers=headers)
+    if media_type == "image/png":
+        return Response(_mask_png(entry), media_type="image/png", headers=headers)
+    
+    fields = set(FIELDS) if fields is None else fields
+    # Images travel as their own parts; RLE / polygon masks stay in the JSON part
+    json_fields = fields - {"image"} - ({"mask"} if mask_format == "png" else set())
+    parts = [("result", "application/json", render_result(entry, json_fields, mask_format).model_dump(exclude_none=True))]
+    if "image" in fields:
+        parts.append(("image", "image/jpeg", base64.b64decode(entry['image_jpg'])))
+    if "mask" in fields and mask_format == "png":
+        parts.append(("mask", "image/png", _mask_png(entry)))
+    body, content_type = formats.multipart_mixed(parts)
+    return Response(body, headers=headers, media_type=content_type)
+
+def _worker_threads():
+    return TORCH_THREADS or max(1, (os.cpu_count() or 1) // pool.workers)
+
+def _pin_torch_threads():
+    threads = _worker_threads()
+    if torch.get_num_threads() != threads:
+        torch.set_num_threads(threads)
+
+def _finish_scan(pr_mask, image_resized, with_image=True):
+    analysis = analyze_prediction(pr_mask, image_resized, annotate=with_image)
+    return build_entry(analysis, with_image)
+
+def _cached_scan(contents, with_image=True, skip_duplicate_survey=None):
+    """
+    Returns (cache key, cached entry or None, whether the scan should be saved as a survey).
+    Entries are only cached once their survey was saved, so a hit is skipped by default.
+    An entry without the annotated image cannot serve image requests; the scan is then
+    recomputed (entry None), but the survey is not inserted twice.
+    """
+    key = content_key(contents, db.current_farm.get())
+    entry = result_cache.get(key)
+    if entry is None or 'mask_rle' not in entry:
+        return key, None, True
+    skip = RESULT_CACHE_SKIP_DUPLICATES if skip_duplicate_survey is None else skip_duplicate_survey
+    if with_image and 'image_jpg' not in entry:
+        return key, None, not skip
+    return key, entry, not skip
+
+def _parse_fields(fields, mask_format):
+    if mask_format not in MASK_FORMATS:
+        raise HTTPException(status_code=400, detail=f"mask_format must be one of {', '.join(MASK_FORMATS)}")
+    if fields is None:
+        return None
+    wanted = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = wanted - set(FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))} (expected {', '.join(FIELDS)})")
+    return wanted
+
+def _accept_ranges(header):
+    """{media range: q} of an Accept header; malformed q-values count as 0."""
+    ranges = {}
+    for part in header.split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = min(1.0, max(0.0, float(value)))
+                except ValueError:
+                    q = 0.0
+        ranges[media_type.lower()] = max(q, ranges.get(media_type.lower(), 0.0))
+    return ranges
+
+def _binary_type(request):
+    """
+    The binary type to answer with, or None for JSON. A binary type must be listed
+    explicitly and weigh more than JSON (application/json, application/* or */*);
+    ties go to JSON, then to BINARY_TYPES order.
+    """
+    ranges = _accept_ranges(request.headers.get("accept", ""))
+    json_q = max(ranges.get(r, 0.0) for r in ("application/json", "application/*", "*/*")) if ranges else 1.0
+    best, best_q = None, json_q
+    for media_type in BINARY_TYPES:
+        q = ranges.get(media_type, 0.0)
+        if q > best_q:
+            best, best_q = media_type, q
+    return best
+
+# Dedicated workers for everything blocking; the event loop only shuffles bytes
+pool = InferencePool(initializer=_pin_torch_threads)
+# Shared scheduler: concurrent uploads are folded into one forward pass
+batcher = MicroBatcher(run_model_batch, executor=pool.executor, max_concurrency=pool.workers)
+# Re-uploaded frames are answered from here instead of re-running the scan
+result_cache = ResultCache(version_fn=current_model_version)
+
+@contextmanager
+def _admit(n=1):
+    """pool.admit() that turns saturation into 503 + Retry-After."""
+    try:
+        slot = pool.admit(n)
+        slot.__enter__()
+    except PoolSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    try:
+        yield
+    finally:
+        slot.__exit__(None, None, None)
+
+async def _segment(image, cache_key=None, with_image=True, save=True):
+    image_resized = await pool.run(preprocess_image, image)
+    pr_mask = await batcher.submit(image_resized)
+    entry = await pool.run(_finish_scan, pr_mask, image_resized, with_image)
+    # The entry carries candidates / counts / avg_health, which is all a survey needs.
+    # It is cached only once its survey exists, so a failed save is retried on re-upload.
+    if save and await save_and_notify_async(entry) is None:
+        return entry
+    if cache_key is not None:
+        await pool.run(result_cache.put, cache_key, entry)
+    return entry
+
+# --- Endpoints ---
+
+@router.post(
+    "/predict",
+    response_model=Union[SegmentationResponse, CompactSegmentationResponse],
+    response_model_exclude_none=True,
+    responses={200: {"content": {t: {} for t in BINARY_TYPES}}}
+)
+async def predict_segmentation(
+    request: Request,
+    response: Response,
+    file: UploadFile = File(...),
+    fields: Optional[str] = None,
+    mask_format: str = "png",
+    skip_duplicate_survey: Optional[bool] = None
+):
+    """
+    fields: comma list of counts,detections,mask,image. Omit for the full legacy response;
+    image/mask encoding is skipped for parts that are not requested.
+    mask_format: png (base64) | rle | polygons.
+    Accept (q-values honoured, JSON wins ties): multipart/mixed (JSON + raw image parts), image/jpeg (annotated frame) or
+    image/png (mask) returns raw bytes with the counts in X-Palm-Count / X-Infected-Count / X-Avg-Health.
+    skip_duplicate_survey: on a cache hit (same bytes, same model) don't insert another survey.
+    Defaults to RESULT_CACHE_SKIP_DUPLICATES.
+    """
+    wanted = _parse_fields(fields, mask_format)
+    binary = _binary_type(request)
+    if binary == "image/jpeg":
+        with_image = True
+    elif binary == "image/png":
+        with_image = False
+    else:
+        with_image = wanted is None or "image" in wanted
+    
+    with _admit():
+        await pool.run(get_model)
         
-        cv2.circle(annotated, c['c'], c['r'], color, 2)
-        total_health += c['exg']
+        # Read Image
+        contents = await file.read()
+        key, entry, save = await pool.run(_cached_scan, contents, with_image, skip_duplicate_survey)
+        cache_status = "HIT" if entry is not None else "MISS"
         
-    avg_h = (total_health / len(candidates)) if candidates else 0
+        if entry is None:
+            image = await pool.run(decode_image, contents)
+            
+            if image is None:
+                raise HTTPException(status_code=400, detail="Invalid image file")
+            
+            entry = await _segment(image, key, with_image, save)
+        elif save:
+            await save_and_notify_async(entry)
+        
+        if binary is not None:
+            result = await pool.run(render_binary, entry, wanted, mask_format, binary)
+            result.headers["X-Cache"] = cache_status
+            return result
+        response.headers["X-Cache"] = cache_status
+        return await pool.run(render_result, entry, wanted, mask_format)
+
+@router.post("/predict/batch", response_model=BatchSegmentationResponse, response_model_exclude_none=True)
+async def predict_segmentation_batch(
+    files: List[UploadFile] = File(...),
+    fields: Optional[str] = None,
+    mask_format: str = "png",
+    skip_duplicate_survey: Optional[bool] = None
+):
+    """
+    Scans many frames in one call (e.g. a whole drone flight); each frame is saved as its own survey.
+    Frames are scanned in chunks of at most the pool's queue limit, which is all the
+    admission slots the call holds. Surveys are only written once every frame decoded.
+    """
+    wanted = _parse_fields(fields, mask_format)
+    with_image = wanted is None or "image" in wanted
+    if len(files) > INFER_BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"Too many files: {len(files)} (at most {INFER_BATCH_MAX_FILES} per batch)")
     
-    # --- SAVE TO DB ---
-    try:
-        palm_records = []
-        for c in candidates:
-            # Re-calculate area safe or usage
-            area_px = cv2.contourArea(c['cnt'])
-            palm_records.append({
-                'x': c['c'][0],
-                'y': c['c'][1],
-                'area': area_px,
-                'health_score': c['exg']
-            })
-        survey_id = db.save_scan_results(len(candidates), float(avg_h), palm_records)
-        if survey_id:
-            print(f"Scan {survey_id} saved successfully.")
+    chunk = max(1, min(len(files), pool.queue_limit))
+    entries = [None] * len(files)
+    writes = []  # (index, cache key, save survey, cache entry) in upload order
+    with _admit(chunk):
+        await pool.run(get_model)
+        
+        for start in range(0, len(files), chunk):
+            part = range(start, min(start + chunk, len(files)))
+            contents = [await files[i].read() for i in part]
+            lookups = await asyncio.gather(*(pool.run(_cached_scan, c, with_image, skip_duplicate_survey) for c in contents))
             
-            # TRIGGER NOTIFICATION ALWAYS (For Verification)
-            status_emoji = "✅" if infected_count == 0 else "⚠️"
-            status_text = "All Clear" if infected_count == 0 else f"{infected_count} Infected Palms Detected"
+            pending = []
+            for i, data, (key, entry, save) in zip(part, contents, lookups):
+                if entry is None:
+                    pending.append((i, data, key, save))
+                else:
+                    entries[i] = entry
+                    writes.append((i, key, save, False))
+            images = await asyncio.gather(*(pool.run(decode_image, data) for _, data, _, _ in pending))
+            for (i, _, _, _), image in zip(pending, images):
+                if image is None:
+                    raise HTTPException(status_code=400, detail=f"Invalid image file: {files[i].filename}")
             
-            msg = (
-                f"{status_emoji} Drone Patrol Report (Scan #{survey_id})\n"
-                f"Trees: {len(candidates)}\n"
-                f"Status: {status_text}"
-            )
-            notifications.send_telegram_alert(msg)
-    except Exception as e:
-        print(f"❌ Failed to save scan results: {e}")
+            # Not cached or saved yet: a bad frame in a later chunk must leave no trace
+            fresh = await asyncio.gather(*(_segment(img, None, with_image, save=False) for img in images))
+            for (i, _, key, save), entry in zip(pending, fresh):
+                entries[i] = entry
+                writes.append((i, key, save, True))
+        
+        # Like _segment(): an entry is cached only once its survey exists
+        for i, key, save, cache in sorted(writes):
+            if save and await save_and_notify_async(entries[i]) is None:
+                continue
+            if cache:
+                await pool.run(result_cache.put, key, entries[i])
+        
+        results = []
+        for start in range(0, len(entries), chunk):
+            results.extend(await asyncio.gather(*(
+                pool.run(render_result, e, wanted, mask_format) for e in entries[start:start + chunk]
+            )))
+        return BatchSegmentationResponse(count=len(results), results=results)
+
+@router.get("/batching/stats")
+def get_batching_stats():
+    """Queue depth and batch-size histograms for tuning INFER_MAX_BATCH_SIZE / INFER_MAX_WAIT_MS."""
+    return {**batcher.stats(), "pool": pool.stats(), "result_cache": result_cache.stats()}
 
-    # Encode Images
-    _, buffer_img = cv2.imencode('.jpg', cv2.cvtColor(annotated, cv2.COLOR_RGB2BGR))
-    img_b64 = base64.b64encode(buffer_img).decode('utf-8')
+def _scan_orthomosaic_upload(upload):
+    suffix = os.path.splitext(upload.filename or "")[1].lower() or ".img"
+    tmp = tempfile.NamedTemporaryFile(dir=tiling.TILE_WORK_DIR, suffix=suffix, delete=False)
+    try:
+        with tmp:
+            shutil.copyfileobj(upload.file, tmp, 1024 * 1024)
+        result = segment_orthomosaic(tmp.name)
+    finally:
+        os.remove(tmp.name)
     
-    _, buffer_mask = cv2.imencode('.png', mask_refined)
-    mask_b64 = base64.b64encode(buffer_mask).decode('utf-8')
+    result['survey_id'] = save_and_notify(result)
+    _, buffer_mask = cv2.imencode('.png', result['mask_preview'])
+    result['mask_preview_png'] = buffer_mask
+    return result
+
+@router.post("/predict/tiled", response_model=TiledSegmentationResponse)
+async def predict_orthomosaic(file: UploadFile = File(...)):
+    """
+    Full-resolution scan for stitched orthomosaics (GeoTIFF, .npy, or JPEG/PNG up to TILE_MAX_DECODE_PIXELS).
+    The upload is spooled to disk and read window by window instead of being resized to IMG_SIZE.
+    """
+    with _admit():
+        await pool.run(get_model)
+        try:
+            result = await pool.run(_scan_orthomosaic_upload, file)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
-    return SegmentationResponse(
-        palm_count=len(candidates),
-        infected_count=infected_count,
-        avg_health=float(avg_h),
-        processed_image_base64=img_b64,
-        mask_base64=mask_b64
+    return TiledSegmentationResponse(
+        palm_count=len(result['candidates']),
+        infected_count=result['infected_count'],
+        avg_health=result['avg_health'],
+        width=result['width'],
+        height=result['height'],
+        tiles=result['tiles'],
+        survey_id=result['survey_id'],
+        mask_preview_base64=base64.b64encode(result['mask_preview_png']).decode('utf-8')
     )
@@ -0,0 +1,93 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import BaseModel
+from typing import List, Optional
+import asyncio
+import time
+from core import async_db, db, ingest
+
+router = APIRouter()
+
+class IngestedSurvey(BaseModel):
+    survey_id: int
+    key: Optional[str] = None
+    scan_date: str
+    rows: int
+    new_palms: int
+    tasks_created: int
+
+class IngestResponse(BaseModel):
+    rows: int
+    surveys: List[IngestedSurvey]
+    seconds: float
+    rows_per_s: float
+
+@router.post("/detections", response_model=IngestResponse)
+async def ingest_detections(
+    request: Request,
+    format: Optional[str] = Query(None, description="ndjson | csv (default: from Content-Type)"),
+    scan_date: Optional[str] = Query(None, description="Scan date for rows without one (default: now, UTC)"),
+    match_radius: float = Query(db.PALM_MATCH_RADIUS, gt=0, description="Distance within which a detection is the same palm"),
+):
+    """
+    Bulk ingest of externally computed detections (e.g. from the drone's edge device).
+    Body is streamed NDJSON or CSV, one detection per line: x/y or lat/lon,
+    health_score, optional yield_est (or yield), optional survey key and scan_date.
+    Consecutive rows with the same survey key become one survey; palms are matched
+    and tasks generated exactly as for /predict scans. Each chunk of
+    INGEST_CHUNK_ROWS rows is committed on its own, so an error midway keeps the
+    rows before it (the response detail says how far the ingest got).
+    """
+    fmt = (format or ingest.format_for(request.headers.get("content-type")) or "").lower()
+    if fmt not in ingest.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(ingest.FORMATS)} (or set Content-Type)")
+
+    loop = asyncio.get_running_loop()
+    parser = ingest.StreamParser(fmt)
+    try:
+        session = ingest.BulkIngest(scan_date=scan_date, match_radius=match_radius)
+    except ingest.IngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    started = time.perf_counter()
+    pending = None  # previous chunk's write; parsing the next chunk overlaps it
+    batch = []
+
+    async def flush():
+        nonlocal pending, batch
+        if pending is not None:
+            await pending
+        pending = asyncio.ensure_future(async_db.write(session.write, batch))
+        batch = []
+
+    error = None
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                batch.extend(await loop.run_in_executor(None, parser.feed, chunk))
+            if len(batch) >= ingest.INGEST_CHUNK_ROWS:
+                await flush()
+        batch.extend(parser.close())
+        if batch:
+            await flush()
+    except ingest.IngestError as e:
+        error = e
+    finally:
+        failed = None
+        if pending is not None:
+            await asyncio.wait([pending])
+            failed = None if pending.cancelled() else pending.exception()
+        # Finish the survey in progress so its totals, aggregate and tasks match what was committed
+        report = await async_db.write(session.close)
+    if isinstance(failed, ingest.IngestError):
+        error = error or failed
+    elif failed is not None:
+        raise failed
+    if error is not None:
+        raise HTTPException(status_code=400, detail={"error": str(error), "line": error.line, "ingested": report})
+
+    seconds = time.perf_counter() - started
+    return IngestResponse(
+        rows=report["rows"],
+        surveys=report["surveys"],
+        seconds=round(seconds, 3),
+        rows_per_s=round(report["rows"] / seconds, 1) if seconds > 0 else 0.0,
+    )
@@ -0,0 +1,198 @@
+"""
+Hot-path query benchmark for core.db, before and after the schema migrations.
+Seeds a synthetic farm (tracked palms x surveys of history rows + open tasks) into a
+scratch database, rolls the schema back to version 0, times the queries, migrates to
+the latest version and times them again.
+
+    python benchmarks/bench_db.py                                  # defaults
+    python benchmarks/bench_db.py --palms 50000 --surveys 40 --repeat 20
+    python benchmarks/bench_db.py --out after.json
+
+Queries: latest survey palms (get_latest_palms_df), palm detail history
+(get_palm_detail), task auto-generation subquery (save_scan_results) and the
+latest-survey yield sum (get_financial_metrics). Each reports p50 / p95 / mean latency
+per schema version plus the SQLite query plan.
+"""
+import argparse
+import atexit
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+# The seeded database lives in a scratch dir, never in data/
+WORK_DIR = tempfile.mkdtemp(prefix="palm_db_bench_")
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
+os.environ["DB_PATH"] = os.path.join(WORK_DIR, "bench.db")
+
+from core import db
+
+# --- Synthetic Data ---
+
+def seed(palms, surveys, task_ratio, seed=0):
+    """Bulk-inserts `palms` tracked palms, `surveys` surveys of history for each, and open tasks."""
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(np.sqrt(palms)))
+    xy = np.stack([np.arange(palms) % side, np.arange(palms) // side], axis=1) * 25.0
+    xy += rng.uniform(-3, 3, xy.shape)
+    health = rng.uniform(20, 100, palms)
+
+    with db.connection() as conn:
+        c = conn.cursor()
+        c.executemany("INSERT INTO tracked_palms (id, lat, lon, last_health_score) VALUES (?, ?, ?, ?)",
+                      [(i + 1, float(x), float(y), float(h)) for i, ((x, y), h) in enumerate(zip(xy, health))])
+        for s in range(surveys):
+            c.execute("INSERT INTO surveys (scan_date, total_palms, avg_health) VALUES (?, ?, ?)",
+                      (f"2025-{1 + s % 12:02d}-01 00:00:00", palms, float(health.mean())))
+            survey_id = c.lastrowid
+            scores = np.clip(health + rng.normal(0, 5, palms), 0, 100)
+            c.executemany("INSERT INTO palm_history (tracked_palm_id, survey_id, health_score, yield_est) VALUES (?, ?, ?, ?)",
+                          [(i + 1, survey_id, float(h), float(h) * 0.5) for i, h in enumerate(scores)])
+        task_palms = rng.choice(palms, int(palms * task_ratio), replace=False) + 1
+        c.executemany("INSERT INTO tasks (task_type, target_palm_id, status, created_at) VALUES (?, ?, ?, ?)",
+                      [("Pest Control", int(p), "Done" if i % 3 else "Pending", "2025-01-01")
+                       for i, p in enumerate(task_palms)])
+
+# --- Measurement ---
+
+def measure(fn, repeat, warmup=1):
+    """Runs fn() warmup + repeat times; returns latency percentiles (ms)."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    samples = np.array(samples)
+    return {
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "mean_ms": round(float(samples.mean()), 3),
+        "samples": len(samples),
+    }
+
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+# --- Queries ---
+
+def hot_queries(palms):
+    """(name, sql, params) of the statements the API runs on every request / scan."""
+    rng = np.random.default_rng(1)
+    return [
+        ("latest_palms", """
+            SELECT ph.id, ph.survey_id, ph.tracked_palm_id, tp.lat, tp.lon, ph.health_score
+            FROM palm_history ph
+            JOIN tracked_palms tp ON ph.tracked_palm_id = tp.id
+            WHERE ph.survey_id = (SELECT MAX(id) FROM surveys)""", ()),
+        ("palm_detail", """
+            SELECT s.scan_date, ph.health_score
+            FROM palm_history ph
+            JOIN surveys s ON ph.survey_id = s.id
+            WHERE ph.tracked_palm_id = ?
+            ORDER BY s.scan_date ASC""", lambda: (int(rng.integers(1, palms + 1)),)),
+        ("task_autogen", """
+            SELECT COUNT(*) FROM tracked_palms
+            WHERE last_health_score < 40
+            AND id NOT IN (SELECT target_palm_id FROM tasks WHERE status != 'Done')""", ()),
+        ("yield_sum", """
+            SELECT SUM(yield_est) FROM palm_history
+            WHERE survey_id = (SELECT MAX(id) FROM surveys)""", ()),
+    ]
+
+def bench_queries(queries, repeat):
+    results = {}
+    with db.connection() as conn:
+        c = conn.cursor()
+        for name, sql, params in queries:
+            args = params if callable(params) else (lambda p=params: p)
+            c.execute(f"EXPLAIN QUERY PLAN {sql}", args())
+            plan = [row[-1] for row in c.fetchall()]
+            stats = measure(lambda: c.execute(sql, args()).fetchall(), repeat)
+            stats["plan"] = plan
+            results[name] = stats
+    return results
+
+# --- Reporting ---
+
+def print_table(report):
+    versions = list(report["schema"])
+    print(f"{'query':<14}" + "".join(f"{'v' + v + ' p50 ms':>14}" for v in versions) + f"{'speedup':>10}")
+    first, last = report["schema"][versions[0]], report["schema"][versions[-1]]
+    for name in first:
+        line = f"{name:<14}" + "".join(f"{report['schema'][v][name]['p50_ms']:>14.3f}" for v in versions)
+        if last[name]["p50_ms"]:
+            line += f"{first[name]['p50_ms'] / last[name]['p50_ms']:>9.1f}x"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-path SQLite query latency before/after schema migrations.")
+    parser.add_argument("--palms", type=int, default=20000, help="Tracked palms to seed")
+    parser.add_argument("--surveys", type=int, default=24, help="Surveys of history per palm")
+    parser.add_argument("--task-ratio", type=float, default=0.2, help="Fraction of palms with a task")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed iterations per query")
+    parser.add_argument("--out", default="bench_db.json", help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    print(f"seeding {args.palms} palms x {args.surveys} surveys ...")
+    t0 = time.perf_counter()
+    with quiet():
+        seed(args.palms, args.surveys, args.task_ratio)
+    seed_s = time.perf_counter() - t0
+
+    report = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sqlite": db.sqlite3.sqlite_version,
+        },
+        "config": {**vars(args), "history_rows": args.palms * args.surveys, "seed_s": round(seed_s, 2)},
+        "migrations": {},
+        "schema": {},
+    }
+    queries = hot_queries(args.palms)
+
+    with quiet():
+        db.migrate(0)
+    report["schema"]["0"] = bench_queries(queries, args.repeat)
+
+    t0 = time.perf_counter()
+    with quiet():
+        applied = db.migrate()
+    report["migrations"] = {"applied": applied, "seconds": round(time.perf_counter() - t0, 3)}
+    latest = str(applied[-1]) if applied else "0"
+    report["schema"][latest] = bench_queries(queries, args.repeat)
+
+    print(f"migrations {applied} applied in {report['migrations']['seconds']}s\n")
+    print_table(report)
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport -> {args.out}")
+
+if __name__ == "__main__":
+    main()
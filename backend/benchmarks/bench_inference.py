@@ -0,0 +1,245 @@
+"""
+Stage-level benchmark of the /predict pipeline. Runs offline on a CPU-only box:
+the U-Net is built with random weights and frames are synthetic plantation images.
+
+    python benchmarks/bench_inference.py                          # defaults
+    python benchmarks/bench_inference.py --sizes 1024 4000 --batch-sizes 1 4 8 --density 80
+    python benchmarks/bench_inference.py --out after.json --baseline before.json
+
+Stages: decode, preprocess, forward, morphology (threshold + distance transform),
+scoring (contours + ExG), save (db.save_scan_results), encode (annotated JPEG + mask PNG).
+Every stage reports p50 / p95 / mean latency and throughput; the JSON written to --out
+can be passed back as --baseline on another commit to print the deltas.
+"""
+import argparse
+import atexit
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import torch
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+# Everything the API touches on import goes to a scratch dir, never to data/
+WORK_DIR = tempfile.mkdtemp(prefix="palm_bench_")
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
+os.environ["MODEL_PATH"] = os.path.join(WORK_DIR, "random_model.pth")
+os.environ["DB_PATH"] = os.path.join(WORK_DIR, "bench.db")
+os.environ["RESULT_CACHE_DIR"] = os.path.join(WORK_DIR, "result_cache")
+os.environ["NOTIFY_OUTBOX_PATH"] = os.path.join(WORK_DIR, "outbox.db")
+os.environ["TG_TOKEN"] = ""
+
+from core import db, formats, model_backends, preprocess
+from api import inference
+
+STAGES = ("decode", "preprocess", "forward", "morphology", "scoring", "save", "encode")
+
+# --- Synthetic Data ---
+
+def synthetic_frame(size, density, seed=0):
+    """
+    Square plantation-like JPEG frame: soil background with `density` green crowns
+    (a few of them yellowed). Crowns scale with the frame so density survives the resize.
+    """
+    rng = np.random.default_rng(seed)
+    scale = size / inference.IMG_SIZE
+    img = np.full((size, size, 3), (60, 110, 150), np.uint8)  # BGR soil
+    img += rng.integers(0, 20, img.shape, dtype=np.uint8)
+    for _ in range(density):
+        x, y = rng.integers(0, size, 2).tolist()
+        r = max(2, int(rng.integers(6, 16) * scale))
+        if rng.random() < 0.15:
+            color = (40, int(rng.integers(150, 190)), int(rng.integers(150, 190)))  # yellowing crown
+        else:
+            color = (int(rng.integers(20, 80)), int(rng.integers(120, 200)), int(rng.integers(20, 80)))
+        cv2.circle(img, (x, y), r, color, -1)
+    _, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return buf.tobytes()
+
+def oracle_mask(image_rgb):
+    """
+    Crown probability map from colour alone. A random-weight model produces noise, so the
+    post-processing stages are timed on this instead to keep their cost density-dependent.
+    """
+    r, g = image_rgb[..., 0].astype(np.int16), image_rgb[..., 1].astype(np.int16)
+    crowns = ((g - r) > 40).astype(np.float32)
+    return cv2.GaussianBlur(crowns, (5, 5), 0)
+
+def write_random_model(path):
+    torch.manual_seed(0)
+    torch.save(model_backends.build_unet().state_dict(), path)
+
+# --- Measurement ---
+
+def measure(fn, repeat, warmup=1, items=1):
+    """Runs fn() warmup + repeat times; returns latency percentiles (ms) and items/s."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    samples = np.array(samples)
+    mean = float(samples.mean())
+    return {
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "mean_ms": round(mean, 3),
+        "items": items,
+        "throughput_per_s": round(items * 1000.0 / mean, 2) if mean else None,
+        "samples": len(samples),
+    }
+
+@contextlib.contextmanager
+def quiet():
+    """db.save_scan_results prints one line per scan; keep the report readable."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def bench_frame(size, density, batch_sizes, repeat):
+    contents = synthetic_frame(size, density, seed=size)
+    image = inference.decode_image(contents)
+    rgb = inference.preprocess_image(image)
+    pr_mask = oracle_mask(rgb)
+    analysis = inference.analyze_prediction(pr_mask, rgb, annotate=True)
+    records = [
+        {'x': c['c'][0], 'y': c['c'][1], 'area': c['area'], 'health_score': c['exg']}
+        for c in analysis['candidates']
+    ]
+    model = inference.get_model()
+
+    def forward(batch):
+        with torch.no_grad():
+            model(batch)
+
+    def save():
+        with quiet():
+            db.save_scan_results(len(records), analysis['avg_health'], records)
+
+    def encode():
+        formats.encode_jpeg(analysis['annotated'])
+        formats.encode_png(analysis['mask_refined'])
+
+    stages = {
+        "decode": measure(lambda: inference.decode_image(contents), repeat),
+        "preprocess": measure(lambda: preprocess.normalize_batch([inference.preprocess_image(image)]), repeat),
+        "morphology": measure(lambda: inference.refine_mask(pr_mask), repeat),
+        "scoring": measure(lambda: inference.find_candidates(pr_mask, rgb), repeat),
+        "save": measure(save, repeat),
+        "encode": measure(encode, repeat),
+    }
+    # Forward pass per batch size (input independent of frame size after preprocessing)
+    forward_stats = {}
+    for n in batch_sizes:
+        batch = torch.from_numpy(preprocess.normalize_batch([rgb] * n).copy())
+        forward_stats[str(n)] = measure(lambda: forward(batch), repeat, items=n)
+    stages["forward"] = forward_stats
+
+    return {
+        "frame_px": size,
+        "jpeg_kb": round(len(contents) / 1024, 1),
+        "density": density,
+        "palms_found": len(analysis['candidates']),
+        "stages": stages,
+    }
+
+# --- Reporting ---
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def flatten(report):
+    """{(frame_px, density, stage[/batch]): stats} for table printing and baseline diffs."""
+    rows = {}
+    for run in report["runs"]:
+        for stage in STAGES:
+            stats = run["stages"][stage]
+            if stage == "forward":
+                for n, s in stats.items():
+                    rows[(run["frame_px"], run["density"], f"forward/b{n}")] = s
+            else:
+                rows[(run["frame_px"], run["density"], stage)] = stats
+    return rows
+
+def print_table(report, baseline=None):
+    base = flatten(baseline) if baseline else {}
+    header = f"{'frame':>6} {'crowns':>6}  {'stage':<14}{'p50 ms':>10}{'p95 ms':>10}{'items/s':>10}"
+    print(header + ("   vs baseline p50" if base else ""))
+    for key, s in flatten(report).items():
+        size, density, stage = key
+        line = f"{size:>6} {density:>6}  {stage:<14}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['throughput_per_s'] or 0:>10.1f}"
+        if key in base and base[key]["p50_ms"]:
+            line += f"   {(s['p50_ms'] / base[key]['p50_ms'] - 1) * 100:+7.1f}%"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage latency benchmark of the palm inference pipeline.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[512, 2048, 4000], help="Square frame sizes (px)")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4, 8], help="Forward-pass batch sizes")
+    parser.add_argument("--density", nargs="+", type=int, default=[40, 150], help="Crowns per frame")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed iterations per stage")
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = torch default)")
+    parser.add_argument("--out", default="bench_inference.json", help="Where to write the JSON report")
+    parser.add_argument("--baseline", default=None, help="Earlier JSON report to compare p50 against")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    write_random_model(os.environ["MODEL_PATH"])
+    with quiet():
+        db.init_db()
+        inference.get_model()
+
+    report = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "torch": torch.__version__,
+            "torch_threads": torch.get_num_threads(),
+        },
+        "config": {
+            "img_size": inference.IMG_SIZE,
+            "backend": inference.INFER_BACKEND,
+            "quantization": inference.INFER_QUANT,
+            "reduced_decode": preprocess.REDUCED_DECODE,
+            "repeat": args.repeat,
+        },
+        "runs": [],
+    }
+    for size in args.sizes:
+        for density in args.density:
+            print(f"frame {size}px, {density} crowns ...")
+            report["runs"].append(bench_frame(size, density, args.batch_sizes, args.repeat))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print()
+    print_table(report, baseline)
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport -> {args.out}")
+
+if __name__ == "__main__":
+    main()
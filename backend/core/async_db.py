@@ -0,0 +1,164 @@
+import asyncio
+import contextvars
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+
+from core import db
+
+# --- Configuration ---
+DB_READ_WORKERS = int(os.getenv("DB_READ_WORKERS", "4"))
+
+_STOP = object()
+
+
+class DBWriter:
+    """
+    Single thread that owns every scan write of one farm shard. Callers enqueue a
+    callable and get a Future back, so concurrent uploads never race for SQLite's
+    write lock (no "database is locked" / busy-timeout stalls) and async routes can
+    simply await. The thread uses its own pooled connection via core.db, routed to
+    its farm. The queue is unbounded: the inference pool's admission limit already
+    caps how many scans are in flight.
+    """
+
+    def __init__(self, farm_id=db.DEFAULT_FARM):
+        self.farm_id = farm_id
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_s = 0.0
+        self.max_wait_ms = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"db-writer-{self.farm_id}", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=10):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)  # queued writes ahead of it still run
+            thread.join(timeout)
+
+    def submit(self, fn, *args, **kwargs):
+        """Queues fn(*args, **kwargs) for the writer thread; returns a concurrent Future."""
+        self.start()
+        future = Future()
+        self._queue.put((partial(fn, *args, **kwargs), future, time.monotonic()))
+        with self._lock:
+            self.submitted += 1
+        return future
+
+    def call(self, fn, *args, **kwargs):
+        """Blocking submit for worker threads; never call from the event loop."""
+        return self.submit(fn, *args, **kwargs).result()
+
+    async def run(self, fn, *args, **kwargs):
+        """Awaitable submit for async routes."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def _run(self):
+        db.current_farm.set(self.farm_id)  # this thread's own context
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            fn, future, queued_at = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.monotonic()
+            try:
+                result = fn()
+            except BaseException as e:
+                future.set_exception(e)
+                failed = True
+            else:
+                future.set_result(result)
+                failed = False
+            with self._lock:
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+                self.busy_s += time.monotonic() - started
+                self.max_wait_ms = max(self.max_wait_ms, (started - queued_at) * 1000.0)
+
+    def stats(self):
+        with self._lock:
+            done = self.completed + self.failed
+            return {
+                "farm_id": self.farm_id,
+                "running": self._thread is not None and self._thread.is_alive(),
+                "queued": self._queue.qsize(),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "mean_write_ms": round(self.busy_s * 1000.0 / done, 2) if done else 0.0,
+                "max_wait_ms": round(self.max_wait_ms, 2),
+            }
+
+
+# One writer per farm shard: farms never wait on each other's write lock
+_writers = {}
+_writers_lock = threading.Lock()
+
+def writer_for(farm_id=None):
+    """Writer thread of a farm (default: the current farm); raises db.UnknownFarm."""
+    farm_id = farm_id or db.current_farm.get()
+    w = _writers.get(farm_id)
+    if w is None:
+        db.pool_for(farm_id)
+        with _writers_lock:
+            w = _writers.setdefault(farm_id, DBWriter(farm_id))
+    return w
+
+def stop_all(timeout=10):
+    with _writers_lock:
+        writers = list(_writers.values())
+    for w in writers:
+        w.stop(timeout)
+
+writer = writer_for(db.DEFAULT_FARM)
+# Reads don't block each other in WAL mode, so they get a small pool of their own
+_readers = ThreadPoolExecutor(max_workers=max(1, DB_READ_WORKERS), thread_name_prefix="db-read")
+
+async def read(fn, *args, **kwargs):
+    """Runs a blocking core.db read off the event loop (in the caller's farm)."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_readers, ctx.run, partial(fn, *args, **kwargs))
+
+async def write(fn, *args, **kwargs):
+    """Runs a blocking core.db write on the current farm's writer thread."""
+    return await writer_for().run(fn, *args, **kwargs)
+
+# --- Async core.db API ---
+
+async def save_scan_results(total_palms, avg_health, palm_data):
+    return await write(db.save_scan_results, total_palms, avg_health, palm_data)
+
+async def get_latest_palms_df():
+    return await read(db.get_latest_palms_df)
+
+async def get_latest_survey_stats():
+    return await read(db.get_latest_survey_stats)
+
+async def get_survey_history():
+    return await read(db.get_survey_history)
+
+def stats():
+    with _writers_lock:
+        writers = dict(_writers)
+    return {"writers": {farm_id: w.stats() for farm_id, w in sorted(writers.items())},
+            "read_workers": max(1, DB_READ_WORKERS)}
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import time
+from collections import Counter
+
+# Defaults can be tuned per deployment without code changes
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv("INFER_MAX_BATCH_SIZE", "8"))
+DEFAULT_MAX_WAIT_MS = float(os.getenv("INFER_MAX_WAIT_MS", "15"))
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent requests into batches for a shared batch function.
+
+    Callers `await submit(item)` and get back their own result. A background
+    task takes the first queued item, then keeps collecting until either
+    `max_batch_size` items are queued or `max_wait_ms` has passed, and hands
+    the whole batch to `batch_fn` (a blocking callable: list -> list of the
+    same length) on an executor so the event loop stays free. Up to
+    `max_concurrency` batches run at once (match it to the executor size).
+    """
+
+    def __init__(self, batch_fn, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS, executor=None, max_concurrency=1):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.executor = executor
+        self.max_concurrency = max(1, int(max_concurrency))
+
+        self._queue = None
+        self._worker = None
+        self._loop = None
+        self._slots = None
+
+        # Tuning metrics
+        self.batch_size_hist = Counter()
+        self.queue_depth_hist = Counter()
+        self.total_items = 0
+        self.total_batches = 0
+        self.max_queue_depth = 0
+        self.total_batch_seconds = 0.0
+        self.total_wait_seconds = 0.0
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        # Re-create the queue if we are on a new loop (e.g. test clients, reloads)
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, item):
+        """Queues one item and waits for its individual result."""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        depth = self._queue.qsize()
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        return await future
+
+    async def submit_many(self, items):
+        """Queues several items at once; results are returned in input order."""
+        return await asyncio.gather(*(self.submit(i) for i in items))
+
+    async def _collect(self):
+        first = await self._queue.get()
+        batch = [first]
+        deadline = self._loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Drain whatever is already waiting before sleeping on the queue
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            # Wait for a free executor slot first so items keep accumulating meanwhile
+            await self._slots.acquire()
+            batch = await self._collect()
+            self.queue_depth_hist[self._queue.qsize()] += 1
+            task = self._loop.create_task(self._dispatch(batch))
+            task.add_done_callback(lambda _: self._slots.release())
+
+    async def _dispatch(self, batch):
+        items = [b[0] for b in batch]
+        futures = [b[1] for b in batch]
+        started = time.perf_counter()
+
+        self.total_batches += 1
+        self.total_items += len(batch)
+        self.batch_size_hist[len(batch)] += 1
+        self.total_wait_seconds += sum(started - b[2] for b in batch)
+
+        try:
+            results = await self._loop.run_in_executor(self.executor, self.batch_fn, items)
+            if len(results) != len(items):
+                raise RuntimeError(f"Batch function returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            for f in futures:
+                if not f.done():
+                    f.set_exception(e)
+            return
+        finally:
+            self.total_batch_seconds += time.perf_counter() - started
+
+        for f, r in zip(futures, results):
+            if not f.done():  # Caller may have disconnected
+                f.set_result(r)
+
+    def stats(self):
+        """Snapshot of queue and batch metrics for tuning."""
+        batches = self.total_batches or 1
+        items = self.total_items or 1
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_concurrency": self.max_concurrency,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "total_items": self.total_items,
+            "total_batches": self.total_batches,
+            "avg_batch_size": round(self.total_items / batches, 2),
+            "avg_batch_ms": round(self.total_batch_seconds / batches * 1000.0, 2),
+            "avg_queue_wait_ms": round(self.total_wait_seconds / items * 1000.0, 2),
+            "batch_size_histogram": {str(k): v for k, v in sorted(self.batch_size_hist.items())},
+            "queue_depth_histogram": {str(k): v for k, v in sorted(self.queue_depth_hist.items())},
+        }
@@ -1,8 +1,15 @@
 import sqlite3
+import numpy as np
 import pandas as pd
 import os
+import re
+import threading
+import contextvars
+from contextlib import contextmanager
 from datetime import datetime
 import json
+from core import forecast, snapshots, spatial, task_rules
+from core.read_cache import VersionedReadCache
 
 # Cloud-Friendly Configuration
 # Uses environment variable if set (for Cloud), otherwise defaults to local relative path
@@ -11,84 +18,497 @@ DEFAULT_DB_PATH = os.path.join(BASE_DIR, "data", "farm_data.db")
 
 DB_FILE = os.getenv("DB_PATH", DEFAULT_DB_PATH)
 
-def get_connection():
-    if not os.path.exists(DB_FILE):
-        print(f"⚠️ Warning: Database file not found at {DB_FILE}")
-    
-    conn = sqlite3.connect(DB_FILE)
-    # Enable Foreign Keys
-    conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
+# --- Farm Shards ---
+# Every farm is its own SQLite file (palms, history, surveys, tasks), so matching and
+# writes of one estate never touch another's. The default farm lives in DB_FILE.
+DEFAULT_FARM = os.getenv("DEFAULT_FARM", "main")
+FARMS_DIR = os.getenv("FARMS_DIR", os.path.join(BASE_DIR, "data", "farms"))  # <farm_id>.db per other farm
+
+PALM_MATCH_RADIUS = 20.0 # Pixel distance threshold to consider it the "same tree"
+HEALTH_HISTOGRAM_BINS = 10
+INFECTED_STD_FACTOR = 0.5 # dashboard "infected" = health below mean - factor * std of the survey
+SPATIAL_QUERY_LIMIT = int(os.getenv("SPATIAL_QUERY_LIMIT", "5000"))  # max palms per bbox/radius query
+SQL_IN_BATCH = 500 # ids per "IN (...)" lookup, well under SQLite's bound-parameter limit
+
+RTREE_ENABLED = False # set by init_db() once the R*Tree exists
+
+# --- Connection Pool Configuration ---
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))      # wait for the writer instead of failing
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "65536"))         # page cache per connection
+DB_MMAP_SIZE_MB = int(os.getenv("DB_MMAP_SIZE_MB", "256"))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))       # prepared statements kept per connection
+
+
+class ConnectionPool:
+    """
+    One long-lived SQLite connection per thread (FastAPI's threadpool and the
+    inference workers are reused, so each pays the connect + pragma cost once).
+    Connections run in WAL mode with synchronous=NORMAL so a long write from
+    save_scan_results no longer blocks readers, wait up to DB_BUSY_TIMEOUT_MS for
+    the write lock, and keep DB_STATEMENT_CACHE prepared statements warm.
+    """
+
+    def __init__(self, path, busy_timeout_ms=DB_BUSY_TIMEOUT_MS, cache_size_kb=DB_CACHE_SIZE_KB,
+                 mmap_size_mb=DB_MMAP_SIZE_MB, statement_cache=DB_STATEMENT_CACHE):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size_mb = mmap_size_mb
+        self.statement_cache = statement_cache
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns = {}  # thread ident -> connection, so close_all() can reach every thread's connection
+
+        self.opened = 0
+        self.closed = 0
+        self.checkouts = 0
+        self.reuses = 0
+        self.rollbacks = 0
+
+    def _open(self):
+        if not os.path.exists(self.path):
+            print(f"⚠️ Warning: Database file not found at {self.path}")
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000.0, check_same_thread=False,
+                               cached_statements=self.statement_cache)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)};")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)};")  # negative = KiB, not pages
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size_mb) * 1024 * 1024};")
+        conn.execute("PRAGMA temp_store = MEMORY;")
+        # Enable Foreign Keys
+        conn.execute("PRAGMA foreign_keys = ON;")
+        return conn
+
+    def _prune_dead_threads(self):
+        alive = {t.ident for t in threading.enumerate()}
+        for ident in [i for i in self._conns if i not in alive]:
+            self._conns.pop(ident).close()
+            self.closed += 1
+
+    def _thread_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self.reuses += 1
+            return conn
+        conn = self._open()
+        with self._lock:
+            self._prune_dead_threads()
+            self._conns[threading.get_ident()] = conn
+            self.opened += 1
+        self._local.conn = conn
+        self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Yields this thread's connection. The outermost block commits on success and
+        rolls back on error; nested blocks share that transaction. Never close() it.
+        """
+        conn = self._thread_connection()
+        self.checkouts += 1
+        self._local.depth += 1
+        try:
+            yield conn
+            if self._local.depth == 1 and conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if self._local.depth == 1 and conn.in_transaction:
+                conn.rollback()
+                self.rollbacks += 1
+            raise
+        finally:
+            self._local.depth -= 1
+
+    def close_all(self):
+        """Closes every pooled connection (threads reconnect lazily on next use)."""
+        with self._lock:
+            for conn in self._conns.values():
+                conn.close()
+                self.closed += 1
+            self._conns.clear()
+        self._local = threading.local()
+
+    def stats(self):
+        with self._lock:
+            self._prune_dead_threads()
+            open_conns = len(self._conns)
+        return {
+            "path": self.path,
+            "open_connections": open_conns,
+            "opened": self.opened,
+            "closed": self.closed,
+            "checkouts": self.checkouts,
+            "reuses": self.reuses,
+            "rollbacks": self.rollbacks,
+            "busy_timeout_ms": self.busy_timeout_ms,
+            "cache_size_kb": self.cache_size_kb,
+            "mmap_size_mb": self.mmap_size_mb,
+            "statement_cache": self.statement_cache,
+        }
+
+
+class UnknownFarm(LookupError):
+    pass
+
+_FARM_ID = re.compile(r"^[a-z0-9][a-z0-9_-]{0,62}$")
+# Farm the current request / worker operates on; connection() routes through it
+current_farm = contextvars.ContextVar("current_farm", default=DEFAULT_FARM)
+
+pool = ConnectionPool(DB_FILE)  # the default farm's shard
+_pools = {DEFAULT_FARM: pool}
+_pools_lock = threading.Lock()
+
+def valid_farm_id(farm_id):
+    return isinstance(farm_id, str) and bool(_FARM_ID.match(farm_id))
+
+def farm_db_path(farm_id):
+    if farm_id == DEFAULT_FARM:
+        return DB_FILE
+    if not valid_farm_id(farm_id):
+        raise UnknownFarm(farm_id)
+    return os.path.join(FARMS_DIR, f"{farm_id}.db")
+
+def farm_exists(farm_id):
+    return farm_id == DEFAULT_FARM or (valid_farm_id(farm_id) and os.path.exists(farm_db_path(farm_id)))
+
+def list_farms():
+    farms = {DEFAULT_FARM}
+    if os.path.isdir(FARMS_DIR):
+        farms.update(f[:-3] for f in os.listdir(FARMS_DIR) if f.endswith(".db") and valid_farm_id(f[:-3]))
+    return sorted(farms)
+
+def create_farm(farm_id):
+    """Creates (idempotently) and initializes the shard of `farm_id`."""
+    if not valid_farm_id(farm_id):
+        raise ValueError("farm id must be 1-63 chars of a-z, 0-9, '_' or '-'")
+    path = farm_db_path(farm_id)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f: pass
+    pool_for(farm_id)
+    return farm_id
+
+def pool_for(farm_id=None):
+    """Connection pool of a farm's shard (default: the current farm), schema ensured on first use."""
+    farm_id = farm_id or current_farm.get()
+    p = _pools.get(farm_id)
+    if p is not None:
+        return p
+    with _pools_lock:
+        p = _pools.get(farm_id)
+        if p is None:
+            if not farm_exists(farm_id):
+                raise UnknownFarm(farm_id)
+            p = ConnectionPool(farm_db_path(farm_id))
+            init_db(p)
+            _pools[farm_id] = p
+    return p
 
-def init_db():
+@contextmanager
+def use_farm(farm_id):
+    """Routes every core.db call in this block (and this context) to `farm_id`'s shard."""
+    pool_for(farm_id)
+    token = current_farm.set(farm_id)
+    try:
+        yield farm_id
+    finally:
+        current_farm.reset(token)
+
+def connection():
+    """Pooled connection context manager; all DB access should go through this."""
+    return pool_for().connection()
+
+def pool_stats():
+    with _pools_lock:
+        pools = dict(_pools)
+    return {farm_id: p.stats() for farm_id, p in sorted(pools.items())}
+
+def close_all_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for p in pools:
+        p.close_all()
+
+def _init_rtree(c):
+    """
+    Creates the R*Tree over tracked_palms lat/lon plus the triggers that keep it in
+    sync, and backfills palms inserted before it existed. Sets RTREE_ENABLED; when
+    SQLite is built without the rtree module, spatial queries fall back to a scan.
+    """
+    global RTREE_ENABLED
+    try:
+        c.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS tracked_palms_rtree USING rtree(
+            id, min_lat, max_lat, min_lon, max_lon
+        )""")
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ Warning: R*Tree unavailable ({e}), spatial queries will scan tracked_palms")
+        RTREE_ENABLED = False
+        return
+
+    c.execute("""CREATE TRIGGER IF NOT EXISTS tracked_palms_rtree_insert
+        AFTER INSERT ON tracked_palms
+        WHEN NEW.lat IS NOT NULL AND NEW.lon IS NOT NULL
+        BEGIN
+            INSERT OR REPLACE INTO tracked_palms_rtree VALUES (NEW.id, NEW.lat, NEW.lat, NEW.lon, NEW.lon);
+        END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS tracked_palms_rtree_update
+        AFTER UPDATE OF id, lat, lon ON tracked_palms
+        BEGIN
+            DELETE FROM tracked_palms_rtree WHERE id = OLD.id;
+            INSERT OR REPLACE INTO tracked_palms_rtree
+                SELECT NEW.id, NEW.lat, NEW.lat, NEW.lon, NEW.lon
+                WHERE NEW.lat IS NOT NULL AND NEW.lon IS NOT NULL;
+        END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS tracked_palms_rtree_delete
+        AFTER DELETE ON tracked_palms
+        BEGIN
+            DELETE FROM tracked_palms_rtree WHERE id = OLD.id;
+        END""")
+    c.execute("""
+        INSERT INTO tracked_palms_rtree
+        SELECT id, lat, lat, lon, lon FROM tracked_palms
+        WHERE lat IS NOT NULL AND lon IS NOT NULL
+        AND id NOT IN (SELECT id FROM tracked_palms_rtree)
+    """)
+    RTREE_ENABLED = True
+
+# --- Schema Migrations ---
+# (version, description, up statements, down statements), applied in version order.
+# Append only: a released migration is never edited or renumbered. Every statement
+# must be idempotent so a half-finished startup elsewhere can't break the next one.
+MIGRATIONS = [
+    (1, "index palm_history by survey",
+     ["CREATE INDEX IF NOT EXISTS idx_palm_history_survey ON palm_history(survey_id)"],
+     ["DROP INDEX IF EXISTS idx_palm_history_survey"]),
+    (2, "index palm_history by tracked palm",
+     ["CREATE INDEX IF NOT EXISTS idx_palm_history_palm_survey ON palm_history(tracked_palm_id, survey_id)"],
+     ["DROP INDEX IF EXISTS idx_palm_history_palm_survey"]),
+    (3, "index open tasks by palm",
+     ["CREATE INDEX IF NOT EXISTS idx_tasks_status_palm ON tasks(status, target_palm_id)"],
+     ["DROP INDEX IF EXISTS idx_tasks_status_palm"]),
+    (4, "per-survey aggregates written with each scan",
+     ["""CREATE TABLE IF NOT EXISTS survey_aggregates (
+         survey_id INTEGER PRIMARY KEY,
+         palm_count INTEGER,
+         health_sum REAL,
+         health_sq_sum REAL,
+         health_min REAL,
+         health_max REAL,
+         infected_threshold REAL,
+         infected_count INTEGER,
+         health_histogram TEXT, -- JSON counts over HEALTH_HISTOGRAM_BINS equal bins of [0, 100]
+         yield_sum REAL,
+         updated_at TEXT,
+         FOREIGN KEY(survey_id) REFERENCES surveys(id)
+     )"""],
+     ["DROP TABLE IF EXISTS survey_aggregates"]),
+    (5, "compacted palm history beyond the retention window",
+     ["""CREATE TABLE IF NOT EXISTS palm_history_summary (
+         tracked_palm_id INTEGER PRIMARY KEY,
+         samples INTEGER,
+         health_sum REAL,
+         health_sq_sum REAL,
+         yield_sum REAL,
+         first_scan_date TEXT,
+         last_scan_date TEXT,
+         FOREIGN KEY(tracked_palm_id) REFERENCES tracked_palms(id)
+     )""",
+      """CREATE TABLE IF NOT EXISTS archived_surveys (
+         survey_id INTEGER PRIMARY KEY,
+         status TEXT, -- 'compacting', 'archived'
+         archive_path TEXT,
+         rows INTEGER,
+         archive_bytes INTEGER,
+         archived_at TEXT,
+         FOREIGN KEY(survey_id) REFERENCES surveys(id)
+     )"""],
+     ["DROP TABLE IF EXISTS archived_surveys", "DROP TABLE IF EXISTS palm_history_summary"]),
+    (6, "partial index of open tasks for auto-task dedup",
+     ["CREATE INDEX IF NOT EXISTS idx_tasks_open_palm ON tasks(target_palm_id, task_type) WHERE status != 'Done'"],
+     ["DROP INDEX IF EXISTS idx_tasks_open_palm"]),
+    (7, "named sectors of a farm",
+     ["""CREATE TABLE IF NOT EXISTS sectors (
+         id INTEGER PRIMARY KEY AUTOINCREMENT,
+         name TEXT NOT NULL UNIQUE,
+         min_lat REAL,
+         min_lon REAL,
+         max_lat REAL,
+         max_lon REAL,
+         created_at TEXT
+     )"""],
+     ["DROP TABLE IF EXISTS sectors"]),
+    (8, "running sums behind the health forecast",
+     ["""CREATE TABLE IF NOT EXISTS forecast_state (
+         id INTEGER PRIMARY KEY CHECK (id = 1),
+         origin INTEGER, -- ordinal day x is counted from
+         n INTEGER,
+         sum_x REAL,
+         sum_y REAL,
+         sum_xy REAL,
+         sum_xx REAL,
+         level REAL, -- Holt smoothing
+         trend REAL,
+         level_x REAL,
+         max_x REAL,
+         last_survey_id INTEGER,
+         last_x REAL,
+         last_avg_health REAL,
+         last_total_palms INTEGER,
+         monthly TEXT, -- JSON [n, sum_x, sum_y] per calendar month
+         updated_at TEXT
+     )"""],
+     ["DROP TABLE IF EXISTS forecast_state"]),
+    (9, "data version shared by every process using the farm",
+     ["""CREATE TABLE IF NOT EXISTS data_version (
+         id INTEGER PRIMARY KEY CHECK (id = 1),
+         version INTEGER NOT NULL
+     )""",
+      "INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)"],
+     ["DROP TABLE IF EXISTS data_version"]),
+]
+
+# Tables whose contents can be recomputed (backfill-aggregates / rebuild-forecast), so
+# rolling back may drop them; any other non-empty table needs force=True to be dropped.
+DERIVED_TABLES = ("survey_aggregates", "forecast_state", "data_version")
+_DROP_TABLE = re.compile(r"DROP TABLE IF EXISTS (\w+)", re.IGNORECASE)
+
+def _check_drop(c, sql):
+    match = _DROP_TABLE.match(sql.strip())
+    if not match or match.group(1) in DERIVED_TABLES:
+        return
+    table = match.group(1)
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    if c.fetchone() is None:
+        return
+    c.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+    if c.fetchone()[0]:
+        raise ValueError(f"Rolling back would drop table '{table}', which holds data that cannot be rebuilt; "
+                         f"pass force=True (manage_db.py migrate --force) to drop it anyway")
+
+def schema_version(c):
+    c.execute("SELECT MAX(version) FROM schema_migrations")
+    return c.fetchone()[0] or 0
+
+def _migrate(c, target=None, force=False):
+    """
+    Moves the schema to `target` (default: latest) inside the caller's transaction,
+    running `up` steps in order or `down` steps in reverse. Returns the versions touched.
+    A `down` step that would drop a non-derived table with rows raises ValueError unless
+    `force`; the caller's transaction then rolls the whole move back.
+    """
+    c.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TEXT
+    )""")
+    latest = MIGRATIONS[-1][0] if MIGRATIONS else 0
+    target = latest if target is None else target
+    current = schema_version(c)
+    touched = []
+    if target >= current:
+        for version, description, up, _ in MIGRATIONS:
+            if current < version <= target:
+                for sql in up:
+                    c.execute(sql)
+                c.execute("INSERT OR IGNORE INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)",
+                          (version, description, datetime.utcnow().isoformat()))
+                touched.append(version)
+    else:
+        for version, description, _, down in reversed(MIGRATIONS):
+            if target < version <= current:
+                for sql in down:
+                    if not force:
+                        _check_drop(c, sql)
+                    c.execute(sql)
+                c.execute("DELETE FROM schema_migrations WHERE version = ?", (version,))
+                touched.append(version)
+    if touched:
+        # Refresh planner statistics so the new indexes are actually picked
+        c.execute("ANALYZE")
+        print(f"DB schema {current} -> {target} (migrations {touched})")
+    return touched
+
+def migrate(target=None, force=False):
+    """Applies (or rolls back to `target`) schema migrations in one transaction."""
+    with connection() as conn:
+        return _migrate(conn.cursor(), target, force)
+
+def init_db(shard=None):
     """
     Initializes the database with the Enterprise Schema if tables don't exist.
+    shard: pool to initialize directly (a farm being registered), default the current farm's.
     """
-    conn = get_connection()
-    c = conn.cursor()
+    with (shard or pool_for()).connection() as conn:
+        c = conn.cursor()
     
-    # 1. Surveys (Existing)
-    c.execute("""CREATE TABLE IF NOT EXISTS surveys (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        scan_date TEXT,
-        total_palms INTEGER,
-        avg_health REAL
-    )""")
+        # 1. Surveys (Existing)
+        c.execute("""CREATE TABLE IF NOT EXISTS surveys (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scan_date TEXT,
+            total_palms INTEGER,
+            avg_health REAL
+        )""")
     
-    # 2. Tracked Palms (Single Source of Truth for Physical Trees)
-    # lat/lon are the unique identifiers for a physical tree
-    c.execute("""CREATE TABLE IF NOT EXISTS tracked_palms (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        custom_name TEXT,
-        lat REAL,
-        lon REAL,
-        planted_date TEXT,
-        last_health_score REAL,
-        status TEXT DEFAULT 'Healthy'
-    )""")
+        # 2. Tracked Palms (Single Source of Truth for Physical Trees)
+        # lat/lon are the unique identifiers for a physical tree
+        c.execute("""CREATE TABLE IF NOT EXISTS tracked_palms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            custom_name TEXT,
+            lat REAL,
+            lon REAL,
+            planted_date TEXT,
+            last_health_score REAL,
+            status TEXT DEFAULT 'Healthy'
+        )""")
     
-    # 3. Palm History (Links specific scans to specific tracked trees)
-    c.execute("""CREATE TABLE IF NOT EXISTS palm_history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        tracked_palm_id INTEGER,
-        survey_id INTEGER,
-        health_score REAL,
-        yield_est REAL,
-        img_path TEXT,
-        FOREIGN KEY(tracked_palm_id) REFERENCES tracked_palms(id),
-        FOREIGN KEY(survey_id) REFERENCES surveys(id)
-    )""")
+        # 3. Palm History (Links specific scans to specific tracked trees)
+        c.execute("""CREATE TABLE IF NOT EXISTS palm_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tracked_palm_id INTEGER,
+            survey_id INTEGER,
+            health_score REAL,
+            yield_est REAL,
+            img_path TEXT,
+            FOREIGN KEY(tracked_palm_id) REFERENCES tracked_palms(id),
+            FOREIGN KEY(survey_id) REFERENCES surveys(id)
+        )""")
     
-    # 4. Financial Config (Real User Data)
-    c.execute("""CREATE TABLE IF NOT EXISTS financial_config (
-        key TEXT PRIMARY KEY,
-        value REAL,
-        updated_at TEXT
-    )""")
+        # 4. Financial Config (Real User Data)
+        c.execute("""CREATE TABLE IF NOT EXISTS financial_config (
+            key TEXT PRIMARY KEY,
+            value REAL,
+            updated_at TEXT
+        )""")
     
-    # 5. Tasks (Automated Ops)
-    c.execute("""CREATE TABLE IF NOT EXISTS tasks (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        task_type TEXT, -- 'Fertilize', 'PestControl', 'Harvest'
-        target_palm_id INTEGER,
-        priority TEXT DEFAULT 'Medium',
-        status TEXT DEFAULT 'Pending', -- 'Pending', 'In Progress', 'Done'
-        assigned_to TEXT,
-        created_at TEXT,
-        FOREIGN KEY(target_palm_id) REFERENCES tracked_palms(id)
-    )""")
+        # 5. Tasks (Automated Ops)
+        c.execute("""CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_type TEXT, -- 'Fertilize', 'PestControl', 'Harvest'
+            target_palm_id INTEGER,
+            priority TEXT DEFAULT 'Medium',
+            status TEXT DEFAULT 'Pending', -- 'Pending', 'In Progress', 'Done'
+            assigned_to TEXT,
+            created_at TEXT,
+            FOREIGN KEY(target_palm_id) REFERENCES tracked_palms(id)
+        )""")
+    
+        # 6. Spatial Index over tracked_palms (kept in sync by triggers)
+        _init_rtree(c)
     
-    # Pre-populate Financial Config if empty
-    c.execute("SELECT count(*) FROM financial_config")
-    if c.fetchone()[0] == 0:
-        c.executemany("INSERT INTO financial_config (key, value, updated_at) VALUES (?, ?, ?)", [
-            ('oil_price_per_ton', 850.0, datetime.utcnow().isoformat()),
-            ('fertilizer_cost_per_kg', 1.5, datetime.utcnow().isoformat()),
-            ('labor_cost_per_hour', 12.0, datetime.utcnow().isoformat())
-        ])
-
-    conn.commit()
-    conn.close()
+        # 7. Versioned schema changes on top of the base tables
+        _migrate(c)
+    
+        # Pre-populate Financial Config if empty
+        c.execute("SELECT count(*) FROM financial_config")
+        if c.fetchone()[0] == 0:
+            c.executemany("INSERT INTO financial_config (key, value, updated_at) VALUES (?, ?, ?)", [
+                ('oil_price_per_ton', 850.0, datetime.utcnow().isoformat()),
+                ('fertilizer_cost_per_kg', 1.5, datetime.utcnow().isoformat()),
+                ('labor_cost_per_hour', 12.0, datetime.utcnow().isoformat())
+            ])
 
 # Initialize on module load (safe for dev)
 if not os.path.exists(DB_FILE) or os.path.getsize(DB_FILE) == 0:
@@ -100,47 +520,52 @@ if not os.path.exists(DB_FILE) or os.path.getsize(DB_FILE) == 0:
 init_db()
 
 def get_all_surveys_df():
-    conn = get_connection()
     try:
-        df = pd.read_sql_query("SELECT * FROM surveys ORDER BY id ASC", conn)
+        with connection() as conn:
+            df = pd.read_sql_query("SELECT * FROM surveys ORDER BY id ASC", conn)
     except Exception as e:
         print(f"DB Error: {e}")
         df = pd.DataFrame()
-    finally:
-        conn.close()
     return df
 
 def get_survey_history():
     """Returns clean list of all surveys for Reports page."""
-    conn = get_connection()
-    try:
+    with connection() as conn:
         c = conn.cursor()
         c.execute("SELECT id, scan_date, total_palms, avg_health FROM surveys ORDER BY id DESC")
         rows = c.fetchall()
         return [{"id": r[0], "date": r[1], "count": r[2], "health": r[3]} for r in rows]
-    finally:
-        conn.close()
 
-def get_latest_palms_df():
-    conn = get_connection()
-    try:
+# --- Latest Palms Read Cache ---
+# The farm's data version lives in its database and is bumped inside every write
+# transaction that changes palm history, so other workers, the ingest and manage_db
+# processes see each other's writes. With the latest survey id it keys the cached reads.
+
+def bump_data_version(c):
+    """Call inside the write transaction that changes palm history."""
+    c.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
+
+def data_version_key():
+    """(farm, latest survey id, data version): one indexed read."""
+    with connection() as conn:
         c = conn.cursor()
-        c.execute("SELECT MAX(id) FROM surveys")
+        c.execute("SELECT (SELECT MAX(id) FROM surveys), (SELECT version FROM data_version WHERE id = 1)")
         res = c.fetchone()
-        last_id = res[0] if res else None
-        
-        if last_id is None:
-            return pd.DataFrame()
-            
+    return (current_farm.get(), res[0], res[1] or 0)
+
+def _load_latest_palms(key):
+    last_id = key[1]
+    with connection() as conn:
+        c = conn.cursor()
         # Legacy support: if 'palms' table exists, use it, otherwise join new tables
         # For now, let's assume we are migrating.
         # Check if 'palms' table exists (legacy)
         c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='palms'")
         if c.fetchone():
-             df = pd.read_sql_query(f"SELECT * FROM palms WHERE survey_id = {last_id}", conn)
+             df = pd.read_sql_query("SELECT * FROM palms WHERE survey_id = ?", conn, params=(last_id,))
         else:
-             # Construct DF from new schema
-             query = f"""
+             # Construct DF from new schema (bound parameter so the prepared statement is reused)
+             query = """
                 SELECT 
                     ph.id as id,
                     ph.survey_id,
@@ -152,112 +577,731 @@ def get_latest_palms_df():
                     0.0 as growth_rate
                 FROM palm_history ph
                 JOIN tracked_palms tp ON ph.tracked_palm_id = tp.id
-                WHERE ph.survey_id = {last_id}
+                WHERE ph.survey_id = ?
              """
-             df = pd.read_sql_query(query, conn)
-             
-    except Exception:
-        df = pd.DataFrame()
-    finally:
-        conn.close()
-    return df
+             df = pd.read_sql_query(query, conn, params=(last_id,))
+    return {name: df[name].to_numpy() for name in df.columns}
 
-def save_scan_results(total_palms, avg_health, palm_data):
+_palms_caches = {}  # farm id -> VersionedReadCache, so dashboards of different farms don't evict each other
+
+def latest_palms_cache(farm_id=None):
+    farm_id = farm_id or current_farm.get()
+    cache = _palms_caches.get(farm_id)
+    if cache is None:
+        cache = _palms_caches.setdefault(farm_id, VersionedReadCache(_load_latest_palms))
+    return cache
+
+def latest_palms_cache_stats():
+    return {farm_id: cache.stats() for farm_id, cache in sorted(_palms_caches.items())}
+
+def get_latest_palms_columns():
     """
-    Saves a new survey.
-    Auto-Links found palms to 'tracked_palms' based on location.
-    palm_data: List of dicts with keys: x, y, area, health_score
+    Latest survey's palms as {column: read-only numpy array}, shared by every caller
+    until the next scan is saved ({} when there are no surveys).
     """
-    conn = get_connection()
+    key = data_version_key()
+    if key[1] is None:
+        return {}
+    return latest_palms_cache(key[0]).get(key)
+
+def get_latest_palms_df():
     try:
-        c = conn.cursor()
-        scan_date = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # 1. Insert Summary into surveys table
+        columns = get_latest_palms_columns()
+    except Exception:
+        return pd.DataFrame()
+    # Callers get their own frame; the cached arrays stay untouched
+    return pd.DataFrame(columns, copy=True)
+
+def _next_tracked_palm_id(c):
+    """Next AUTOINCREMENT id of tracked_palms (ids are assigned up front so inserts can be batched)."""
+    c.execute("SELECT seq FROM sqlite_sequence WHERE name = 'tracked_palms'")
+    row = c.fetchone()
+    seq = row[0] if row and row[0] else 0
+    c.execute("SELECT MAX(id) FROM tracked_palms")
+    max_id = c.fetchone()[0] or 0
+    return max(seq, max_id) + 1
+
+
+def _open_tasks(c, palm_ids):
+    """(target_palm_id, task_type) of every open task on `palm_ids` (partial index lookups)."""
+    palm_ids = list(palm_ids)
+    open_tasks = set()
+    for i in range(0, len(palm_ids), SQL_IN_BATCH):
+        batch = palm_ids[i:i + SQL_IN_BATCH]
+        c.execute(f"""SELECT target_palm_id, task_type FROM tasks
+                      WHERE status != 'Done' AND target_palm_id IN ({','.join('?' * len(batch))})""", batch)
+        open_tasks.update(c.fetchall())
+    return open_tasks
+
+def _generate_tasks(c, due, created_at):
+    """
+    Inserts the (palm_id, task_type, priority) tasks in `due` that have no open task
+    of the same type on that palm yet, as one batch. Returns the number created.
+    """
+    if not due:
+        return 0
+    open_tasks = _open_tasks(c, {palm_id for palm_id, _, _ in due})
+    rows = []
+    for palm_id, task_type, priority in due:
+        if (palm_id, task_type) not in open_tasks:
+            open_tasks.add((palm_id, task_type))
+            rows.append((task_type, palm_id, priority, 'Pending', created_at))
+    c.executemany("INSERT INTO tasks (task_type, target_palm_id, priority, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                  rows)
+    return len(rows)
+
+
+class SurveyWriter:
+    """
+    Writes one survey's detections: palm matching, tracked_palms / palm_history rows,
+    the survey aggregate and task generation. save_scan_results runs it in a single
+    transaction; bulk ingest calls add() once per chunk, each in its own transaction.
+    The grid index of tracked palms is built once per survey and only picks up palms
+    registered by other writers between chunks.
+    palm_data: List of dicts with keys: x, y, health_score and optionally yield_est
+    """
+
+    def __init__(self, scan_date=None, match_radius=PALM_MATCH_RADIUS):
+        self.scan_date = scan_date or datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        self.match_radius = float(match_radius)
+        self.survey_id = None
+        self.rows = 0
+        self.new_palms = 0
+        self._totals = None
+        self._index = None
+        self._seen_id = 0  # highest tracked_palms id already in the index
+        self._scores, self._yields = [], []
+        self._touched = {}  # palm id -> (health_score, yield_est) recorded by this survey
+        self.tasks_created = 0
+
+    def begin(self, c, total_palms=None, avg_health=None):
+        """Inserts the survey row. Totals left as None are filled in by finish()."""
+        if total_palms is not None and avg_health is not None:
+            self._totals = (total_palms, avg_health)
         c.execute("INSERT INTO surveys (scan_date, total_palms, avg_health) VALUES (?, ?, ?)",
-                  (scan_date, total_palms, avg_health))
-        survey_id = c.lastrowid
-        
-        # 2. Link Logic (Simple matching for now, assuming X/Y are stable-ish or dealing with static images)
+                  (self.scan_date, total_palms or 0, avg_health or 0.0))
+        self.survey_id = c.lastrowid
+        return self.survey_id
+
+    def _sync_index(self, c):
+        if self._index is None:
+            # Grid index over every tracked palm, read once per survey
+            c.execute("SELECT id, lat, lon FROM tracked_palms WHERE lat IS NOT NULL AND lon IS NOT NULL")
+            existing = c.fetchall()
+            self._index = spatial.GridIndex(
+                [r[0] for r in existing], [(r[1], r[2]) for r in existing], self.match_radius
+            )
+            self._seen_id = max((r[0] for r in existing), default=0)
+            return
+        # Palms other writers registered since the previous chunk
+        c.execute("""SELECT id, lat, lon FROM tracked_palms
+                     WHERE id > ? AND lat IS NOT NULL AND lon IS NOT NULL ORDER BY id""", (self._seen_id,))
+        for pid, lat, lon in c.fetchall():
+            self._index.add(pid, lat, lon)
+            self._seen_id = pid
+
+    def add(self, c, palm_data):
+        """Matches and records a batch of detections. Needs the write lock (BEGIN IMMEDIATE)."""
+        # Link Logic (Simple matching for now, assuming X/Y are stable-ish or dealing with static images)
         # Ideally X/Y should be converted to Lat/Lon before this function if real GPS.
         # For this stage, we assume X/Y ARE the unique location identifiers.
-        
-        THRESH = 20.0 # Pixel distance threshold to consider it the "same tree"
-        
-        for p in palm_data:
-            x, y = p['x'], p['y']
+        self._sync_index(c)
+        index = self._index
+        xy = np.array([(p['x'], p['y']) for p in palm_data], dtype=np.float64).reshape(-1, 2)
+        matched, _ = index.nearest(xy)
+
+        next_id = None
+        new_palms, updates, history = [], [], []
+        for p, (x, y), matched_id in zip(palm_data, xy.tolist(), matched.tolist()):
             h_score = float(p['health_score'])
-            
-            # Find closest existing tracked palm
-            c.execute("SELECT id, lat, lon FROM tracked_palms") 
-            existing = c.fetchall()
-            
-            matched_id = None
-            for pid, plat, plon in existing:
-                dist = ((plat - x)**2 + (plon - y)**2)**0.5
-                if dist < THRESH:
-                    matched_id = pid
-                    break
-            
+            if matched_id < 0:
+                # Palms registered earlier in this same survey can still absorb the detection
+                matched_id = index.nearest_added(x, y)
+
             if matched_id is None:
                 # Register new palm
-                c.execute("INSERT INTO tracked_palms (lat, lon, last_health_score, planted_date) VALUES (?, ?, ?, ?)",
-                          (x, y, h_score, scan_date))
-                matched_id = c.lastrowid
+                if next_id is None:
+                    next_id = _next_tracked_palm_id(c)
+                matched_id = next_id
+                next_id += 1
+                new_palms.append((matched_id, p['x'], p['y'], h_score, self.scan_date))
+                index.add(matched_id, x, y)
             else:
                 # Update existing palm status
-                c.execute("UPDATE tracked_palms SET last_health_score = ?, status = ? WHERE id = ?",
-                          (h_score, 'Infected' if h_score < 40 else 'Healthy', matched_id))
-            
+                updates.append((h_score, 'Infected' if h_score < 40 else 'Healthy', matched_id))
+
             # Record History
-            c.execute("""INSERT INTO palm_history 
-                (tracked_palm_id, survey_id, health_score, yield_est) 
-                VALUES (?, ?, ?, ?)""",
-                (matched_id, survey_id, h_score, h_score * 0.5)) # Dummy yield calc for now
+            y_est = p.get('yield_est')
+            y_est = h_score * 0.5 if y_est is None else float(y_est)  # Dummy yield calc for now
+            history.append((matched_id, self.survey_id, h_score, y_est))
+            self._touched[matched_id] = (h_score, y_est)
+
+        c.executemany("INSERT INTO tracked_palms (id, lat, lon, last_health_score, planted_date) VALUES (?, ?, ?, ?, ?)",
+                      new_palms)
+        c.executemany("UPDATE tracked_palms SET last_health_score = ?, status = ? WHERE id = ?", updates)
+        c.executemany("""INSERT INTO palm_history 
+            (tracked_palm_id, survey_id, health_score, yield_est) 
+            VALUES (?, ?, ?, ?)""", history)
+
+        if next_id is not None:
+            self._seen_id = max(self._seen_id, next_id - 1)
+        self.rows += len(history)
+        self.new_palms += len(new_palms)
+        self._scores.extend(h[2] for h in history)
+        self._yields.extend(h[3] for h in history)
+
+    def finish(self, c):
+        """Survey totals, dashboard aggregate, forecast state and task generation, in the caller's transaction."""
+        if self._totals is None:
+            avg_health = sum(self._scores) / len(self._scores) if self._scores else 0.0
+            c.execute("UPDATE surveys SET total_palms = ?, avg_health = ? WHERE id = ?",
+                      (self.rows, avg_health, self.survey_id))
+            total_palms = self.rows
+        else:
+            total_palms, avg_health = self._totals
+
+        # Dashboard aggregates and forecast state for this survey
+        _write_survey_aggregate(c, self.survey_id, self._scores, self._yields)
+        _update_forecast_state(c, self.survey_id, self.scan_date, avg_health, total_palms)
+
+        # Auto-Generate Tasks for the palms this survey touched
+        self.tasks_created = _generate_tasks(c, task_rules.evaluate(self._touched), self.scan_date)
+        return self.survey_id
+
+    def report(self):
+        return {"survey_id": self.survey_id, "scan_date": self.scan_date,
+                "rows": self.rows, "new_palms": self.new_palms, "tasks_created": self.tasks_created}
+
+
+def _snapshot_after_commit(survey_id):
+    # Columnar copy for analytics; the survey is already committed, so failures only log
+    try:
+        write_survey_snapshot(survey_id)
+    except Exception as e:
+        print(f"Snapshot Error (survey {survey_id}): {e}")
+
+def save_scan_results(total_palms, avg_health, palm_data):
+    """
+    Saves a new survey.
+    Auto-Links found palms to 'tracked_palms' based on location.
+    palm_data: List of dicts with keys: x, y, area, health_score
+    """
+    with connection() as conn:
+        try:
+            c = conn.cursor()
+            # Take the write lock now: new palm ids are assigned before they are inserted
+            c.execute("BEGIN IMMEDIATE")
+            survey = SurveyWriter()
+            survey_id = survey.begin(c, total_palms, avg_health)
+            survey.add(c, palm_data)
+            survey.finish(c)
+            bump_data_version(c)
+
+            conn.commit()
+            print(f"Saved Scan {survey_id}: {total_palms} palms processed.")
         
-        # 3. Auto-Generate Tasks for Infected Palms
+        except Exception as e:
+            print(f"Error saving to DB: {e}")
+            conn.rollback()
+            return None
+
+    _snapshot_after_commit(survey_id)
+    return survey_id
+
+def ingest_survey_chunk(survey, palm_data):
+    """
+    Commits one chunk of a bulk-ingested survey (SurveyWriter), inserting the survey
+    row with the first chunk. Readers see the survey grow chunk by chunk.
+    """
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        if survey.survey_id is None:
+            survey.begin(c)
+        survey.add(c, palm_data)
+        bump_data_version(c)
+
+def finish_ingested_survey(survey):
+    """Final transaction of a bulk-ingested survey: totals, aggregate, tasks, snapshot."""
+    if survey.survey_id is None:
+        return None
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        survey.finish(c)
+        bump_data_version(c)
+    print(f"Ingested Survey {survey.survey_id}: {survey.rows} palms ({survey.new_palms} new).")
+    _snapshot_after_commit(survey.survey_id)
+    return survey.survey_id
+
+# --- Spatial Queries ---
+
+_PALM_COLUMNS = "tp.id, tp.custom_name, tp.lat, tp.lon, tp.last_health_score, tp.status"
+
+def _palm_row(r):
+    return {"id": r[0], "custom_name": r[1], "lat": r[2], "lon": r[3], "health": r[4], "status": r[5]}
+
+def _bbox_rows(c, min_lat, min_lon, max_lat, max_lon, extra_where="", extra_params=(), order_by="tp.id", order_params=(), limit=None,
+               columns=_PALM_COLUMNS):
+    # The R*Tree stores 32-bit floats rounded outward, so the exact lat/lon test is repeated on tracked_palms
+    exact = "tp.lat BETWEEN ? AND ? AND tp.lon BETWEEN ? AND ?"
+    params = [min_lat, max_lat, min_lon, max_lon]
+    if RTREE_ENABLED:
+        query = f"""
+            SELECT {columns} FROM tracked_palms_rtree r
+            JOIN tracked_palms tp ON tp.id = r.id
+            WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+            AND {exact}"""
+        params = [min_lat, max_lat, min_lon, max_lon] + params
+    else:
+        query = f"SELECT {columns} FROM tracked_palms tp WHERE {exact}"
+    c.execute(f"{query} {extra_where} ORDER BY {order_by} LIMIT ?",
+              params + list(extra_params) + list(order_params) + [limit or SPATIAL_QUERY_LIMIT])
+    return c.fetchall()
+
+def get_palms_in_bbox(min_lat, min_lon, max_lat, max_lon, limit=None):
+    """Tracked palms whose lat/lon fall inside the box (inclusive), ordered by id."""
+    with connection() as conn:
+        rows = _bbox_rows(conn.cursor(), min_lat, min_lon, max_lat, max_lon, limit=limit)
+    return [_palm_row(r) for r in rows]
+
+def get_palms_near(lat, lon, radius, limit=None, exclude_id=None):
+    """
+    Tracked palms within `radius` of (lat, lon), nearest first, each with a `distance`.
+    Distance is planar in lat/lon units (pixels while lat/lon hold image coordinates).
+    """
+    dist2 = "((tp.lat - ?) * (tp.lat - ?) + (tp.lon - ?) * (tp.lon - ?))"
+    extra_where = f"AND {dist2} <= ?"
+    extra_params = [lat, lat, lon, lon, radius * radius]
+    if exclude_id is not None:
+        extra_where += " AND tp.id != ?"
+        extra_params.append(exclude_id)
+    with connection() as conn:
+        rows = _bbox_rows(conn.cursor(), lat - radius, lon - radius, lat + radius, lon + radius,
+                          extra_where, extra_params, f"{dist2}, tp.id", [lat, lat, lon, lon], limit)
+    palms = [_palm_row(r) for r in rows]
+    for p in palms:
+        p["distance"] = float(np.hypot(p["lat"] - lat, p["lon"] - lon))
+    return palms
+
+def get_palm_location(palm_id):
+    """(lat, lon) of a tracked palm, or None if it does not exist or has no position."""
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT lat, lon FROM tracked_palms WHERE id = ? AND lat IS NOT NULL AND lon IS NOT NULL", (palm_id,))
+        row = c.fetchone()
+    return row
+
+def get_palms_by_ids(palm_ids):
+    """{id: palm} for the tracked palms among `palm_ids` (batched primary key lookups)."""
+    palm_ids = [int(i) for i in palm_ids]
+    palms = {}
+    with connection() as conn:
+        c = conn.cursor()
+        for i in range(0, len(palm_ids), SQL_IN_BATCH):
+            batch = palm_ids[i:i + SQL_IN_BATCH]
+            c.execute(f"SELECT {_PALM_COLUMNS} FROM tracked_palms tp WHERE tp.id IN ({','.join('?' * len(batch))})", batch)
+            palms.update((r[0], _palm_row(r)) for r in c.fetchall())
+    return palms
+
+# --- Bulk Palm Histories ---
+
+PALM_FIELDS = ("custom_name", "lat", "lon", "health", "status")
+HISTORY_FIELDS = ("survey_id", "scan_date", "health_score", "yield_est")
+_PALM_FIELD_SQL = {"custom_name": "tp.custom_name", "lat": "tp.lat", "lon": "tp.lon",
+                   "health": "tp.last_health_score", "status": "tp.status"}
+_HISTORY_FIELD_SQL = {"survey_id": "ph.survey_id", "scan_date": "s.scan_date",
+                      "health_score": "ph.health_score", "yield_est": "ph.yield_est"}
+
+def get_palm_histories(palm_ids=None, status=None, min_health=None, max_health=None,
+                       min_survey=None, max_survey=None, after=0, limit=500,
+                       palm_fields=PALM_FIELDS, history_fields=HISTORY_FIELDS):
+    """
+    One page of palms (id > `after`, ascending, at most `limit`) matching the filters,
+    with their history as columns. History rows of palm i are
+    history[f][offsets[i]:offsets[i + 1]], ordered by survey. Two indexed queries per
+    page; `palm_ids` travel as one JSON parameter, so the list can be any length.
+    Returns (palms, history, offsets, next_after); next_after is None on the last page.
+    """
+    where, params = ["tp.id > ?"], [after]
+    if palm_ids is not None:
+        where.append("tp.id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps([int(i) for i in palm_ids]))
+    if status is not None:
+        where.append("tp.status = ?")
+        params.append(status)
+    if min_health is not None:
+        where.append("tp.last_health_score >= ?")
+        params.append(min_health)
+    if max_health is not None:
+        where.append("tp.last_health_score <= ?")
+        params.append(max_health)
+    palm_cols = ["tp.id"] + [_PALM_FIELD_SQL[f] for f in palm_fields]
+
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT {', '.join(palm_cols)} FROM tracked_palms tp WHERE {' AND '.join(where)} ORDER BY tp.id LIMIT ?",
+                  params + [limit + 1])
+        rows = c.fetchall()
+        next_after = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_after = rows[-1][0]
+        cols = list(zip(*rows)) if rows else [()] * len(palm_cols)
+        palms = {name: list(col) for name, col in zip(("id",) + tuple(palm_fields), cols)}
+
+        history = {f: [] for f in history_fields}
+        counts = dict.fromkeys(palms["id"], 0)
+        if rows:
+            h_where, h_params = ["ph.tracked_palm_id IN (SELECT value FROM json_each(?))"], [json.dumps(palms["id"])]
+            if min_survey is not None:
+                h_where.append("ph.survey_id >= ?")
+                h_params.append(min_survey)
+            if max_survey is not None:
+                h_where.append("ph.survey_id <= ?")
+                h_params.append(max_survey)
+            join = "JOIN surveys s ON s.id = ph.survey_id" if "scan_date" in history_fields else ""
+            h_cols = ["ph.tracked_palm_id"] + [_HISTORY_FIELD_SQL[f] for f in history_fields]
+            c.execute(f"""SELECT {', '.join(h_cols)} FROM palm_history ph {join}
+                          WHERE {' AND '.join(h_where)} ORDER BY ph.tracked_palm_id, ph.survey_id, ph.id""", h_params)
+            for r in c.fetchall():
+                counts[r[0]] += 1
+                for f, v in zip(history_fields, r[1:]):
+                    history[f].append(v)
+
+    offsets = [0]
+    for palm_id in palms["id"]:
+        offsets.append(offsets[-1] + counts[palm_id])
+    return palms, history, offsets, next_after
+
+# --- Sectors ---
+# Named lat/lon boxes inside a farm; a palm belongs to every sector whose box contains it.
+
+def _sector_row(r):
+    return {"id": r[0], "name": r[1], "min_lat": r[2], "min_lon": r[3], "max_lat": r[4], "max_lon": r[5]}
+
+def list_sectors():
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, name, min_lat, min_lon, max_lat, max_lon FROM sectors ORDER BY name")
+        return [_sector_row(r) for r in c.fetchall()]
+
+def save_sector(name, min_lat, min_lon, max_lat, max_lon):
+    """Creates or moves the sector called `name`; returns it."""
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("""INSERT INTO sectors (name, min_lat, min_lon, max_lat, max_lon, created_at) VALUES (?, ?, ?, ?, ?, ?)
+                     ON CONFLICT(name) DO UPDATE SET min_lat = excluded.min_lat, min_lon = excluded.min_lon,
+                                                     max_lat = excluded.max_lat, max_lon = excluded.max_lon""",
+                  (name, min_lat, min_lon, max_lat, max_lon, datetime.utcnow().isoformat()))
+        c.execute("SELECT id, name, min_lat, min_lon, max_lat, max_lon FROM sectors WHERE name = ?", (name,))
+        return _sector_row(c.fetchone())
+
+def delete_sector(name):
+    with connection() as conn:
+        return conn.execute("DELETE FROM sectors WHERE name = ?", (name,)).rowcount > 0
+
+def get_sector_stats():
+    """Per sector: palm count, mean last health and infected palms, read through the spatial index."""
+    sectors = list_sectors()
+    with connection() as conn:
+        c = conn.cursor()
+        for sector in sectors:
+            count, mean, infected = _bbox_rows(
+                c, sector["min_lat"], sector["min_lon"], sector["max_lat"], sector["max_lon"],
+                order_by="1", limit=1,
+                columns="COUNT(*), AVG(tp.last_health_score), SUM(tp.status = 'Infected')",
+            )[0]
+            sector.update(palms=count, avg_health=mean or 0.0, infected=infected or 0)
+    return sectors
+
+def sector_label():
+    """Human-readable location of the current farm for reports."""
+    names = [s["name"] for s in list_sectors()]
+    farm_id = current_farm.get()
+    return f"{farm_id}: {', '.join(names)}" if names else f"{farm_id} (all sectors)"
+
+# --- Columnar Snapshots ---
+
+def farm_snapshot_dir(farm_id=None):
+    """Snapshot directory of a farm: SNAPSHOT_DIR for the default farm, a subdirectory otherwise."""
+    farm_id = farm_id or current_farm.get()
+    return None if farm_id == DEFAULT_FARM else os.path.join(snapshots.SNAPSHOT_DIR, farm_id)
+
+def write_survey_snapshot(survey_id):
+    """Writes survey `survey_id` (palm_history joined to tracked_palms) as a Parquet snapshot."""
+    if not snapshots.SNAPSHOTS_ENABLED:
+        return None
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, scan_date, total_palms, avg_health FROM surveys WHERE id = ?", (survey_id,))
+        row = c.fetchone()
+        if row is None:
+            return None
         c.execute("""
-            INSERT INTO tasks (task_type, target_palm_id, priority, status, created_at)
-            SELECT 'Pest Control', id, 'High', 'Pending', ?
-            FROM tracked_palms
-            WHERE last_health_score < 40
-            AND id NOT IN (SELECT target_palm_id FROM tasks WHERE status != 'Done')
-        """, (scan_date,))
-            
-        conn.commit()
-        print(f"Saved Scan {survey_id}: {total_palms} palms processed.")
-        return survey_id
-        
-    except Exception as e:
-        print(f"Error saving to DB: {e}")
-        conn.rollback()
+            SELECT ph.tracked_palm_id, tp.lat, tp.lon, ph.health_score, ph.yield_est
+            FROM palm_history ph
+            JOIN tracked_palms tp ON ph.tracked_palm_id = tp.id
+            WHERE ph.survey_id = ?
+            ORDER BY ph.id
+        """, (survey_id,))
+        rows = c.fetchall()
+    survey = {"survey_id": row[0], "scan_date": row[1], "total_palms": row[2], "avg_health": row[3]}
+    names = ("tracked_palm_id", "lat", "lon", "health_score", "yield_est")
+    cols = list(zip(*rows)) if rows else [()] * len(names)
+    # NULL floats become NaN rather than failing the cast
+    palms = {name: [np.nan if v is None else v for v in col] for name, col in zip(names, cols)}
+    return snapshots.write_survey_snapshot(survey, palms, farm_snapshot_dir())
+
+def backfill_survey_snapshots():
+    """Writes snapshots for every survey that has none. Returns the number written."""
+    if not snapshots.SNAPSHOTS_ENABLED:
+        return 0
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id FROM surveys ORDER BY id")
+        survey_ids = [r[0] for r in c.fetchall()]
+    written = 0
+    for survey_id in survey_ids:
+        if not snapshots.has_snapshot(survey_id, farm_snapshot_dir()):
+            write_survey_snapshot(survey_id)
+            written += 1
+    return written
+
+def get_survey_issue_counts(issue_below=50.0):
+    """
+    {survey_id: (palms, palms below `issue_below`)}. Read from the two needed columns of
+    the Parquet snapshots when every survey has one (they keep history that retention
+    archived out of SQLite), otherwise from palm_history, where archived surveys are absent.
+    """
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id FROM surveys ORDER BY id")
+        survey_ids = [r[0] for r in c.fetchall()]
+        snapshot_dir = farm_snapshot_dir()
+        if not (snapshots.SNAPSHOTS_ENABLED and survey_ids
+                and all(snapshots.has_snapshot(s, snapshot_dir) for s in survey_ids)):
+            c.execute("""
+                SELECT survey_id, COUNT(*), COALESCE(SUM(health_score < ?), 0)
+                FROM palm_history GROUP BY survey_id
+            """, (issue_below,))
+            return {r[0]: (r[1], r[2]) for r in c.fetchall()}
+
+    table = snapshots.load_palms(columns=["survey_id", "health_score"], survey_ids=survey_ids,
+                                 snapshot_dir=snapshot_dir)
+    ids = table["survey_id"].to_numpy()
+    health = table["health_score"].to_numpy(zero_copy_only=False)
+    counts = dict.fromkeys(survey_ids, (0, 0))  # surveys without palms have empty files
+    names, idx = np.unique(ids, return_inverse=True)
+    palms = np.bincount(idx, minlength=len(names))
+    issues = np.bincount(idx, weights=(health < issue_below), minlength=len(names))
+    for survey_id, n, k in zip(names, palms, issues):
+        counts[int(survey_id)] = (int(n), int(k))
+    return counts
+
+# --- Survey Aggregates ---
+
+def survey_aggregate(health_scores, yields):
+    """Counts, moments, dynamic infected count, histogram and yield of one survey's palms."""
+    scores = np.asarray(health_scores, dtype=np.float64)
+    n = len(scores)
+    mean = scores.mean() if n else 0.0
+    threshold = mean - INFECTED_STD_FACTOR * scores.std() if n else 0.0
+    hist, _ = np.histogram(np.clip(scores, 0, 100), bins=HEALTH_HISTOGRAM_BINS, range=(0, 100))
+    return {
+        "palm_count": n,
+        "health_sum": float(scores.sum()),
+        "health_sq_sum": float(np.square(scores).sum()),
+        "health_min": float(scores.min()) if n else None,
+        "health_max": float(scores.max()) if n else None,
+        "infected_threshold": float(threshold),
+        "infected_count": int((scores < threshold).sum()),
+        "health_histogram": hist.tolist(),
+        "yield_sum": float(np.sum(np.asarray(yields, dtype=np.float64))),
+    }
+
+def _write_survey_aggregate(c, survey_id, health_scores, yields):
+    agg = survey_aggregate(health_scores, yields)
+    c.execute("""INSERT OR REPLACE INTO survey_aggregates
+        (survey_id, palm_count, health_sum, health_sq_sum, health_min, health_max,
+         infected_threshold, infected_count, health_histogram, yield_sum, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (survey_id, agg["palm_count"], agg["health_sum"], agg["health_sq_sum"], agg["health_min"],
+         agg["health_max"], agg["infected_threshold"], agg["infected_count"],
+         json.dumps(agg["health_histogram"]), agg["yield_sum"], datetime.utcnow().isoformat()))
+    return agg
+
+def _rebuild_survey_aggregate(c, survey_id):
+    c.execute("SELECT health_score, yield_est FROM palm_history WHERE survey_id = ?", (survey_id,))
+    rows = c.fetchall()
+    return _write_survey_aggregate(c, survey_id, [r[0] or 0.0 for r in rows], [r[1] or 0.0 for r in rows])
+
+def backfill_survey_aggregates(rebuild=False):
+    """
+    Computes survey_aggregates rows from palm_history for surveys that have none
+    (every survey with rebuild=True). Returns the number of surveys written.
+    """
+    with connection() as conn:
+        c = conn.cursor()
+        if rebuild:
+            c.execute("SELECT id FROM surveys ORDER BY id")
+        else:
+            c.execute("""SELECT id FROM surveys
+                WHERE id NOT IN (SELECT survey_id FROM survey_aggregates) ORDER BY id""")
+        survey_ids = [r[0] for r in c.fetchall()]
+        for survey_id in survey_ids:
+            _rebuild_survey_aggregate(c, survey_id)
+    return len(survey_ids)
+
+def get_latest_survey_stats():
+    """
+    Latest survey joined with its aggregate row (computed on the spot if the survey
+    predates the table), or None when there are no surveys.
+    """
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT s.id, s.scan_date, s.avg_health, a.palm_count, a.health_sum, a.health_sq_sum,
+                   a.health_min, a.health_max, a.infected_threshold, a.infected_count,
+                   a.health_histogram, a.yield_sum
+            FROM surveys s LEFT JOIN survey_aggregates a ON a.survey_id = s.id
+            ORDER BY s.id DESC LIMIT 1
+        """)
+        row = c.fetchone()
+        if row is None:
+            return None
+        survey_id, scan_date, avg_health = row[:3]
+        if row[3] is None:
+            agg = _rebuild_survey_aggregate(c, survey_id)
+        else:
+            agg = dict(zip(("palm_count", "health_sum", "health_sq_sum", "health_min", "health_max",
+                            "infected_threshold", "infected_count"), row[3:10]))
+            agg["health_histogram"] = json.loads(row[10]) if row[10] else []
+            agg["yield_sum"] = row[11]
+    n = agg["palm_count"] or 0
+    mean = agg["health_sum"] / n if n else 0.0
+    var = max(0.0, agg["health_sq_sum"] / n - mean * mean) if n else 0.0
+    return {
+        "survey_id": survey_id,
+        "scan_date": scan_date,
+        "avg_health": avg_health,
+        "health_mean": mean,
+        "health_std": float(np.sqrt(var)),
+        **agg,
+    }
+
+# --- Forecast State ---
+
+def _load_forecast_state(c):
+    c.execute(f"SELECT {', '.join(forecast.STATE_FIELDS)}, monthly FROM forecast_state WHERE id = 1")
+    row = c.fetchone()
+    if row is None:
         return None
-    finally:
-        conn.close()
+    state = dict(zip(forecast.STATE_FIELDS, row[:-1]))
+    state["monthly"] = json.loads(row[-1]) if row[-1] else forecast.empty_state()["monthly"]
+    return state
+
+def _save_forecast_state(c, state):
+    fields = forecast.STATE_FIELDS + ("monthly", "updated_at")
+    values = [state[f] for f in forecast.STATE_FIELDS] + [json.dumps(state["monthly"]), datetime.utcnow().isoformat()]
+    c.execute(f"INSERT OR REPLACE INTO forecast_state (id, {', '.join(fields)}) VALUES (1, {', '.join('?' * len(fields))})",
+              values)
+
+def _update_forecast_state(c, survey_id, scan_date, avg_health, total_palms):
+    state = _load_forecast_state(c)
+    if state is None:
+        # First use on a database with history: fold in every earlier survey once
+        state = _rebuild_forecast_state(c, exclude_id=survey_id)
+    forecast.update(state, survey_id, scan_date, avg_health, total_palms)
+    _save_forecast_state(c, state)
+
+def _rebuild_forecast_state(c, exclude_id=None):
+    state = forecast.empty_state()
+    c.execute("SELECT id, scan_date, avg_health, total_palms FROM surveys WHERE id != ? ORDER BY scan_date, id",
+              (-1 if exclude_id is None else exclude_id,))
+    for survey_id, scan_date, avg_health, total_palms in c.fetchall():
+        try:
+            forecast.update(state, survey_id, scan_date, avg_health, total_palms)
+        except (TypeError, ValueError):
+            continue  # unparseable scan_date, skipped like the old pandas path did
+    return state
+
+def rebuild_forecast_state():
+    """Recomputes the forecast state from every survey. Returns the number of surveys folded in."""
+    with connection() as conn:
+        c = conn.cursor()
+        # Under the write lock, so no survey is saved between the rebuild's read and its write
+        c.execute("BEGIN IMMEDIATE")
+        state = _rebuild_forecast_state(c)
+        _save_forecast_state(c, state)
+    return state["n"]
+
+def get_forecast_state():
+    """The farm's forecast state (one row read), built from the surveys table on first use."""
+    with connection() as conn:
+        c = conn.cursor()
+        state = _load_forecast_state(c)
+        if state is None:
+            # A survey saved meanwhile may have built the state already (and a rebuild read
+            # before that save would drop it), so re-check under the write lock
+            c.execute("BEGIN IMMEDIATE")
+            state = _load_forecast_state(c)
+            if state is None:
+                state = _rebuild_forecast_state(c)
+                _save_forecast_state(c, state)
+    return state
+
+def get_farm_rollup():
+    """
+    Cross-farm totals built from each shard's latest survey aggregate (no palm rows
+    are read), plus the per-farm figures they were summed from.
+    """
+    farms, palms, health_sum, health_sq_sum, infected, yield_sum = [], 0, 0.0, 0.0, 0, 0.0
+    for farm_id in list_farms():
+        with use_farm(farm_id):
+            latest = get_latest_survey_stats()
+        if latest is None:
+            farms.append({"farm_id": farm_id, "survey_id": None, "scan_date": None, "palms": 0,
+                          "health_mean": 0.0, "infected": 0, "yield_sum": 0.0})
+            continue
+        n = latest["palm_count"] or 0
+        palms += n
+        health_sum += latest["health_sum"] or 0.0
+        health_sq_sum += latest["health_sq_sum"] or 0.0
+        infected += latest["infected_count"] or 0
+        yield_sum += latest["yield_sum"] or 0.0
+        farms.append({"farm_id": farm_id, "survey_id": latest["survey_id"], "scan_date": latest["scan_date"],
+                      "palms": n, "health_mean": latest["health_mean"], "infected": latest["infected_count"] or 0,
+                      "yield_sum": latest["yield_sum"] or 0.0})
+    mean = health_sum / palms if palms else 0.0
+    var = max(0.0, health_sq_sum / palms - mean * mean) if palms else 0.0
+    return {
+        "farms": farms,
+        "palms": palms,
+        "health_mean": mean,
+        "health_std": float(np.sqrt(var)),
+        "infected": infected,
+        "yield_sum": yield_sum,
+    }
 
 def get_financial_metrics():
     """Returns calculated P&L based on real config."""
-    conn = get_connection()
-    c = conn.cursor()
+    with connection() as conn:
+        c = conn.cursor()
     
-    # Get config
-    c.execute("SELECT key, value FROM financial_config")
-    config = dict(c.fetchall())
+        # Get config
+        c.execute("SELECT key, value FROM financial_config")
+        config = dict(c.fetchall())
     
-    oil_price = config.get('oil_price_per_ton', 800)
+        oil_price = config.get('oil_price_per_ton', 800)
     
     # Get Yield Projections
-    # Sum of latest yield_est for all active palms
-    c.execute("""
-        SELECT SUM(yield_est) FROM palm_history 
-        WHERE survey_id = (SELECT MAX(id) FROM surveys)
-    """)
-    res = c.fetchone()
-    total_yield = res[0] if res and res[0] else 0
+    # Sum of latest yield_est for all active palms, kept in survey_aggregates
+    latest = get_latest_survey_stats()
+    total_yield = latest["yield_sum"] if latest and latest["yield_sum"] else 0
     
     revenue = total_yield * oil_price
     
-    conn.close()
     return {
         "revenue": revenue,
         "yield_tons": total_yield,
@@ -0,0 +1,126 @@
+import os
+from datetime import date
+
+import numpy as np
+
+# --- Configuration ---
+FORECAST_STEP_DAYS = 30           # spacing of forecast points ("months")
+FORECAST_ALPHA = float(os.getenv("FORECAST_ALPHA", "0.5"))  # Holt level smoothing
+FORECAST_BETA = float(os.getenv("FORECAST_BETA", "0.3"))    # Holt trend smoothing
+TREND_THRESHOLD = 0.05            # health points per day that count as Improving / Declining
+
+METHODS = ("linear", "seasonal", "holt")
+
+# Incremental state, one per farm shard (persisted by core.db in forecast_state).
+# x is days since `origin` (the first survey's day), which keeps the sums small.
+STATE_FIELDS = ("origin", "n", "sum_x", "sum_y", "sum_xy", "sum_xx",
+                "level", "trend", "level_x", "max_x",
+                "last_survey_id", "last_x", "last_avg_health", "last_total_palms")
+
+def empty_state():
+    state = dict.fromkeys(STATE_FIELDS)
+    state.update(n=0, sum_x=0.0, sum_y=0.0, sum_xy=0.0, sum_xx=0.0)
+    state["monthly"] = [[0, 0.0, 0.0] for _ in range(12)]  # per calendar month: n, sum_x, sum_y
+    return state
+
+def day_ordinal(scan_date):
+    """Proleptic ordinal of a 'YYYY-MM-DD...' scan_date (day precision, like the old pandas path)."""
+    return date.fromisoformat(str(scan_date)[:10]).toordinal()
+
+def update(state, survey_id, scan_date, avg_health, total_palms):
+    """Folds one saved survey into `state` (in place) in O(1). Returns state."""
+    ordinal = day_ordinal(scan_date)
+    if state["origin"] is None:
+        state["origin"] = ordinal
+    x = float(ordinal - state["origin"])
+    y = float(avg_health or 0.0)
+
+    state["n"] += 1
+    state["sum_x"] += x
+    state["sum_y"] += y
+    state["sum_xy"] += x * y
+    state["sum_xx"] += x * x
+    month = state["monthly"][date.fromordinal(ordinal).month - 1]
+    month[0] += 1
+    month[1] += x
+    month[2] += y
+    state["max_x"] = x if state["max_x"] is None else max(state["max_x"], x)
+
+    # Holt's linear smoothing over irregular intervals; it only moves forward in time
+    if state["level"] is None:
+        state["level"], state["trend"], state["level_x"] = y, 0.0, x
+    elif x > state["level_x"]:
+        dt = x - state["level_x"]
+        level = FORECAST_ALPHA * y + (1 - FORECAST_ALPHA) * (state["level"] + state["trend"] * dt)
+        state["trend"] = FORECAST_BETA * (level - state["level"]) / dt + (1 - FORECAST_BETA) * state["trend"]
+        state["level"], state["level_x"] = level, x
+
+    if state["last_survey_id"] is None or survey_id > state["last_survey_id"]:
+        state.update(last_survey_id=survey_id, last_x=x, last_avg_health=y, last_total_palms=total_palms or 0)
+    return state
+
+def linear_fit(state):
+    """(intercept, slope per day) of the least-squares line, from the running sums."""
+    n = state["n"]
+    if n == 0:
+        return 0.0, 0.0
+    denom = n * state["sum_xx"] - state["sum_x"] ** 2
+    slope = (n * state["sum_xy"] - state["sum_x"] * state["sum_y"]) / denom if denom > 1e-9 else 0.0
+    return (state["sum_y"] - slope * state["sum_x"]) / n, slope
+
+def _seasonal_offsets(state, intercept, slope):
+    # Mean residual of each calendar month against the current line (0 for unseen months)
+    offsets = np.zeros(12)
+    for m, (n, sum_x, sum_y) in enumerate(state["monthly"]):
+        if n:
+            offsets[m] = sum_y / n - (intercept + slope * sum_x / n)
+    return offsets
+
+def predict(state, months, method="linear"):
+    """
+    Closed-form forecast `months` steps of FORECAST_STEP_DAYS past the latest scan.
+    Returns dates ('YYYY-MM-DD'), health values and the slope (per day) behind the
+    trend label; None when fewer than two surveys have been folded in.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}")
+    if state["n"] < 2:
+        return None
+
+    steps = np.arange(1, months + 1) * FORECAST_STEP_DAYS
+    future_x = state["max_x"] + steps
+    days = np.datetime64(date.fromordinal(state["origin"]), "D") + future_x.astype(np.int64)
+
+    if method == "holt":
+        slope = state["trend"]
+        health = state["level"] + slope * (future_x - state["level_x"])
+    else:
+        intercept, slope = linear_fit(state)
+        health = intercept + slope * future_x
+        if method == "seasonal":
+            month_idx = days.astype("datetime64[M]").astype(np.int64) % 12
+            health = health + _seasonal_offsets(state, intercept, slope)[month_idx]
+
+    return {
+        "dates": np.datetime_as_string(days, unit="D").tolist(),
+        "health": health,
+        "slope": float(slope),
+    }
+
+def flat(state, months):
+    """Stable projection from the latest survey (or 50% health today when there is none)."""
+    if state["n"]:
+        last = np.datetime64(date.fromordinal(state["origin"] + int(state["last_x"])), "D")
+        base = state["last_avg_health"]
+    else:
+        last = np.datetime64(date.today(), "D")
+        base = 50.0
+    days = last + np.arange(1, months + 1) * FORECAST_STEP_DAYS
+    return {"dates": np.datetime_as_string(days, unit="D").tolist(), "health": np.full(months, float(base)), "slope": 0.0}
+
+def trend_label(slope):
+    if slope > TREND_THRESHOLD:
+        return "Improving"
+    if slope < -TREND_THRESHOLD:
+        return "Declining"
+    return "Stable"
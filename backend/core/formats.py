@@ -0,0 +1,75 @@
+import base64
+import json
+import uuid
+import numpy as np
+import cv2
+
+# --- Mask Encodings ---
+
+def mask_to_rle(mask):
+    """
+    Uncompressed run-length encoding of a binary mask in row-major order.
+    `counts` alternates background/foreground runs and always starts with background
+    (a leading 0 means the first pixel is foreground).
+    """
+    h, w = mask.shape[:2]
+    flat = (mask.reshape(-1) > 0).astype(np.int8)
+    if flat.size == 0:
+        return {"size": [h, w], "order": "row-major", "counts": []}
+    bounds = np.flatnonzero(np.diff(flat)) + 1
+    counts = np.diff(np.concatenate(([0], bounds, [flat.size])))
+    if flat[0]:
+        counts = np.concatenate(([0], counts))
+    return {"size": [h, w], "order": "row-major", "counts": counts.tolist()}
+
+def rle_to_mask(rle):
+    """Inverse of mask_to_rle -> uint8 mask with 0/255 values."""
+    h, w = rle["size"]
+    counts = np.asarray(rle["counts"], dtype=np.int64)
+    values = np.zeros(len(counts), dtype=np.uint8)
+    values[1::2] = 255
+    return np.repeat(values, counts).reshape(h, w)
+
+def mask_to_polygons(mask, epsilon=1.0):
+    """Outer crown outlines as flat [x0, y0, x1, y1, ...] lists (simplified by `epsilon` px)."""
+    contours, _ = cv2.findContours((mask > 0).astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    polygons = []
+    for cnt in contours:
+        if epsilon > 0:
+            cnt = cv2.approxPolyDP(cnt, epsilon, True)
+        polygons.append(cnt.reshape(-1).tolist())
+    return polygons
+
+def encode_png(mask):
+    _, buf = cv2.imencode('.png', mask)
+    return buf.tobytes()
+
+def encode_jpeg(image_rgb):
+    _, buf = cv2.imencode('.jpg', cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR))
+    return buf.tobytes()
+
+def b64(data):
+    return base64.b64encode(data).decode('utf-8')
+
+# --- Multipart ---
+
+def multipart_mixed(parts):
+    """
+    Builds a multipart/mixed body from (name, content_type, bytes) parts.
+    Returns (body, content_type header value).
+    """
+    boundary = uuid.uuid4().hex
+    chunks = []
+    for name, content_type, data in parts:
+        if not isinstance(data, (bytes, bytearray)):
+            data = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        chunks.append(
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Disposition: inline; name=\"{name}\"\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n".encode("utf-8")
+        )
+        chunks.append(bytes(data))
+        chunks.append(b"\r\n")
+    chunks.append(f"--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(chunks), f"multipart/mixed; boundary={boundary}"
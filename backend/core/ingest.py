@@ -0,0 +1,190 @@
+import csv
+import json
+import math
+import os
+from datetime import datetime, timezone
+
+from core import db
+
+# --- Configuration ---
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "20000"))        # rows per committed transaction
+INGEST_MAX_LINE_BYTES = int(os.getenv("INGEST_MAX_LINE_BYTES", "65536"))
+
+FORMATS = ("ndjson", "csv")
+_SURVEY_KEYS = ("survey", "survey_key")
+_YIELD_KEYS = ("yield_est", "yield")
+
+
+class IngestError(ValueError):
+    """Malformed input; `line` is the 1-based line of the body it was found on."""
+
+    def __init__(self, message, line=None):
+        super().__init__(message if line is None else f"line {line}: {message}")
+        self.line = line
+
+
+def format_for(content_type):
+    """Body format from a Content-Type header, or None."""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json"):
+        return "ndjson"
+    if content_type in ("text/csv", "application/csv"):
+        return "csv"
+    return None
+
+def _number(record, key, line):
+    value = record.get(key)
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise IngestError(f"'{key}' must be a number, got {value!r}", line) from None
+    if not math.isfinite(value):
+        raise IngestError(f"'{key}' must be finite", line)
+    return value
+
+def scan_date_of(value, line=None):
+    """ISO date/time (any offset) as the naive UTC 'YYYY-MM-DD HH:MM:SS' the surveys table uses."""
+    if value in (None, ""):
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise IngestError(f"scan_date must be an ISO date/time, got {value!r}", line) from None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+def _detection(record, line):
+    """(survey key, scan_date, palm dict) from one parsed record."""
+    if "x" in record and "y" in record:
+        x, y = _number(record, "x", line), _number(record, "y", line)
+    elif "lat" in record and "lon" in record:
+        x, y = _number(record, "lat", line), _number(record, "lon", line)
+    else:
+        raise IngestError("needs x/y or lat/lon", line)
+    palm = {"x": x, "y": y, "health_score": _number(record, "health_score", line)}
+    for key in _YIELD_KEYS:
+        if record.get(key) not in (None, ""):
+            palm["yield_est"] = _number(record, key, line)
+            break
+    survey = next((str(record[k]) for k in _SURVEY_KEYS if record.get(k) not in (None, "")), None)
+    return survey, scan_date_of(record.get("scan_date"), line), palm
+
+
+class StreamParser:
+    """
+    Incremental NDJSON / CSV parser: feed() takes raw body chunks as they arrive and
+    returns the detections of every complete line, so the body is never buffered
+    whole. CSV needs a header line; quoted fields may not span lines.
+    """
+
+    def __init__(self, fmt):
+        if fmt not in FORMATS:
+            raise IngestError(f"unsupported format {fmt!r}; use one of {', '.join(FORMATS)}")
+        self.fmt = fmt
+        self.lines = 0
+        self._tail = b""
+        self._header = None
+
+    def feed(self, chunk):
+        data = self._tail + chunk
+        cut = data.rfind(b"\n")
+        if cut < 0:
+            if len(data) > INGEST_MAX_LINE_BYTES:
+                raise IngestError(f"line longer than {INGEST_MAX_LINE_BYTES} bytes", self.lines + 1)
+            self._tail = data
+            return []
+        self._tail = data[cut + 1:]
+        return self._parse(data[:cut].split(b"\n"))
+
+    def close(self):
+        tail, self._tail = self._tail, b""
+        return self._parse([tail]) if tail.strip() else []
+
+    def _parse(self, lines):
+        rows = []
+        if self.fmt == "ndjson":
+            for raw in lines:
+                self.lines += 1
+                if not raw.strip():
+                    continue
+                try:
+                    record = json.loads(raw)
+                except ValueError as e:
+                    raise IngestError(f"invalid JSON ({e})", self.lines) from None
+                if not isinstance(record, dict):
+                    raise IngestError("expected a JSON object", self.lines)
+                rows.append(_detection(record, self.lines))
+            return rows
+
+        try:
+            text = [raw.decode("utf-8-sig" if self.lines == 0 else "utf-8") for raw in lines]
+        except UnicodeDecodeError as e:
+            raise IngestError(f"invalid UTF-8 ({e})", self.lines + 1) from None
+        for fields in csv.reader(text):
+            self.lines += 1
+            if not fields or not any(f.strip() for f in fields):
+                continue
+            if self._header is None:
+                self._header = [f.strip().lower() for f in fields]
+                continue
+            if len(fields) != len(self._header):
+                raise IngestError(f"expected {len(self._header)} fields, got {len(fields)}", self.lines)
+            rows.append(_detection(dict(zip(self._header, fields)), self.lines))
+        return rows
+
+
+class BulkIngest:
+    """
+    Writes parsed detections as surveys, one SurveyWriter per run of rows sharing a
+    survey key (rows without one form a single survey). Every write() call commits
+    its chunk; a survey is finished (totals, aggregate, tasks, snapshot) when the next
+    one starts or on close(). write() and close() must run on the DB writer thread.
+    """
+
+    def __init__(self, scan_date=None, match_radius=db.PALM_MATCH_RADIUS):
+        self.scan_date = scan_date_of(scan_date)
+        self.match_radius = match_radius
+        self.rows = 0
+        self._current = None
+        self._current_key = None
+        self._finished = []
+        self._seen_keys = set()
+
+    def _start(self, key, scan_date):
+        self._finish_current()
+        if key in self._seen_keys:
+            raise IngestError(f"rows of survey {key!r} must be contiguous")
+        self._seen_keys.add(key)
+        self._current = db.SurveyWriter(scan_date=scan_date or self.scan_date, match_radius=self.match_radius)
+        self._current_key = key
+
+    def _finish_current(self):
+        if self._current is not None:
+            db.finish_ingested_survey(self._current)
+            self._finished.append((self._current_key, self._current))
+            self._current = None
+
+    def write(self, rows):
+        start = 0
+        while start < len(rows):
+            key = rows[start][0]
+            end = start
+            while end < len(rows) and rows[end][0] == key:
+                end += 1
+            if self._current is None or key != self._current_key:
+                self._start(key, rows[start][1])
+            for offset in range(start, end, INGEST_CHUNK_ROWS):
+                db.ingest_survey_chunk(self._current, [r[2] for r in rows[offset:min(end, offset + INGEST_CHUNK_ROWS)]])
+            self.rows += end - start
+            start = end
+
+    def close(self):
+        self._finish_current()
+        return self.report()
+
+    def report(self):
+        surveys = [dict(s.report(), key=k) for k, s in self._finished]
+        if self._current is not None:
+            surveys.append(dict(self._current.report(), key=self._current_key, finished=False))
+        return {"rows": self.rows, "surveys": surveys}
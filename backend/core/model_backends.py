@@ -0,0 +1,152 @@
+import hashlib
+import os
+import numpy as np
+import torch
+import segmentation_models_pytorch as smp
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+BACKENDS = ("eager", "torchscript", "onnx")
+QUANTIZATIONS = ("none", "dynamic", "static")  # INT8 artifacts exist for ONNX only (export_model.py)
+
+def build_unet():
+    """The palm segmentation architecture (RGB + zero alpha in, 1 logit channel out)."""
+    return smp.Unet(encoder_name="efficientnet-b3", in_channels=4, classes=1, encoder_weights=None)
+
+def load_eager(model_path, device='cpu'):
+    model = build_unet()
+    state_dict = torch.load(model_path, map_location=device)
+    model.load_state_dict(state_dict)
+    # Older encoders use a custom autograd Swish that cannot be traced/exported
+    if hasattr(model.encoder, 'set_swish'):
+        model.encoder.set_swish(memory_efficient=False)
+    model.to(device)
+    model.eval()
+    return model
+
+def artifact_path(model_path, backend, quantization="none"):
+    """
+    Where the export command writes (and get_model() looks for) an artifact:
+    best_model.pth -> best_model.torchscript.pt / best_model.onnx / best_model.int8-static.onnx
+    """
+    stem = os.path.splitext(model_path)[0]
+    if backend == "eager":
+        return model_path
+    quant = "" if quantization in (None, "none") else f".int8-{quantization}"
+    ext = ".torchscript.pt" if backend == "torchscript" else ".onnx"
+    return f"{stem}{quant}{ext}"
+
+def model_version(model_path, backend="eager", quantization="none"):
+    """Cheap identity of the artifact that would be served (changes when the file is replaced)."""
+    path = artifact_path(model_path, backend, quantization)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return f"{backend}-{quantization}-missing"
+    digest = hashlib.sha1(f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}".encode()).hexdigest()[:12]
+    return f"{backend}-{quantization}-{digest}"
+
+
+class OnnxRunner:
+    """ONNX Runtime session with the same call signature as the torch model (tensor in, logits tensor out)."""
+
+    def __init__(self, path, threads=0):
+        if ort is None:
+            raise ImportError("onnxruntime is not installed. Please install 'onnxruntime'.")
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, input_tensor):
+        x = input_tensor.detach().cpu().numpy().astype(np.float32, copy=False)
+        logits = self.session.run(None, {self.input_name: x})[0]
+        return torch.from_numpy(logits)
+
+    def eval(self):
+        return self
+
+
+def load_backend(model_path, backend="eager", quantization="none", device='cpu', threads=0):
+    """Loads the requested runtime. All backends are callable as model(NCHW tensor) -> logits tensor."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}' (expected one of {', '.join(BACKENDS)})")
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}' (expected one of {', '.join(QUANTIZATIONS)})")
+    if quantization != "none" and backend != "onnx":
+        raise ValueError(f"INT8 quantization ('{quantization}') is only supported with the onnx backend, "
+                         f"not {backend}; set INFER_BACKEND=onnx or INFER_QUANT=none")
+    if backend == "eager":
+        return load_eager(model_path, device)
+
+    path = artifact_path(model_path, backend, quantization)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{backend} artifact not found at {path}. Run export_model.py first.")
+    if backend == "torchscript":
+        model = torch.jit.load(path, map_location=device)
+        model.eval()
+        return model
+    return OnnxRunner(path, threads=threads)
+
+# --- Export ---
+
+def export_torchscript(model, path, img_size=512):
+    example = torch.zeros(1, 4, img_size, img_size)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+        traced = torch.jit.freeze(traced)
+    traced.save(path)
+    return path
+
+def export_onnx(model, path, img_size=512, opset=17):
+    example = torch.zeros(1, 4, img_size, img_size)
+    kwargs = dict(
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset,
+    )
+    try:
+        torch.onnx.export(model, example, path, dynamo=False, **kwargs)
+    except TypeError:  # torch < 2.5 has no `dynamo` switch
+        torch.onnx.export(model, example, path, **kwargs)
+    return path
+
+def quantize_onnx(fp32_path, out_path, mode, calibration_batches=None):
+    """
+    INT8 quantization with onnxruntime. `dynamic` quantizes weights only;
+    `static` also calibrates activations on `calibration_batches` (list of NCHW float32 arrays).
+    """
+    from onnxruntime import quantization as q
+
+    if mode == "dynamic":
+        q.quantize_dynamic(fp32_path, out_path, weight_type=q.QuantType.QInt8)
+        return out_path
+
+    class _Reader(q.CalibrationDataReader):
+        def __init__(self, batches):
+            self.it = iter({"input": b} for b in batches)
+
+        def get_next(self):
+            return next(self.it, None)
+
+    q.quantize_static(
+        fp32_path, out_path, _Reader(calibration_batches or []),
+        quant_format=q.QuantFormat.QDQ,
+        activation_type=q.QuantType.QUInt8,
+        weight_type=q.QuantType.QInt8,
+        per_channel=True,
+    )
+    return out_path
+
+def mask_iou(a, b):
+    """IoU of two boolean masks (1.0 when both are empty)."""
+    union = np.logical_or(a, b).sum()
+    if union == 0:
+        return 1.0
+    return float(np.logical_and(a, b).sum() / union)
@@ -1,38 +1,338 @@
 import requests
+from requests.adapters import HTTPAdapter
 import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime
 
 # Configuration (defaults from old app or env vars)
 # In production, use environment variables!
 TG_TOKEN = os.getenv("TG_TOKEN", "8547357116:AAHn643JaXRWsvA6t7XjegyGswanx-R20U8")
 TG_CHAT_ID = os.getenv("TG_CHAT_ID", "636689846")
 
+# Direct IP for api.telegram.org to bypass DNS issues
+# IP: 149.154.167.220 is a common Telegram API endpoint
+TELEGRAM_IP = "149.154.167.220"
+# Override (e.g. http://127.0.0.1:8081 for a local fake) to talk to another endpoint
+TG_API_URL = os.getenv("TG_API_URL", f"https://{TELEGRAM_IP}")
+
+# --- Outbox Configuration ---
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # points to backend/
+OUTBOX_PATH = os.getenv("NOTIFY_OUTBOX_PATH", os.path.join(BASE_DIR, "data", "notifications_outbox.db"))
+NOTIFY_COALESCE_SECONDS = float(os.getenv("NOTIFY_COALESCE_SECONDS", "3"))  # gather bursts into one digest
+NOTIFY_RATE_PER_MINUTE = float(os.getenv("NOTIFY_RATE_PER_MINUTE", "20"))   # Telegram group limit
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "8"))
+NOTIFY_BACKOFF_BASE = float(os.getenv("NOTIFY_BACKOFF_BASE", "2"))          # seconds, doubles per attempt
+NOTIFY_BACKOFF_MAX = float(os.getenv("NOTIFY_BACKOFF_MAX", "300"))
+TELEGRAM_MAX_CHARS = 4096
+
+def make_session(pool_size=4):
+    """Keep-alive HTTP session shared by all Telegram calls."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+_session = make_session()
+
+def _endpoint(api_url, token):
+    base_url = f"{api_url}/bot{token}"
+    # Host header is only needed when calling Telegram by IP
+    headers = {"Host": "api.telegram.org"} if TELEGRAM_IP in api_url else {}
+    return base_url, headers
+
 def send_telegram_alert(message: str, image_path: str = None):
     """
     Sends a text message (and optional image) to the configured Telegram chat.
+    Blocking; request handlers should use enqueue_alert() instead.
     """
     if not TG_TOKEN or not TG_CHAT_ID:
         print("Telegram Config Missing")
         return False, "Missing Config"
 
-    # Direct IP for api.telegram.org to bypass DNS issues
-    # IP: 149.154.167.220 is a common Telegram API endpoint
-    TELEGRAM_IP = "149.154.167.220"
-    base_url = f"https://{TELEGRAM_IP}/bot{TG_TOKEN}"
-    headers = {"Host": "api.telegram.org"}
+    base_url, headers = _endpoint(TG_API_URL, TG_TOKEN)
 
     try:
         # Send Text
         payload = {"chat_id": TG_CHAT_ID, "text": message}
-        requests.post(f"{base_url}/sendMessage", json=payload, headers=headers, verify=False, timeout=5)
-        
+        _session.post(f"{base_url}/sendMessage", json=payload, headers=headers, verify=False, timeout=5)
+
         # Send Image if provided
         if image_path and os.path.exists(image_path):
             with open(image_path, 'rb') as img_file:
                 files = {'photo': img_file}
                 data = {'chat_id': TG_CHAT_ID}
-                requests.post(f"{base_url}/sendPhoto", data=data, files=files, headers=headers, verify=False, timeout=10)
-                
+                _session.post(f"{base_url}/sendPhoto", data=data, files=files, headers=headers, verify=False, timeout=10)
+
         return True, "Message sent successfully"
     except Exception as e:
         print(f"Telegram Notification Failed: {e}")
         return False, f"Error: {str(e)}"
+
+# --- Outbox ---
+
+class RetryLater(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1.0, rate_per_minute / 4.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self):
+        """Seconds until one token is available (0 if available now)."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+    def take(self):
+        self.tokens -= 1
+
+
+class NotificationOutbox:
+    """
+    Persistent SQLite outbox for Telegram alerts, drained by a background worker.
+
+    enqueue() only inserts a row and wakes the worker. The worker waits
+    NOTIFY_COALESCE_SECONDS so bursts can pile up, folds pending text alerts into
+    digest messages, sends them over a pooled keep-alive session under a
+    token-bucket rate limit, and reschedules failures with exponential backoff
+    (honouring Telegram's 429 retry_after). Rows survive restarts.
+    """
+
+    def __init__(self, path=OUTBOX_PATH, api_url=TG_API_URL, token=TG_TOKEN, chat_id=TG_CHAT_ID, session=None,
+                 coalesce_seconds=NOTIFY_COALESCE_SECONDS, rate_per_minute=NOTIFY_RATE_PER_MINUTE,
+                 max_attempts=NOTIFY_MAX_ATTEMPTS, verify=False):
+        self.path = path
+        self.api_url = api_url
+        self.token = token
+        self.chat_id = chat_id
+        self.session = session or make_session()
+        self.coalesce_seconds = coalesce_seconds
+        self.bucket = TokenBucket(rate_per_minute)
+        self.max_attempts = max_attempts
+        self.verify = verify
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        return conn
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = self._connect()
+        conn.execute("""CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message TEXT,
+            image_path TEXT,
+            created_at TEXT,
+            status TEXT DEFAULT 'pending', -- 'pending', 'sent', 'failed'
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at REAL DEFAULT 0,
+            last_error TEXT,
+            sent_at TEXT
+        )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at)")
+        conn.commit()
+        conn.close()
+
+    # --- Producer side ---
+
+    def enqueue(self, message, image_path=None):
+        """Stores an alert for delivery and returns immediately."""
+        conn = self._connect()
+        try:
+            c = conn.execute("INSERT INTO outbox (message, image_path, created_at) VALUES (?, ?, ?)",
+                             (message, image_path, datetime.utcnow().isoformat()))
+            conn.commit()
+            outbox_id = c.lastrowid
+        finally:
+            conn.close()
+        self.start()
+        self._wake.set()
+        return outbox_id
+
+    # --- Worker ---
+
+    def start(self):
+        if not self.token or not self.chat_id:
+            return  # Rows stay queued until the bot is configured
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="notification-outbox", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            delay = self._next_due_in()
+            woken = self._wake.wait(timeout=delay if delay is not None else 60)
+            if self._stop.is_set():
+                break
+            if woken:
+                self._wake.clear()
+                # Let a burst of alerts accumulate into one digest
+                self._stop.wait(self.coalesce_seconds)
+            try:
+                self.drain_once()
+            except Exception as e:
+                print(f"Notification outbox error: {e}")
+
+    def _next_due_in(self):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'").fetchone()
+        finally:
+            conn.close()
+        if row is None or row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def drain_once(self, limit=200):
+        """Delivers everything currently due. Returns the number of alerts sent."""
+        if not self.token or not self.chat_id:
+            print("Telegram Config Missing")
+            return 0
+
+        conn = self._connect()
+        try:
+            rows = conn.execute("""
+                SELECT id, message, image_path, attempts FROM outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY id ASC LIMIT ?
+            """, (time.time(), limit)).fetchall()
+            if not rows:
+                return 0
+
+            texts = [r for r in rows if not r[2]]
+            photos = [r for r in rows if r[2]]
+            sent = 0
+            for group in self._digests(texts):
+                sent += self._deliver(conn, group, self._send_text, self._digest_text(group))
+            for row in photos:
+                sent += self._deliver(conn, [row], self._send_photo, row[1], row[2])
+            return sent
+        finally:
+            conn.close()
+
+    def _digests(self, rows):
+        """Splits text rows into groups whose digest fits in one Telegram message."""
+        group, size = [], 0
+        for row in rows:
+            length = len(row[1]) + 2
+            if group and size + length > TELEGRAM_MAX_CHARS - 64:
+                yield group
+                group, size = [], 0
+            group.append(row)
+            size += length
+        if group:
+            yield group
+
+    def _digest_text(self, group):
+        if len(group) == 1:
+            return group[0][1][:TELEGRAM_MAX_CHARS]
+        body = "\n\n".join(r[1] for r in group)
+        return f"📬 {len(group)} alerts\n\n{body}"[:TELEGRAM_MAX_CHARS]
+
+    def _deliver(self, conn, group, send_fn, *args):
+        wait = self.bucket.wait_time()
+        if wait > 0:
+            self._stop.wait(wait)
+        ids = [r[0] for r in group]
+        try:
+            self.bucket.take()
+            send_fn(*args)
+        except Exception as e:
+            retry_after = getattr(e, "retry_after", None)
+            self._reschedule(conn, group, str(e), retry_after)
+            return 0
+        conn.executemany("UPDATE outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1 WHERE id = ?",
+                         [(datetime.utcnow().isoformat(), i) for i in ids])
+        conn.commit()
+        return len(ids)
+
+    def _reschedule(self, conn, group, error, retry_after=None):
+        updates = []
+        jitter = random.uniform(1.0, 1.2)  # one factor per group so a digest retries together
+        for outbox_id, _, _, attempts in group:
+            attempts += 1
+            if attempts >= self.max_attempts:
+                updates.append(('failed', attempts, 0, error, outbox_id))
+                continue
+            backoff = retry_after if retry_after else min(NOTIFY_BACKOFF_MAX, NOTIFY_BACKOFF_BASE * (2 ** (attempts - 1)))
+            updates.append(('pending', attempts, time.time() + backoff * jitter, error, outbox_id))
+        conn.executemany("UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?", updates)
+        conn.commit()
+        print(f"Telegram delivery failed for {len(group)} alert(s): {error}")
+
+    # --- HTTP ---
+
+    def _post(self, method, timeout, **kwargs):
+        base_url, headers = _endpoint(self.api_url, self.token)
+        resp = self.session.post(f"{base_url}/{method}", headers=headers, verify=self.verify, timeout=timeout, **kwargs)
+        if resp.status_code == 429:
+            try:
+                retry_after = resp.json().get("parameters", {}).get("retry_after")
+            except ValueError:
+                retry_after = None
+            raise RetryLater("Rate limited by Telegram", retry_after)
+        if resp.status_code >= 400:
+            raise RetryLater(f"HTTP {resp.status_code}: {resp.text[:200]}")
+        return resp
+
+    def _send_text(self, text):
+        self._post("sendMessage", timeout=5, json={"chat_id": self.chat_id, "text": text})
+
+    def _send_photo(self, caption, image_path):
+        if not os.path.exists(image_path):
+            # Nothing left to attach; deliver the caption alone
+            return self._send_text(caption)
+        with open(image_path, 'rb') as img_file:
+            self._post("sendPhoto", timeout=10, data={"chat_id": self.chat_id, "caption": caption[:1024]}, files={'photo': img_file})
+
+    def stats(self):
+        conn = self._connect()
+        try:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        finally:
+            conn.close()
+        return {
+            "pending": counts.get("pending", 0),
+            "sent": counts.get("sent", 0),
+            "failed": counts.get("failed", 0),
+            "worker_alive": self._thread is not None and self._thread.is_alive(),
+        }
+
+
+outbox = NotificationOutbox()
+
+def enqueue_alert(message: str, image_path: str = None):
+    """Non-blocking alert: persisted to the outbox and delivered by the background worker."""
+    try:
+        return outbox.enqueue(message, image_path)
+    except Exception as e:
+        print(f"Failed to queue notification: {e}")
+        return None
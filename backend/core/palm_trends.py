@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+
+from core import db, forecast
+from core.read_cache import VersionedReadCache
+
+# --- Configuration ---
+TREND_WINDOW_SURVEYS = int(os.getenv("TREND_WINDOW_SURVEYS", "24"))  # latest surveys in the palm x survey matrix
+TREND_MIN_SAMPLES = 3
+INFECTION_THRESHOLD = 40.0  # health below which save_scan_results marks a palm Infected
+
+RANKINGS = ("decline", "time_to_threshold")
+
+def _load_matrix(key):
+    """
+    Health of every palm seen in the latest TREND_WINDOW_SURVEYS surveys as a
+    palms x surveys float32 matrix (NaN where a palm was not detected), plus each
+    survey's day offset. Row order follows palm_ids (ascending).
+    """
+    with db.connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, scan_date FROM surveys ORDER BY id DESC LIMIT ?", (TREND_WINDOW_SURVEYS,))
+        surveys = c.fetchall()[::-1]
+        survey_ids = np.array([s[0] for s in surveys], dtype=np.int64)
+        if len(survey_ids) == 0:
+            return {"palm_ids": np.zeros(0, np.int64), "survey_ids": survey_ids,
+                    "days": np.zeros(0), "health": np.zeros((0, 0), np.float32)}
+        c.execute("""SELECT tracked_palm_id, survey_id, health_score FROM palm_history
+                      WHERE survey_id >= ? AND tracked_palm_id IS NOT NULL AND health_score IS NOT NULL""",
+                  (int(survey_ids[0]),))
+        rows = c.fetchall()
+
+    ordinals = np.array([forecast.day_ordinal(s[1]) for s in surveys], dtype=np.float64)
+    days = ordinals - ordinals.min()
+    if not rows:
+        palm_ids, health = np.zeros(0, np.int64), np.zeros((0, len(survey_ids)), np.float32)
+    else:
+        palm, survey, score = (np.array(col) for col in zip(*rows))
+        palm_ids, row = np.unique(palm.astype(np.int64), return_inverse=True)
+        col = np.searchsorted(survey_ids, survey.astype(np.int64))
+        health = np.full((len(palm_ids), len(survey_ids)), np.nan, dtype=np.float32)
+        health[row, col] = score.astype(np.float32)  # a palm detected twice in one survey keeps the later row
+    return {"palm_ids": palm_ids, "survey_ids": survey_ids, "days": days, "health": health}
+
+_caches = {}  # farm id -> VersionedReadCache
+
+def _cache(farm_id):
+    cache = _caches.get(farm_id)
+    if cache is None:
+        cache = _caches.setdefault(farm_id, VersionedReadCache(_load_matrix))
+    return cache
+
+def cache_stats():
+    return {farm_id: cache.stats() for farm_id, cache in sorted(_caches.items())}
+
+def palm_matrix():
+    """The current farm's matrix, rebuilt only after a survey is saved."""
+    key = db.data_version_key()
+    return _cache(key[0]).get(key)
+
+def fit_trends(days, health):
+    """
+    Least-squares line through every row of `health` (NaN = missing) against `days`,
+    in one pass. Returns samples, slope (health per day) and the fitted health at
+    the last survey day; slope is NaN for rows with fewer than two distinct days.
+    """
+    mask = ~np.isnan(health)
+    m = mask.astype(np.float64)
+    y = np.where(mask, health, 0.0).astype(np.float64)
+    x = days.astype(np.float64)
+
+    n = m.sum(axis=1)
+    sx = m @ x
+    sy = y.sum(axis=1)
+    sxy = y @ x
+    sxx = m @ (x * x)
+
+    denom = n * sxx - sx * sx
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(denom > 1e-9, (n * sxy - sx * sy) / denom, np.nan)
+        intercept = (sy - slope * sx) / n
+    current = intercept + slope * (x[-1] if len(x) else 0.0)
+    return n.astype(np.int64), slope, current
+
+def at_risk(k=100, by="decline", threshold=INFECTION_THRESHOLD, min_samples=TREND_MIN_SAMPLES):
+    """
+    Top-k palms of the current farm by fastest decline (most negative slope) or by
+    fewest predicted days until their fitted health crosses `threshold`.
+    Returns [(palm_id, samples, slope_per_day, fitted_health, days_to_threshold)].
+    """
+    if by not in RANKINGS:
+        raise ValueError(f"by must be one of {', '.join(RANKINGS)}")
+    mat = palm_matrix()
+    if len(mat["palm_ids"]) == 0:
+        return []
+    samples, slope, current = fit_trends(mat["days"], mat["health"])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_left = np.where(current <= threshold, 0.0, (threshold - current) / slope)
+    days_left = np.where((current > threshold) & ~(slope < 0), np.inf, days_left)
+
+    eligible = (samples >= min_samples) & (slope < 0)
+    score = -slope if by == "decline" else -days_left
+    score = np.where(eligible, score, -np.inf)
+
+    k = min(k, int(eligible.sum()))
+    if k <= 0:
+        return []
+    top = np.argpartition(-score, k - 1)[:k]
+    top = top[np.argsort(-score[top], kind="stable")]
+    return [(int(mat["palm_ids"][i]), int(samples[i]), float(slope[i]), float(current[i]), float(days_left[i]))
+            for i in top]
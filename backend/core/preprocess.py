@@ -0,0 +1,86 @@
+import io
+import os
+import threading
+import numpy as np
+import cv2
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Decode large JPEGs at 1/2, 1/4 or 1/8 scale when the result is still >= the model input
+REDUCED_DECODE = os.getenv("PREPROCESS_REDUCED_DECODE", "1") == "1"
+
+# Training normalization (RGB + zero alpha channel), as in the original albumentations pipeline
+MEAN = np.array([0.485, 0.456, 0.406, 0.5], dtype=np.float32)
+STD = np.array([0.229, 0.224, 0.225, 0.5], dtype=np.float32)
+
+# uint8 -> normalized float32 lookup per RGB channel: one gather per channel, no float temporaries
+_LUT = ((np.arange(256, dtype=np.float64)[None, :] / 255.0 - MEAN[:3, None]) / STD[:3, None]).astype(np.float32)
+# The alpha channel is all zeros, so its normalized plane is a constant
+ALPHA_VALUE = np.float32((0.0 - MEAN[3]) / STD[3])
+
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+def _jpeg_min_side(contents):
+    """Smallest side of a JPEG from its header only, or None if not a JPEG / unknown."""
+    if Image is None or contents[:2] != b"\xff\xd8":
+        return None
+    try:
+        with Image.open(io.BytesIO(contents)) as img:
+            return min(img.size)
+    except Exception:
+        return None
+
+def decode_image(contents, target_size=None):
+    """
+    BGR decode straight from the upload bytes (no copy of the buffer). With `target_size`,
+    large JPEGs are decoded by libjpeg at reduced scale so the full-resolution frame is
+    never materialized; the result is still at least `target_size` on each side.
+    """
+    nparr = np.frombuffer(contents, np.uint8)
+    if REDUCED_DECODE and target_size:
+        min_side = _jpeg_min_side(contents)
+        if min_side:
+            for factor, flag in _REDUCED_FLAGS:
+                if min_side // factor >= target_size:
+                    image = cv2.imdecode(nparr, flag)
+                    if image is not None:
+                        return image
+                    break
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+def resize_rgb(image_bgr, size):
+    """Resize first, then swap channels in place on the small image."""
+    resized = cv2.resize(image_bgr, (size, size))
+    return cv2.cvtColor(resized, cv2.COLOR_BGR2RGB, dst=resized)
+
+# --- Batch Normalization ---
+
+_buffers = threading.local()
+
+def _batch_buffer(n, h, w):
+    """Per-thread reusable (N, 4, H, W) float32 buffer; alpha plane is filled once on allocation."""
+    buf = getattr(_buffers, "buf", None)
+    if buf is None or buf.shape[0] < n or buf.shape[2:] != (h, w):
+        buf = np.empty((max(n, 1), 4, h, w), dtype=np.float32)
+        buf[:, 3] = ALPHA_VALUE
+        _buffers.buf = buf
+    return buf[:n]
+
+def normalize_batch(images):
+    """
+    List of (H, W, 3) RGB uint8 images -> normalized (N, 4, H, W) float32 view of a
+    reusable buffer. Valid until the next call on the same thread.
+    """
+    h, w = images[0].shape[:2]
+    out = _batch_buffer(len(images), h, w)
+    for i, img in enumerate(images):
+        for ch in range(3):
+            np.take(_LUT[ch], img[..., ch], out=out[i, ch])
+    return out
@@ -0,0 +1,91 @@
+import os
+import threading
+
+import numpy as np
+
+# --- Configuration ---
+READ_CACHE_MAX_MB = float(os.getenv("READ_CACHE_MAX_MB", "256"))  # larger results are served uncached
+
+def freeze_columns(columns):
+    """Marks every array read-only so one cached copy can be handed to all callers."""
+    frozen = {}
+    for name, values in columns.items():
+        arr = np.asarray(values)
+        arr.flags.writeable = False
+        frozen[name] = arr
+    return frozen
+
+def columns_nbytes(columns):
+    return sum(arr.nbytes for arr in columns.values())
+
+
+class VersionedReadCache:
+    """
+    Process-wide cache of one columnar DB read (dict of read-only numpy arrays) keyed
+    by a cheap version key, e.g. (latest survey id, data version). A new key replaces
+    the old entry, so memory stays bounded by a single result (and by max_bytes).
+    Concurrent misses are single-flighted: one caller runs `loader(key)`, the others
+    wait for it and are served the same arrays.
+    """
+
+    def __init__(self, loader, max_bytes=READ_CACHE_MAX_MB * 1e6):
+        self.loader = loader
+        self.max_bytes = int(max_bytes)
+
+        self._lock = threading.Lock()       # guards the entry and counters
+        self._load_lock = threading.Lock()  # one loader at a time (single flight)
+        self._key = None
+        self._value = None
+        self._bytes = 0
+
+        self.hits = 0
+        self.coalesced = 0  # misses served by another caller's load
+        self.misses = 0
+        self.oversize = 0
+
+    def _lookup(self, key):
+        with self._lock:
+            if self._value is not None and self._key == key:
+                return self._value
+        return None
+
+    def get(self, key):
+        value = self._lookup(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        with self._load_lock:
+            value = self._lookup(key)
+            if value is not None:
+                with self._lock:
+                    self.coalesced += 1
+                return value
+
+            value = freeze_columns(self.loader(key))
+            size = columns_nbytes(value)
+            with self._lock:
+                self.misses += 1
+                if size > self.max_bytes:
+                    self.oversize += 1
+                else:
+                    self._key, self._value, self._bytes = key, value, size
+            return value
+
+    def invalidate(self):
+        with self._lock:
+            self._key, self._value, self._bytes = None, None, 0
+
+    def stats(self):
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            "key": list(self._key) if isinstance(self._key, tuple) else self._key,
+            "memory_mb": round(self._bytes / 1e6, 2),
+            "memory_limit_mb": round(self.max_bytes / 1e6, 2),
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "oversize": self.oversize,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+        }
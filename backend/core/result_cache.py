@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # points to backend/
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", os.path.join(BASE_DIR, "data", "result_cache"))
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", "64"))         # in-memory LRU budget
+RESULT_CACHE_DISK_MB = float(os.getenv("RESULT_CACHE_DISK_MB", "1024"))     # spill store budget (0 = no disk)
+# On a hit, return the stored result without inserting another survey
+RESULT_CACHE_SKIP_DUPLICATES = os.getenv("RESULT_CACHE_SKIP_DUPLICATES", "1") == "1"
+
+def content_key(data, scope=""):
+    """sha256 of the image bytes within `scope` (the farm): a hit means that farm already has the survey."""
+    h = hashlib.sha256(scope.encode() + b"\0")
+    h.update(data)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed cache of inference results: key = sha256(farm + image bytes), scoped
+    to the current model version. Entries live in a byte-bounded in-memory LRU and spill
+    to one JSON file per entry on disk when evicted. When `version_fn()` changes (new
+    model file / backend) the memory tier is dropped and old disk generations are removed.
+    """
+
+    def __init__(self, version_fn, max_bytes=RESULT_CACHE_MAX_MB * 1e6, disk_dir=RESULT_CACHE_DIR, disk_max_bytes=RESULT_CACHE_DISK_MB * 1e6):
+        self.version_fn = version_fn
+        self.max_bytes = int(max_bytes)
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = int(disk_max_bytes)
+
+        self._lock = threading.Lock()
+        self._mem = OrderedDict()  # key -> (payload_json, size)
+        self._mem_bytes = 0
+        self._disk_bytes = None
+        self._version = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # --- Versioning ---
+
+    def _check_version(self):
+        version = self.version_fn()
+        if version != self._version:
+            if self._version is not None:
+                print(f"Model changed ({self._version} -> {version}), result cache invalidated")
+            self._mem.clear()
+            self._mem_bytes = 0
+            self._version = version
+            self._disk_bytes = None
+            self._drop_old_generations()
+        return version
+
+    def _generation_dir(self):
+        return os.path.join(self.disk_dir, self._version)
+
+    def _drop_old_generations(self):
+        if not self.disk_max_bytes or not os.path.isdir(self.disk_dir):
+            return
+        for name in os.listdir(self.disk_dir):
+            if name != self._version:
+                path = os.path.join(self.disk_dir, name)
+                for f in os.listdir(path):
+                    os.remove(os.path.join(path, f))
+                os.rmdir(path)
+
+    # --- Public API ---
+
+    def get(self, key):
+        """Returns the stored dict for `key` under the current model, or None."""
+        with self._lock:
+            self._check_version()
+            entry = self._mem.get(key)
+            if entry is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return json.loads(entry[0])
+
+            payload = self._disk_read(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._mem_put(key, payload)  # promote
+            return json.loads(payload)
+
+    def put(self, key, value):
+        payload = json.dumps(value, separators=(",", ":"))
+        with self._lock:
+            self._check_version()
+            self._mem_put(key, payload)
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            self._mem_bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "model_version": self._version,
+            "entries": len(self._mem),
+            "memory_mb": round(self._mem_bytes / 1e6, 2),
+            "memory_limit_mb": round(self.max_bytes / 1e6, 2),
+            "disk_mb": round((self._disk_bytes or 0) / 1e6, 2),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    # --- Tiers ---
+
+    def _mem_put(self, key, payload):
+        size = len(payload)
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_bytes -= old[1]
+        if size > self.max_bytes:
+            self._disk_write(key, payload)
+            return
+        self._mem[key] = (payload, size)
+        self._mem_bytes += size
+        while self._mem_bytes > self.max_bytes:
+            old_key, (old_payload, old_size) = self._mem.popitem(last=False)
+            self._mem_bytes -= old_size
+            self.evictions += 1
+            self._disk_write(old_key, old_payload)
+
+    def _disk_read(self, key):
+        if not self.disk_max_bytes:
+            return None
+        path = os.path.join(self._generation_dir(), f"{key}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = f.read()
+            os.utime(path)  # LRU order on disk follows mtime
+            return payload
+        except (FileNotFoundError, OSError):
+            return None
+
+    def _disk_write(self, key, payload):
+        if not self.disk_max_bytes:
+            return
+        gen = self._generation_dir()
+        os.makedirs(gen, exist_ok=True)
+        path = os.path.join(gen, f"{key}.json")
+        if os.path.exists(path):
+            return
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+
+        if self._disk_bytes is None:
+            self._disk_bytes = sum(os.path.getsize(os.path.join(gen, f)) for f in os.listdir(gen))
+        else:
+            self._disk_bytes += len(payload)
+        if self._disk_bytes > self.disk_max_bytes:
+            self._disk_prune(gen)
+
+    def _disk_prune(self, gen):
+        files = [os.path.join(gen, f) for f in os.listdir(gen)]
+        files.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(f) for f in files)
+        # Trim to 90% so we don't prune on every write
+        while files and total > self.disk_max_bytes * 0.9:
+            f = files.pop(0)
+            total -= os.path.getsize(f)
+            os.remove(f)
+        self._disk_bytes = total
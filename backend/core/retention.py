@@ -0,0 +1,359 @@
+import csv
+import gzip
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from core import async_db, db
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # points to backend/
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "0"))      # 0 = keep everything (opt in, e.g. 365)
+HISTORY_ARCHIVE_DIR = os.getenv("HISTORY_ARCHIVE_DIR", os.path.join(BASE_DIR, "data", "history_archive"))
+RETENTION_BATCH_ROWS = int(os.getenv("RETENTION_BATCH_ROWS", "5000"))       # rows per write transaction
+RETENTION_SURVEYS_PER_RUN = int(os.getenv("RETENTION_SURVEYS_PER_RUN", "20"))
+RETENTION_INTERVAL_S = float(os.getenv("RETENTION_INTERVAL_S", "3600"))
+RETENTION_PAUSE_S = float(os.getenv("RETENTION_PAUSE_S", "0.05"))          # between batches, lets scans in
+
+ARCHIVE_COLUMNS = ("id", "tracked_palm_id", "survey_id", "health_score", "yield_est", "img_path")
+
+def archive_dir(farm_id=None):
+    """HISTORY_ARCHIVE_DIR for the default farm, a subdirectory per other farm."""
+    farm_id = farm_id or db.current_farm.get()
+    return HISTORY_ARCHIVE_DIR if farm_id == db.DEFAULT_FARM else os.path.join(HISTORY_ARCHIVE_DIR, farm_id)
+
+def archive_path(survey_id):
+    return os.path.join(archive_dir(), f"survey_{int(survey_id):08d}.csv.gz")
+
+def retention_cutoff(now=None):
+    """scan_date string below which surveys are compacted (same format as save_scan_results)."""
+    now = now or datetime.utcnow()
+    return (now - timedelta(days=HISTORY_RETENTION_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+
+def due_surveys(limit=RETENTION_SURVEYS_PER_RUN, now=None):
+    """[(survey_id, scan_date)] older than the window, oldest first. The latest survey is never due."""
+    if HISTORY_RETENTION_DAYS <= 0:
+        return []
+    with db.connection() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT s.id, s.scan_date FROM surveys s
+            LEFT JOIN archived_surveys a ON a.survey_id = s.id
+            WHERE (a.status IS NULL OR a.status = 'compacting')
+            AND s.scan_date < ?
+            AND s.id < (SELECT MAX(id) FROM surveys)
+            ORDER BY s.id LIMIT ?
+        """, (retention_cutoff(now), limit))
+        return c.fetchall()
+
+def _db_space(c):
+    c.execute("PRAGMA page_size")
+    page_size = c.fetchone()[0]
+    c.execute("PRAGMA page_count")
+    pages = c.fetchone()[0]
+    c.execute("PRAGMA freelist_count")
+    free = c.fetchone()[0]
+    return {"db_bytes": pages * page_size, "free_bytes": free * page_size}
+
+def db_space():
+    with db.connection() as conn:
+        return _db_space(conn.cursor())
+
+# --- Archive Files ---
+
+def _write_archive(survey_id):
+    """Dumps the survey's palm_history rows to a gzip CSV (atomic). Returns (path, rows, bytes)."""
+    with db.connection() as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM palm_history WHERE survey_id = ? ORDER BY id",
+                  (survey_id,))
+        rows = c.fetchall()
+    path = archive_path(survey_id)
+    os.makedirs(archive_dir(), exist_ok=True)
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(ARCHIVE_COLUMNS)
+        writer.writerows(rows)
+    os.replace(tmp, path)
+    return path, len(rows), os.path.getsize(path)
+
+def read_archive(survey_id):
+    """Archived palm_history rows of a compacted survey as tuples in ARCHIVE_COLUMNS order."""
+    path = archive_path(survey_id)
+    with gzip.open(path, "rt", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader)
+        return [
+            (int(r[0]), int(r[1]), int(r[2]), _float(r[3]), _float(r[4]), r[5] or None)
+            for r in reader
+        ]
+
+def _float(value):
+    return float(value) if value != "" else None
+
+# --- Compaction (each step is one short transaction on the DB writer thread) ---
+
+def _mark_compacting(survey_id, path, rows, size):
+    with db.connection() as conn:
+        conn.execute("""INSERT OR REPLACE INTO archived_surveys
+            (survey_id, status, archive_path, rows, archive_bytes, archived_at) VALUES (?, 'compacting', ?, ?, ?, NULL)""",
+            (survey_id, path, rows, size))
+
+def _compact_batch(survey_id, scan_date, limit):
+    """Folds up to `limit` history rows of the survey into palm_history_summary and deletes them."""
+    with db.connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id FROM palm_history WHERE survey_id = ? ORDER BY id LIMIT ?", (survey_id, limit))
+        ids = [r[0] for r in c.fetchall()]
+        if not ids:
+            return 0
+        bounds = (survey_id, ids[0], ids[-1])
+        c.execute("""
+            INSERT INTO palm_history_summary
+                (tracked_palm_id, samples, health_sum, health_sq_sum, yield_sum, first_scan_date, last_scan_date)
+            SELECT tracked_palm_id, COUNT(*), TOTAL(health_score), TOTAL(health_score * health_score),
+                   TOTAL(yield_est), ?, ?
+            FROM palm_history
+            WHERE survey_id = ? AND id BETWEEN ? AND ?
+            GROUP BY tracked_palm_id
+            ON CONFLICT(tracked_palm_id) DO UPDATE SET
+                samples = samples + excluded.samples,
+                health_sum = health_sum + excluded.health_sum,
+                health_sq_sum = health_sq_sum + excluded.health_sq_sum,
+                yield_sum = yield_sum + excluded.yield_sum,
+                first_scan_date = MIN(first_scan_date, excluded.first_scan_date),
+                last_scan_date = MAX(last_scan_date, excluded.last_scan_date)
+        """, (scan_date, scan_date) + bounds)
+        c.execute("DELETE FROM palm_history WHERE survey_id = ? AND id BETWEEN ? AND ?", bounds)
+        removed = c.rowcount
+        db.bump_data_version(c)
+        return removed
+
+def _mark_archived(survey_id):
+    with db.connection() as conn:
+        conn.execute("UPDATE archived_surveys SET status = 'archived', archived_at = ? WHERE survey_id = ?",
+                     (datetime.utcnow().isoformat(), survey_id))
+
+def compact_survey(survey_id, scan_date, stop_event=None):
+    """
+    Archives one survey's palm_history to disk, then folds and deletes it batch by batch.
+    Resumable: a survey left 'compacting' keeps its archive file and continues deleting.
+    Returns (rows removed, archive bytes).
+    """
+    with db.connection() as conn:
+        row = conn.execute("SELECT status, archive_bytes FROM archived_surveys WHERE survey_id = ?",
+                           (survey_id,)).fetchone()
+    if row is None:
+        # Nothing is deleted before the archive is on disk and recorded
+        path, rows, size = _write_archive(survey_id)
+        async_db.writer_for().call(_mark_compacting, survey_id, path, rows, size)
+    else:
+        size = row[1] or 0
+
+    removed = 0
+    while True:
+        n = async_db.writer_for().call(_compact_batch, survey_id, scan_date, RETENTION_BATCH_ROWS)
+        removed += n
+        if n < RETENTION_BATCH_ROWS:
+            break
+        if stop_event is None:
+            time.sleep(RETENTION_PAUSE_S)
+        elif stop_event.wait(RETENTION_PAUSE_S):
+            return removed, size  # resumes as 'compacting' next run
+    async_db.writer_for().call(_mark_archived, survey_id)
+    return removed, size
+
+def run_once(limit=RETENTION_SURVEYS_PER_RUN, stop_event=None):
+    """Compacts up to `limit` due surveys and reports what was reclaimed."""
+    started = time.monotonic()
+    before = db_space()
+    surveys, rows, archive_bytes = [], 0, 0
+    for survey_id, scan_date in due_surveys(limit):
+        if stop_event is not None and stop_event.is_set():
+            break
+        removed, size = compact_survey(survey_id, scan_date, stop_event)
+        surveys.append(survey_id)
+        rows += removed
+        archive_bytes += size
+    after = db_space()
+    return {
+        "surveys": surveys,
+        "rows_removed": rows,
+        "archive_bytes": archive_bytes,
+        # SQLite reuses freed pages for new scans; the file only shrinks on VACUUM
+        "reclaimed_bytes": max(0, after["free_bytes"] - before["free_bytes"]),
+        **after,
+        "seconds": round(time.monotonic() - started, 2),
+        "finished_at": datetime.utcnow().isoformat(),
+    }
+
+# --- Restore ---
+
+def _restore_batch(rows):
+    with db.connection() as conn:
+        c = conn.cursor()
+        ids = [r[0] for r in rows]
+        c.execute(f"SELECT id FROM palm_history WHERE id IN ({','.join('?' * len(ids))})", ids)
+        present = {r[0] for r in c.fetchall()}
+        rows = [r for r in rows if r[0] not in present]  # already restored by an interrupted run
+        if not rows:
+            return 0
+        c.executemany(f"INSERT INTO palm_history ({', '.join(ARCHIVE_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+        per_palm = defaultdict(lambda: [0, 0.0, 0.0, 0.0])
+        for _, palm_id, _, health, yield_est, _ in rows:
+            agg = per_palm[palm_id]
+            agg[0] += 1
+            agg[1] += health or 0.0
+            agg[2] += (health or 0.0) ** 2
+            agg[3] += yield_est or 0.0
+        c.executemany("""UPDATE palm_history_summary SET
+                samples = samples - ?, health_sum = health_sum - ?,
+                health_sq_sum = health_sq_sum - ?, yield_sum = yield_sum - ?
+            WHERE tracked_palm_id = ?""",
+            [(n, h, h2, y, palm_id) for palm_id, (n, h, h2, y) in per_palm.items()])
+        c.execute("DELETE FROM palm_history_summary WHERE samples <= 0")
+        db.bump_data_version(c)
+        return len(rows)
+
+def _restore_summary_dates(c, survey_id):
+    """
+    _restore_batch subtracts the restored readings from the summary sums, but first and
+    last scan dates are a min / max. Palms whose first or last date was the restored
+    survey's get the date of the nearest remaining archived survey that holds them.
+    """
+    c.execute("SELECT scan_date FROM surveys WHERE id = ?", (survey_id,))
+    row = c.fetchone()
+    if row is None:
+        return
+    scan_date = row[0]
+    c.execute("""SELECT tracked_palm_id, first_scan_date = ?, last_scan_date = ? FROM palm_history_summary
+                 WHERE first_scan_date = ? OR last_scan_date = ?""", (scan_date,) * 4)
+    stale = c.fetchall()
+    if not stale:
+        return
+    c.execute("""SELECT a.survey_id, s.scan_date FROM archived_surveys a JOIN surveys s ON s.id = a.survey_id
+                 WHERE a.status != 'restored' AND a.survey_id != ? ORDER BY s.scan_date, a.survey_id""", (survey_id,))
+    archived = c.fetchall()
+    members = {}  # survey id -> palm ids in its archive, read at most once
+    for column, wanted, order in (("first_scan_date", {r[0] for r in stale if r[1]}, archived),
+                                  ("last_scan_date", {r[0] for r in stale if r[2]}, archived[::-1])):
+        for other_id, other_date in order:
+            if not wanted:
+                break
+            if other_id not in members:
+                if not os.path.exists(archive_path(other_id)):
+                    continue
+                members[other_id] = {r[1] for r in read_archive(other_id)}
+            found = wanted & members[other_id]
+            c.executemany(f"UPDATE palm_history_summary SET {column} = ? WHERE tracked_palm_id = ?",
+                          [(other_date, palm_id) for palm_id in found])
+            wanted -= found
+
+def _mark_restored(survey_id):
+    with db.connection() as conn:
+        c = conn.cursor()
+        _restore_summary_dates(c, survey_id)
+        c.execute("UPDATE archived_surveys SET status = 'restored', archive_path = NULL, archive_bytes = 0 WHERE survey_id = ?",
+                  (survey_id,))
+
+def restore_survey(survey_id):
+    """
+    Puts an archived survey's rows back into palm_history and takes them out of the
+    summaries. The survey is then pinned ('restored') so retention skips it.
+    Returns the number of rows restored, or None if the survey is not archived.
+    """
+    with db.connection() as conn:
+        row = conn.execute("SELECT status FROM archived_surveys WHERE survey_id = ?", (survey_id,)).fetchone()
+    if row is None or row[0] == "restored" or not os.path.exists(archive_path(survey_id)):
+        return None
+    rows = read_archive(survey_id)
+    restored = 0
+    for i in range(0, len(rows), RETENTION_BATCH_ROWS):
+        restored += async_db.writer_for().call(_restore_batch, rows[i:i + RETENTION_BATCH_ROWS])
+    async_db.writer_for().call(_mark_restored, survey_id)
+    os.remove(archive_path(survey_id))
+    return restored
+
+def status():
+    with db.connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT status, COUNT(*), TOTAL(rows), TOTAL(archive_bytes) FROM archived_surveys GROUP BY status")
+        by_status = {r[0]: {"surveys": r[1], "rows": int(r[2]), "archive_bytes": int(r[3])} for r in c.fetchall()}
+        c.execute("SELECT COUNT(*) FROM palm_history_summary")
+        summarized = c.fetchone()[0]
+        space = _db_space(c)
+    return {
+        "retention_days": HISTORY_RETENTION_DAYS,
+        "cutoff": retention_cutoff() if HISTORY_RETENTION_DAYS > 0 else None,
+        "due_surveys": len(due_surveys(limit=1_000_000)),
+        "archived": by_status,
+        "summarized_palms": summarized,
+        **space,
+    }
+
+
+class RetentionWorker:
+    """Background thread that runs run_once() on every farm each RETENTION_INTERVAL_S (or when triggered)."""
+
+    def __init__(self, interval=RETENTION_INTERVAL_S):
+        self.interval = interval
+        self.last_report = None
+        self.last_error = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if HISTORY_RETENTION_DAYS <= 0:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="history-retention", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def trigger(self):
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            reports, errors = {}, {}
+            for farm_id in db.list_farms():
+                if self._stop.is_set():
+                    break
+                try:
+                    with db.use_farm(farm_id):
+                        r = reports[farm_id] = run_once(stop_event=self._stop)
+                    if r["surveys"]:
+                        print(f"Retention [{farm_id}]: compacted {len(r['surveys'])} surveys, {r['rows_removed']} rows, "
+                              f"{r['reclaimed_bytes'] / 1e6:.1f} MB freed, {r['archive_bytes'] / 1e6:.1f} MB archived")
+                except Exception as e:
+                    errors[farm_id] = str(e)
+                    print(f"Retention error [{farm_id}]: {e}")
+            self.last_report = reports
+            self.last_error = errors or None
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def stats(self):
+        return {
+            "worker_alive": self._thread is not None and self._thread.is_alive(),
+            "interval_s": self.interval,
+            "last_report": self.last_report,
+            "last_error": self.last_error,
+        }
+
+
+worker = RetentionWorker()
@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # points to backend/
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(BASE_DIR, "data", "snapshots"))
+SNAPSHOTS_ENABLED = os.getenv("SNAPSHOTS_ENABLED", "1") == "1" and pa is not None
+SNAPSHOT_COMPRESSION = os.getenv("SNAPSHOT_COMPRESSION", "zstd")
+
+# One row per palm of one survey (palm_history joined to tracked_palms)
+PALM_SCHEMA = pa.schema([
+    ("survey_id", pa.int32()),
+    ("scan_date", pa.timestamp("s")),
+    ("tracked_palm_id", pa.int64()),
+    ("lat", pa.float32()),
+    ("lon", pa.float32()),
+    ("health_score", pa.float32()),
+    ("yield_est", pa.float32()),
+]) if pa is not None else None
+
+def snapshot_path(survey_id, snapshot_dir=None):
+    return os.path.join(snapshot_dir or SNAPSHOT_DIR, f"survey_{int(survey_id):08d}.parquet")
+
+def has_snapshot(survey_id, snapshot_dir=None):
+    return os.path.exists(snapshot_path(survey_id, snapshot_dir))
+
+def write_survey_snapshot(survey, palms, snapshot_dir=None):
+    """
+    Writes one survey as an immutable Parquet file. `survey` holds survey_id, scan_date,
+    total_palms, avg_health; `palms` maps tracked_palm_id / lat / lon / health_score /
+    yield_est to equal-length sequences. Existing snapshots are never rewritten.
+    Returns the path, or None when snapshots are disabled.
+    """
+    if not SNAPSHOTS_ENABLED:
+        return None
+    path = snapshot_path(survey["survey_id"], snapshot_dir)
+    if os.path.exists(path):
+        return path
+
+    scan_date = pd.Timestamp(survey["scan_date"])
+    n = len(palms["tracked_palm_id"])
+    arrays = {
+        "survey_id": np.full(n, survey["survey_id"], dtype=np.int32),
+        "scan_date": np.full(n, scan_date.to_datetime64().astype("datetime64[s]")),
+        "tracked_palm_id": np.asarray(palms["tracked_palm_id"], dtype=np.int64),
+        "lat": np.asarray(palms["lat"], dtype=np.float32),
+        "lon": np.asarray(palms["lon"], dtype=np.float32),
+        "health_score": np.asarray(palms["health_score"], dtype=np.float32),
+        "yield_est": np.asarray(palms["yield_est"], dtype=np.float32),
+    }
+    # Survey-level values in the footer keep each file self-describing
+    meta = {
+        "survey_id": str(int(survey["survey_id"])),
+        "scan_ts": str(int(scan_date.timestamp())),
+        "total_palms": str(int(survey["total_palms"] or 0)),
+        "avg_health": repr(float(survey["avg_health"] or 0.0)),
+    }
+    table = pa.Table.from_pydict(arrays, schema=PALM_SCHEMA.with_metadata(meta))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    pq.write_table(table, tmp, compression=SNAPSHOT_COMPRESSION)
+    os.replace(tmp, path)
+    return path
+
+def _snapshot_files(snapshot_dir=None):
+    root = snapshot_dir or SNAPSHOT_DIR
+    if not os.path.isdir(root):
+        return []
+    return sorted(os.path.join(root, f) for f in os.listdir(root)
+                  if f.startswith("survey_") and f.endswith(".parquet"))
+
+def load_palms(columns=None, survey_ids=None, snapshot_dir=None):
+    """
+    Palm rows of the given surveys (default: all snapshotted) as one memory-mapped
+    pyarrow Table, reading only `columns`. None when snapshots are off.
+    """
+    if not SNAPSHOTS_ENABLED:
+        return None
+    if survey_ids is None:
+        paths = _snapshot_files(snapshot_dir)
+    else:
+        paths = [p for p in (snapshot_path(s, snapshot_dir) for s in survey_ids) if os.path.exists(p)]
+    if not paths:
+        schema = PALM_SCHEMA if columns is None else pa.schema([PALM_SCHEMA.field(c) for c in columns])
+        return schema.empty_table()
+    tables = [pq.read_table(p, columns=columns, memory_map=True) for p in paths]
+    return pa.concat_tables(tables) if len(tables) > 1 else tables[0]
@@ -0,0 +1,101 @@
+import numpy as np
+
+# 3x3 neighbourhood: with cell size == search radius every match lies in one of these cells
+_OFFSETS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+_NO_MATCH = -1
+
+def _cell_keys(cx, cy):
+    # One int64 per cell so lookups are plain sorted-array searches
+    return cx.astype(np.int64) * 4294967296 + cy.astype(np.int64)
+
+
+class GridIndex:
+    """
+    Uniform grid hash over 2D points with cell size == match radius.
+    The bulk of the points (loaded once) lives in cell-sorted arrays and is queried
+    for many points at once; points registered afterwards go to a small per-cell dict.
+    """
+
+    def __init__(self, ids, xy, radius):
+        self.radius = float(radius)
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        keys = self._keys(xy)
+        order = np.argsort(keys, kind="stable")
+        self._keys_sorted = keys[order]
+        self._ids = ids[order]
+        self._xy = xy[order]
+        self._added = {}  # (cx, cy) -> [(id, x, y), ...]
+
+    def __len__(self):
+        return len(self._ids) + sum(len(v) for v in self._added.values())
+
+    def _cells(self, xy):
+        return np.floor(xy / self.radius).astype(np.int64)
+
+    def _keys(self, xy):
+        cells = self._cells(xy)
+        return _cell_keys(cells[:, 0], cells[:, 1])
+
+    def nearest(self, xy):
+        """
+        Vectorized nearest neighbour for an (N, 2) array among the bulk points.
+        Returns (ids, distances); id is -1 where nothing lies strictly within the radius.
+        Ties go to the lower id.
+        """
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        n = len(xy)
+        best_id = np.full(n, _NO_MATCH, dtype=np.int64)
+        best_d2 = np.full(n, np.inf)
+        if n == 0 or len(self._ids) == 0:
+            return best_id, np.sqrt(best_d2)
+
+        cells = self._cells(xy)
+        query, cand = [], []
+        for dx, dy in _OFFSETS:
+            keys = _cell_keys(cells[:, 0] + dx, cells[:, 1] + dy)
+            lo = np.searchsorted(self._keys_sorted, keys, side="left")
+            hi = np.searchsorted(self._keys_sorted, keys, side="right")
+            counts = hi - lo
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            # Expand every [lo, hi) range into flat (query, candidate) pairs
+            q = np.repeat(np.arange(n), counts)
+            starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+            query.append(q)
+            cand.append(starts + np.arange(total))
+        if not query:
+            return best_id, np.sqrt(best_d2)
+
+        q = np.concatenate(query)
+        cand = np.concatenate(cand)
+        d2 = ((self._xy[cand] - xy[q]) ** 2).sum(axis=1)
+        within = d2 < self.radius * self.radius
+        q, cand, d2 = q[within], cand[within], d2[within]
+        if len(q):
+            # Per query: smallest distance first, then smallest id
+            order = np.lexsort((self._ids[cand], d2, q))
+            q, cand, d2 = q[order], cand[order], d2[order]
+            first = np.flatnonzero(np.r_[True, q[1:] != q[:-1]])
+            best_id[q[first]] = self._ids[cand[first]]
+            best_d2[q[first]] = d2[first]
+        return best_id, np.sqrt(best_d2)
+
+    def nearest_added(self, x, y):
+        """Nearest point registered with add() strictly within the radius, or None."""
+        if not self._added:
+            return None
+        cx, cy = int(np.floor(x / self.radius)), int(np.floor(y / self.radius))
+        best = None
+        r2 = self.radius * self.radius
+        for dx, dy in _OFFSETS:
+            for pid, px, py in self._added.get((cx + dx, cy + dy), ()):
+                d2 = (px - x) ** 2 + (py - y) ** 2
+                if d2 < r2 and (best is None or (d2, pid) < best):
+                    best = (d2, pid)
+        return None if best is None else best[1]
+
+    def add(self, pid, x, y):
+        cell = (int(np.floor(x / self.radius)), int(np.floor(y / self.radius)))
+        self._added.setdefault(cell, []).append((int(pid), float(x), float(y)))
@@ -0,0 +1,71 @@
+import json
+import os
+
+# --- Configuration ---
+# Auto-task rules, JSON list (TASK_RULES env or a file at TASK_RULES_PATH). Each rule:
+#   {"task_type": "Fertilize", "priority": "Medium", "metric": "health_score", "ge": 40, "lt": 60}
+# metric: health_score | yield_est; bounds: lt / le / gt / ge (all given bounds must hold).
+DEFAULT_TASK_RULES = [
+    {"task_type": "Pest Control", "priority": "High", "metric": "health_score", "lt": 40},
+]
+TASK_RULES_PATH = os.getenv("TASK_RULES_PATH", "")
+
+METRICS = ("health_score", "yield_est")  # order of the per-palm value tuples evaluate() takes
+_BOUNDS = {
+    "lt": lambda v, t: v < t,
+    "le": lambda v, t: v <= t,
+    "gt": lambda v, t: v > t,
+    "ge": lambda v, t: v >= t,
+}
+
+
+class TaskRule:
+    """One auto-task rule: a palm whose `metric` satisfies every bound gets a `task_type` task."""
+
+    def __init__(self, task_type, metric="health_score", priority="Medium", **bounds):
+        if metric not in METRICS:
+            raise ValueError(f"Task rule {task_type!r}: metric must be one of {', '.join(METRICS)}")
+        unknown = set(bounds) - set(_BOUNDS)
+        if unknown:
+            raise ValueError(f"Task rule {task_type!r}: unknown bounds {', '.join(sorted(unknown))}")
+        if not bounds:
+            raise ValueError(f"Task rule {task_type!r}: needs at least one of {', '.join(_BOUNDS)}")
+        self.task_type = task_type
+        self.metric = metric
+        self.index = METRICS.index(metric)
+        self.priority = priority
+        self.bounds = [(_BOUNDS[op], float(t)) for op, t in bounds.items()]
+        self._spec = dict(task_type=task_type, metric=metric, priority=priority, **bounds)
+
+    def matches(self, value):
+        return value is not None and all(test(value, t) for test, t in self.bounds)
+
+    def to_dict(self):
+        return dict(self._spec)
+
+
+def load_rules():
+    """Rules from TASK_RULES_PATH, else the TASK_RULES env var, else DEFAULT_TASK_RULES."""
+    if TASK_RULES_PATH:
+        with open(TASK_RULES_PATH) as f:
+            specs = json.load(f)
+    elif os.getenv("TASK_RULES"):
+        specs = json.loads(os.getenv("TASK_RULES"))
+    else:
+        specs = DEFAULT_TASK_RULES
+    return [TaskRule(**spec) for spec in specs]
+
+RULES = load_rules()
+
+def evaluate(palms, rules=None):
+    """
+    palms: {palm_id: (health_score, yield_est)}, the values a survey just recorded.
+    Returns [(palm_id, task_type, priority)] for every rule a palm matches.
+    """
+    rules = RULES if rules is None else rules
+    due = []
+    for palm_id, values in palms.items():
+        for rule in rules:
+            if rule.matches(values[rule.index]):
+                due.append((palm_id, rule.task_type, rule.priority))
+    return due
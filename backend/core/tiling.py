@@ -0,0 +1,184 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import cv2
+from PIL import Image
+
+try:
+    import rasterio
+    from rasterio.windows import Window
+except ImportError:
+    rasterio = None
+
+# --- Configuration ---
+TILE_SIZE = int(os.getenv("TILE_SIZE", "512"))
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", "128"))
+TILE_BATCH_SIZE = int(os.getenv("TILE_BATCH_SIZE", "4"))
+# Post-processing runs over larger windows (plus a halo) of the blended mask
+ANALYSIS_WINDOW = int(os.getenv("TILE_ANALYSIS_WINDOW", "2048"))
+TILE_WORK_DIR = os.getenv("TILE_WORK_DIR") or None  # None -> system temp dir
+# Formats without windowed reads (JPEG/PNG) are decoded whole; larger ones are rejected
+TILE_MAX_DECODE_PIXELS = int(os.getenv("TILE_MAX_DECODE_PIXELS", str(64_000_000)))
+
+# --- Windowed Readers ---
+# All readers expose .height, .width and .read(y0, y1, x0, x1) -> RGB uint8 (h, w, 3)
+
+class NumpyRasterReader:
+    """Memory-mapped .npy raster (H, W, 3) stored in RGB order."""
+
+    def __init__(self, path):
+        self.data = np.load(path, mmap_mode='r')
+        if self.data.ndim != 3 or self.data.shape[2] < 3:
+            raise ValueError(f"Expected an (H, W, 3) array, got {self.data.shape}")
+        self.height, self.width = self.data.shape[:2]
+
+    def read(self, y0, y1, x0, x1):
+        return np.ascontiguousarray(self.data[y0:y1, x0:x1, :3], dtype=np.uint8)
+
+    def close(self):
+        self.data = None
+
+
+class RasterioReader:
+    """GeoTIFF / any GDAL raster, read window by window."""
+
+    def __init__(self, path):
+        self.ds = rasterio.open(path)
+        if self.ds.count < 3:
+            raise ValueError(f"Expected at least 3 bands, got {self.ds.count}")
+        self.height, self.width = self.ds.height, self.ds.width
+
+    def read(self, y0, y1, x0, x1):
+        bands = self.ds.read([1, 2, 3], window=Window(x0, y0, x1 - x0, y1 - y0))
+        if bands.dtype != np.uint8:
+            bands = np.clip(bands, 0, 255).astype(np.uint8)
+        return np.ascontiguousarray(bands.transpose(1, 2, 0))
+
+    def close(self):
+        self.ds.close()
+
+
+class DecodedImageReader:
+    """
+    Fallback for formats without windowed access (JPEG/PNG).
+    The image is decoded once and parked in a disk-backed memmap so the
+    decoded frame can be released before inference starts. The size is checked
+    from the header first: images above TILE_MAX_DECODE_PIXELS are refused.
+    """
+
+    def __init__(self, path, work_dir=None):
+        try:
+            with Image.open(path) as header:  # reads the header only
+                width, height = header.size
+        except Exception:
+            raise ValueError("Invalid image file") from None
+        if width * height > TILE_MAX_DECODE_PIXELS:
+            raise ValueError(f"{width}x{height} image is too large to decode whole (limit {TILE_MAX_DECODE_PIXELS} pixels); "
+                             f"upload it as a GeoTIFF or .npy")
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Invalid image file")
+        self.height, self.width = image.shape[:2]
+        self._tmp = tempfile.NamedTemporaryFile(dir=work_dir, suffix=".rgb", delete=False)
+        self._tmp.close()
+        self.data = np.memmap(self._tmp.name, dtype=np.uint8, mode='w+', shape=(self.height, self.width, 3))
+        cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=self.data)
+        del image
+
+    def read(self, y0, y1, x0, x1):
+        return np.array(self.data[y0:y1, x0:x1])
+
+    def close(self):
+        self.data = None
+        if os.path.exists(self._tmp.name):
+            os.remove(self._tmp.name)
+
+
+def open_raster(path, work_dir=None):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        return NumpyRasterReader(path)
+    if ext in (".tif", ".tiff"):
+        if rasterio is None:
+            raise ValueError("GeoTIFF orthomosaics need rasterio (pip install rasterio)")
+        return RasterioReader(path)
+    return DecodedImageReader(path, work_dir=work_dir)
+
+# --- Tiling & Blending ---
+
+def tile_origins(length, tile=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Start offsets covering [0, length); the last tile is aligned to the far edge."""
+    if length <= tile:
+        return [0]
+    stride = max(1, tile - overlap)
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+def blend_window(tile=TILE_SIZE, overlap=TILE_OVERLAP):
+    """2D weight that ramps down towards tile borders so seams fade between tiles."""
+    ramp = np.ones(tile, dtype=np.float32)
+    if overlap > 0:
+        edge = np.linspace(1.0 / (overlap + 1), 1.0, overlap, dtype=np.float32)
+        ramp[:overlap] = edge
+        ramp[-overlap:] = edge[::-1]
+    return np.outer(ramp, ramp)
+
+def iter_windows(height, width, size=ANALYSIS_WINDOW):
+    for y0 in range(0, height, size):
+        for x0 in range(0, width, size):
+            yield y0, min(y0 + size, height), x0, min(x0 + size, width)
+
+
+class ProbabilityBlender:
+    """Disk-backed weighted-average accumulator for the global probability mask."""
+
+    def __init__(self, height, width, tile=TILE_SIZE, overlap=TILE_OVERLAP, work_dir=TILE_WORK_DIR):
+        self.height, self.width = height, width
+        self.weight = blend_window(tile, overlap)
+        self.dir = tempfile.mkdtemp(prefix="ortho_", dir=work_dir)
+        self.prob_sum = np.memmap(os.path.join(self.dir, "prob.f32"), dtype=np.float32, mode='w+', shape=(height, width))
+        self.weight_sum = np.memmap(os.path.join(self.dir, "weight.f32"), dtype=np.float32, mode='w+', shape=(height, width))
+
+    def add(self, y0, x0, prob_tile):
+        h = min(prob_tile.shape[0], self.height - y0)
+        w = min(prob_tile.shape[1], self.width - x0)
+        wt = self.weight[:h, :w]
+        self.prob_sum[y0:y0 + h, x0:x0 + w] += prob_tile[:h, :w] * wt
+        self.weight_sum[y0:y0 + h, x0:x0 + w] += wt
+
+    def read(self, y0, y1, x0, x1):
+        num = self.prob_sum[y0:y1, x0:x1]
+        den = self.weight_sum[y0:y1, x0:x1]
+        return np.divide(num, den, out=np.zeros(num.shape, dtype=np.float32), where=den > 0)
+
+    def preview(self, max_side=1024):
+        """Strided, downsampled view of the blended mask for display."""
+        step = max(1, int(np.ceil(max(self.height, self.width) / max_side)))
+        num = np.asarray(self.prob_sum[::step, ::step])
+        den = np.asarray(self.weight_sum[::step, ::step])
+        return np.divide(num, den, out=np.zeros(num.shape, dtype=np.float32), where=den > 0)
+
+    def close(self):
+        self.prob_sum = None
+        self.weight_sum = None
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def iter_tile_batches(reader, tile=TILE_SIZE, overlap=TILE_OVERLAP, batch_size=TILE_BATCH_SIZE):
+    """Yields lists of (y0, x0, rgb_tile); edge tiles are zero-padded to full tile size."""
+    batch = []
+    for y0 in tile_origins(reader.height, tile, overlap):
+        for x0 in tile_origins(reader.width, tile, overlap):
+            rgb = reader.read(y0, min(y0 + tile, reader.height), x0, min(x0 + tile, reader.width))
+            if rgb.shape[0] != tile or rgb.shape[1] != tile:
+                padded = np.zeros((tile, tile, 3), dtype=np.uint8)
+                padded[:rgb.shape[0], :rgb.shape[1]] = rgb
+                rgb = padded
+            batch.append((y0, x0, rgb))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,70 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+# --- Configuration ---
+INFER_WORKERS = int(os.getenv("INFER_WORKERS", "2"))
+# Max requests admitted (queued + running) before new ones get 503
+INFER_QUEUE_LIMIT = int(os.getenv("INFER_QUEUE_LIMIT", "64"))
+INFER_RETRY_AFTER = int(os.getenv("INFER_RETRY_AFTER", "5"))  # seconds
+
+
+class PoolSaturated(Exception):
+    """Raised when the admission queue is full; callers should answer 503."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Inference queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InferencePool:
+    """
+    Dedicated thread pool for blocking inference work (model, OpenCV, DB writes)
+    with a bounded admission counter in front of it, so the event loop never runs
+    heavy work and bursts are shed early instead of piling up.
+    """
+
+    def __init__(self, workers=INFER_WORKERS, queue_limit=INFER_QUEUE_LIMIT, retry_after=INFER_RETRY_AFTER, initializer=None):
+        self.workers = max(1, int(workers))
+        self.queue_limit = max(1, int(queue_limit))
+        self.retry_after = retry_after
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference", initializer=initializer)
+
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self.total_admitted = 0
+        self.total_rejected = 0
+
+    @contextmanager
+    def admit(self, n=1):
+        """Reserves `n` request slots for the duration of the block, or raises PoolSaturated."""
+        with self._lock:
+            if self._admitted + n > self.queue_limit:
+                self.total_rejected += 1
+                raise PoolSaturated(self.retry_after)
+            self._admitted += n
+            self.total_admitted += n
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._admitted -= n
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs a blocking callable on the pool and awaits its result (in the caller's context, e.g. its farm)."""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, ctx.run, partial(fn, *args, **kwargs))
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "admitted": self._admitted,
+            "total_admitted": self.total_admitted,
+            "total_rejected": self.total_rejected,
+        }
@@ -0,0 +1,127 @@
+"""
+Exports best_model.pth to optimized CPU inference artifacts and checks parity.
+
+    python export_model.py                                  # TorchScript + ONNX (fp32)
+    python export_model.py --quantize dynamic static --calib-dir ./frames
+    INFER_BACKEND=onnx INFER_QUANT=static uvicorn main:app  # serve the result
+
+Every artifact is compared against the eager PyTorch model: mask IoU at the
+0.5 threshold and mean latency are printed and written to export_report.json.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+
+# Add current directory to path so we can import 'core'
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core import model_backends as mb
+from core import preprocess
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODEL_PATH = os.getenv("MODEL_PATH", os.path.join(BASE_DIR, "data", "best_model.pth"))
+IMG_SIZE = 512
+
+def to_input(image_bgr):
+    """Same preprocessing as the API: RGB + zero alpha, ImageNet stats, NCHW float32."""
+    return preprocess.normalize_batch([preprocess.resize_rgb(image_bgr, IMG_SIZE)]).copy()
+
+def synthetic_frame(seed):
+    """Plantation-like frame (soil background, green crowns) for when no real frames are given."""
+    rng = np.random.default_rng(seed)
+    img = np.full((IMG_SIZE, IMG_SIZE, 3), (60, 110, 150), np.uint8)
+    for _ in range(40):
+        x, y, r = rng.integers(0, IMG_SIZE, 2).tolist() + [int(rng.integers(8, 25))]
+        color = (int(rng.integers(20, 80)), int(rng.integers(120, 200)), int(rng.integers(20, 80)))
+        cv2.circle(img, (x, y), r, color, -1)
+    return img
+
+def load_frames(calib_dir, n):
+    frames = []
+    if calib_dir:
+        for path in sorted(glob.glob(os.path.join(calib_dir, "*")))[:n]:
+            img = cv2.imread(path, cv2.IMREAD_COLOR)
+            if img is not None:
+                frames.append(to_input(img))
+    while len(frames) < n:
+        frames.append(to_input(synthetic_frame(len(frames))))
+    return frames
+
+def predict_masks(model, frames):
+    masks, seconds = [], 0.0
+    with torch.no_grad():
+        for x in frames:
+            t0 = time.perf_counter()
+            logits = model(torch.from_numpy(x))
+            seconds += time.perf_counter() - t0
+            masks.append(logits.sigmoid()[0, 0].cpu().numpy() > 0.5)
+    return masks, seconds / max(1, len(frames)) * 1000.0
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the palm U-Net to TorchScript / ONNX (+ INT8).")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Path to best_model.pth")
+    parser.add_argument("--backends", nargs="+", default=["torchscript", "onnx"], choices=["torchscript", "onnx"])
+    parser.add_argument("--quantize", nargs="*", default=[], choices=["dynamic", "static"],
+                        help="INT8 variants to build (applied to the ONNX artifact)")
+    parser.add_argument("--calib-dir", default=None, help="Folder of representative frames for calibration/parity")
+    parser.add_argument("--calib-images", type=int, default=32, help="Frames used for static calibration")
+    parser.add_argument("--parity-images", type=int, default=8, help="Frames used for the IoU parity check")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"Model file not found at {args.model}")
+        sys.exit(1)
+
+    torch.set_grad_enabled(False)
+    eager = mb.load_eager(args.model)
+    artifacts = []
+
+    if "torchscript" in args.backends:
+        path = mb.export_torchscript(eager, mb.artifact_path(args.model, "torchscript"), IMG_SIZE)
+        artifacts.append(("torchscript", "none", path))
+        print(f"TorchScript -> {path}")
+
+    if "onnx" in args.backends or args.quantize:
+        fp32 = mb.export_onnx(eager, mb.artifact_path(args.model, "onnx"), IMG_SIZE)
+        artifacts.append(("onnx", "none", fp32))
+        print(f"ONNX -> {fp32}")
+        for mode in args.quantize:
+            calib = load_frames(args.calib_dir, args.calib_images) if mode == "static" else None
+            path = mb.quantize_onnx(fp32, mb.artifact_path(args.model, "onnx", mode), mode, calib)
+            artifacts.append(("onnx", mode, path))
+            print(f"ONNX INT8 ({mode}) -> {path}")
+
+    # --- Parity Check ---
+    frames = load_frames(args.calib_dir, args.parity_images)
+    ref_masks, ref_ms = predict_masks(eager, frames)
+    report = {"model": args.model, "frames": len(frames), "eager_ms": round(ref_ms, 2), "artifacts": []}
+
+    print(f"\n{'backend':<12}{'quant':<9}{'IoU mean':>10}{'IoU min':>10}{'ms/frame':>10}{'speedup':>9}")
+    print(f"{'eager':<12}{'none':<9}{1.0:>10.4f}{1.0:>10.4f}{ref_ms:>10.1f}{1.0:>8.2f}x")
+    for backend, quant, path in artifacts:
+        model = mb.load_backend(args.model, backend, quant)
+        masks, ms = predict_masks(model, frames)
+        ious = [mb.mask_iou(a, b) for a, b in zip(ref_masks, masks)]
+        entry = {
+            "backend": backend, "quantization": quant, "path": path,
+            "size_mb": round(os.path.getsize(path) / 1e6, 2),
+            "iou_mean": round(float(np.mean(ious)), 4), "iou_min": round(float(np.min(ious)), 4),
+            "ms_per_frame": round(ms, 2), "speedup": round(ref_ms / ms, 2) if ms else None,
+        }
+        report["artifacts"].append(entry)
+        print(f"{backend:<12}{quant:<9}{entry['iou_mean']:>10.4f}{entry['iou_min']:>10.4f}{ms:>10.1f}{entry['speedup']:>8.2f}x")
+
+    report_path = os.path.join(os.path.dirname(os.path.abspath(args.model)), "export_report.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport -> {report_path}")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,28 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from api import inference, drone, analytics, export, vra, audit
+from api import inference, drone, analytics, export, vra, audit, ingest, farms
+from core import async_db, db, notifications, palm_trends, retention
+
+@asynccontextmanager
+async def lifespan(app):
+    # Deliver alerts left in the outbox by a previous run
+    notifications.outbox.start()
+    async_db.writer.start()
+    # Compacts palm_history beyond the retention window in the background (only when HISTORY_RETENTION_DAYS > 0)
+    retention.worker.start()
+    yield
+    retention.worker.stop()
+    # Drain every farm's queued scan writes before the pools go away
+    async_db.stop_all()
+    notifications.outbox.stop()
+    db.close_all_pools()
 
 app = FastAPI(
     title="Smart Farm Enterprise API",
     description="High-performance backend for Agriculture 4.0 Command Center",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # --- CORS Configuration ---
@@ -20,13 +37,18 @@ app.add_middleware(
 )
 
 # --- Routes ---
-app.include_router(inference.router, prefix="/api/v1/inference", tags=["Inference"])
+# Farm-scoped routers: ?farm_id= / X-Farm-Id picks the shard (default farm otherwise)
+farm_scoped = [Depends(farms.farm_scope)]
+
+app.include_router(farms.router, prefix="/api/v1/farms", tags=["Farms"])
+app.include_router(inference.router, prefix="/api/v1/inference", tags=["Inference"], dependencies=farm_scoped)
+app.include_router(ingest.router, prefix="/api/v1/ingest", tags=["Ingest"], dependencies=farm_scoped)
 app.include_router(drone.router, prefix="/api/v1/drone", tags=["Drone Operations"])
-app.include_router(analytics.router, prefix="/api/v1/analytics", tags=["Analytics"])
-app.include_router(export.router, prefix="/api/v1/export", tags=["Mission Export"])
+app.include_router(analytics.router, prefix="/api/v1/analytics", tags=["Analytics"], dependencies=farm_scoped)
+app.include_router(export.router, prefix="/api/v1/export", tags=["Mission Export"], dependencies=farm_scoped)
 
-app.include_router(vra.router, prefix="/api/v1/vra", tags=["Precision Ag"])
-app.include_router(audit.router, prefix="/api/v1/audit", tags=["Compliance"])
+app.include_router(vra.router, prefix="/api/v1/vra", tags=["Precision Ag"], dependencies=farm_scoped)
+app.include_router(audit.router, prefix="/api/v1/audit", tags=["Compliance"], dependencies=farm_scoped)
 
 @app.get("/")
 def read_root():
@@ -38,10 +60,25 @@ def health_check():
 
 @app.get("/debug/notification")
 def debug_notification():
-    from core import notifications
     success, msg = notifications.send_telegram_alert("🔔 Debug Test Message from Backend Server")
     return {"status": "sent" if success else "failed", "backend_message": msg}
 
+@app.get("/debug/notification/outbox")
+def debug_notification_outbox():
+    return notifications.outbox.stats()
+
+@app.get("/debug/db/pool")
+def debug_db_pool():
+    return db.pool_stats()
+
+@app.get("/debug/db/cache")
+def debug_db_cache():
+    return {"latest_palms": db.latest_palms_cache_stats(), "palm_trends": palm_trends.cache_stats()}
+
+@app.get("/debug/db/writer")
+def debug_db_writer():
+    return async_db.stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,110 @@
+"""
+Maintenance commands for the farm database (DB_PATH).
+
+    python manage_db.py migrate                         # apply pending schema migrations
+    python manage_db.py migrate --target 3              # roll forward / back to a version
+    python manage_db.py migrate --target 3 --force      # ... even if that drops tables holding data
+    python manage_db.py backfill-aggregates             # survey_aggregates for surveys that lack one
+    python manage_db.py backfill-aggregates --rebuild   # recompute every survey
+    python manage_db.py backfill-snapshots              # Parquet snapshots for surveys that lack one
+    python manage_db.py compact-history --limit 100     # archive + summarize surveys past retention
+    python manage_db.py restore-survey 42               # bring an archived survey's history back
+    python manage_db.py rebuild-forecast                # recompute the forecast running sums from surveys
+    python manage_db.py create-farm east-estate         # new farm shard (FARMS_DIR/east-estate.db)
+    python manage_db.py --farm east-estate migrate      # any command against one farm's shard
+"""
+import argparse
+import os
+import sys
+
+# Add current directory to path so we can import 'core'
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core import async_db, db, retention, snapshots
+
+def cmd_migrate(args):
+    try:
+        touched = db.migrate(args.target, force=args.force)
+    except ValueError as e:
+        sys.exit(str(e))
+    with db.connection() as conn:
+        version = db.schema_version(conn.cursor())
+    print(f"Schema at version {version}" + ("" if touched else " (nothing to do)"))
+
+def cmd_backfill_aggregates(args):
+    count = db.backfill_survey_aggregates(rebuild=args.rebuild)
+    print(f"Wrote survey_aggregates for {count} surveys")
+
+def cmd_backfill_snapshots(args):
+    if not snapshots.SNAPSHOTS_ENABLED:
+        print("Snapshots are disabled (SNAPSHOTS_ENABLED=0 or pyarrow not installed)")
+        return
+    count = db.backfill_survey_snapshots()
+    print(f"Wrote {count} survey snapshots to {snapshots.SNAPSHOT_DIR}")
+
+def cmd_compact_history(args):
+    report = retention.run_once(limit=args.limit)
+    async_db.stop_all()
+    print(f"Compacted {len(report['surveys'])} surveys: {report['rows_removed']} rows removed, "
+          f"{report['reclaimed_bytes'] / 1e6:.1f} MB freed in the DB, {report['archive_bytes'] / 1e6:.1f} MB archived")
+
+def cmd_restore_survey(args):
+    restored = retention.restore_survey(args.survey_id)
+    async_db.stop_all()
+    if restored is None:
+        print(f"Survey {args.survey_id} is not archived")
+    else:
+        print(f"Restored {restored} palm_history rows of survey {args.survey_id}")
+
+def cmd_rebuild_forecast(args):
+    count = db.rebuild_forecast_state()
+    print(f"Forecast state rebuilt from {count} surveys")
+
+def cmd_create_farm(args):
+    existed = db.farm_exists(args.new_farm_id)
+    db.create_farm(args.new_farm_id)
+    print(f"Farm '{args.new_farm_id}' " + ("already exists" if existed else f"created at {db.farm_db_path(args.new_farm_id)}"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Farm database maintenance.")
+    parser.add_argument("--farm", default=db.DEFAULT_FARM, help=f"Farm shard to operate on (default: {db.DEFAULT_FARM})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("migrate", help="Apply schema migrations")
+    p.add_argument("--target", type=int, default=None, help="Schema version to move to (default: latest)")
+    p.add_argument("--force", action="store_true",
+                   help="When rolling back, also drop tables that hold data (sectors, compacted history). "
+                        "Without it such a rollback is refused; derived tables (survey_aggregates, forecast_state) "
+                        "are always dropped. Note the app re-applies every migration when it starts")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("backfill-aggregates", help="Compute survey_aggregates from palm_history")
+    p.add_argument("--rebuild", action="store_true", help="Recompute surveys that already have a row")
+    p.set_defaults(func=cmd_backfill_aggregates)
+
+    p = sub.add_parser("backfill-snapshots", help="Write Parquet snapshots of saved surveys")
+    p.set_defaults(func=cmd_backfill_snapshots)
+
+    p = sub.add_parser("compact-history", help="Archive and summarize palm_history beyond HISTORY_RETENTION_DAYS")
+    p.add_argument("--limit", type=int, default=retention.RETENTION_SURVEYS_PER_RUN, help="Max surveys to compact")
+    p.set_defaults(func=cmd_compact_history)
+
+    p = sub.add_parser("restore-survey", help="Restore an archived survey's palm_history")
+    p.add_argument("survey_id", type=int)
+    p.set_defaults(func=cmd_restore_survey)
+
+    p = sub.add_parser("rebuild-forecast", help="Recompute the incremental forecast state")
+    p.set_defaults(func=cmd_rebuild_forecast)
+
+    p = sub.add_parser("create-farm", help="Create a farm shard")
+    p.add_argument("new_farm_id")
+    p.set_defaults(func=cmd_create_farm)
+
+    args = parser.parse_args()
+    if not db.farm_exists(args.farm):
+        parser.error(f"unknown farm '{args.farm}' (known: {', '.join(db.list_farms())})")
+    with db.use_farm(args.farm):
+        args.func(args)
+
+if __name__ == "__main__":
+    main()